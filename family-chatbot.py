@@ -1,4 +1,39 @@
 from pyswip import Prolog
+import atexit
+import time
+
+# One Prolog engine is kept for the whole session. knowledge_base.pl is
+# consulted once at startup; new facts are asserted straight into the engine
+# and the file is only a mirror of them, written in batches.
+KNOWLEDGE_BASE = "knowledge_base.pl"
+FLUSH_EVERY = 50        # write the mirror after this many new facts...
+FLUSH_INTERVAL = 5.0    # ...or when this many seconds have passed
+
+prolog = None
+pending_facts = []
+last_flush = time.time()
+
+def get_prolog():
+    global prolog
+    if prolog is None:
+        prolog = Prolog()
+        prolog.consult(KNOWLEDGE_BASE)
+    return prolog
+
+def flush_facts():
+    # Append every fact asserted since the last flush to the mirror file
+    global last_flush
+    if pending_facts:
+        with open(KNOWLEDGE_BASE, "a") as f:
+            f.write("".join(pending_facts))
+        pending_facts.clear()
+    last_flush = time.time()
+
+def flush_facts_if_due():
+    if len(pending_facts) >= FLUSH_EVERY or time.time() - last_flush >= FLUSH_INTERVAL:
+        flush_facts()
+
+atexit.register(flush_facts)
 
 def parse_input(user_input):
     # TODO: error checking
@@ -60,26 +95,30 @@ def parse_input(user_input):
         else:
             return ["siblings", name1, name2]
 
-def process_facts(keywords):
-    # TODO check for contradictions (2 parents only, 4 grandparents only)
-    fact = ""
+def fact_terms(keywords):
     match keywords[0]:
         case "siblings":
-            fact = f"sibling('{keywords[1]}', '{keywords[2]}').\n"
+            return [f"sibling('{keywords[1]}', '{keywords[2]}')"]
         case "parents":
-            fact = f"parent('{keywords[1]}', '{keywords[3]}').\nparent('{keywords[2]}', '{keywords[3]}').\n"
+            return [f"parent('{keywords[1]}', '{keywords[3]}')", f"parent('{keywords[2]}', '{keywords[3]}')"]
         case "children":
-            for i in range(3, keywords[1] + 3):
-                fact += f"child('{keywords[i]}', '{keywords[2]}').\n"
+            return [f"child('{keywords[i]}', '{keywords[2]}')" for i in range(3, keywords[1] + 3)]
         case _:
-            fact = f"{keywords[0]}('{keywords[1]}', '{keywords[2]}').\n"
-    
-    with open("knowledge_base.pl", "a") as f:
-        f.write(fact)
+            return [f"{keywords[0]}('{keywords[1]}', '{keywords[2]}')"]
+
+def process_facts(keywords):
+    # TODO check for contradictions (2 parents only, 4 grandparents only)
+    prolog = get_prolog()
+    for fact in fact_terms(keywords):
+        # Only stated facts are compared, so a fact that a rule already
+        # derives is still recorded
+        if not list(prolog.query(f"clause({fact}, true)", maxresult=1)):
+            prolog.assertz(fact)
+            pending_facts.append(fact + ".\n")
+    flush_facts_if_due()
 
 def process_questions(keywords):
-    prolog = Prolog()
-    prolog.consult("knowledge_base.pl")
+    prolog = get_prolog()
 
     query = ""
     
@@ -133,7 +172,11 @@ def encode_rules():
     # some cause problems because the right sides (sis, bro, etc)
         # were never declared sa left side
 
-    rules = r"""sibling(Z, Y) :- parent(X, Y), child(Z, X).
+    # Every predicate is dynamic so facts can be asserted at run time and
+    # questions about a relation with no facts yet simply fail
+    rules = r""":- dynamic sibling/2, parent/2, child/2, relative/2, mother/2, father/2,
+    daughter/2, son/2, sister/2, brother/2, grandmother/2, grandfather/2, aunt/2, uncle/2.
+sibling(Z, Y) :- parent(X, Y), child(Z, X).
 parent(X, Y) :- child(Y, X).
 relative(X, Y) :- sibling(X, Y).
 relative(X, Y) :- parent(X, Y).
@@ -162,7 +205,7 @@ child(X, Y) :- daughter(X, Y).
 child(X, Y) :- son(X, Y).
 """
 
-    with open("knowledge_base.pl", "w") as f:
+    with open(KNOWLEDGE_BASE, "w") as f:
             f.write(rules)
 
 def main():
@@ -174,6 +217,7 @@ def main():
         # -----------------------------------------
 
         keywords = parse_input(user_input)
+        flush_facts_if_due()
 
 
         if(keywords[0] == "Q" or keywords[0] == "Who"):
@@ -0,0 +1,56 @@
+# bench_query.py
+# Compares string goals (formatted, parsed and compiled by Prolog on every
+# call) with prepared goals (term arguments bound directly) on parent/2
+# lookups. Run from the directory that contains family.pl:
+#   python bench_query.py --lookups 100000
+import argparse
+import time
+
+from chatbot import get_prolog, prolog_query, assert_once, person_id
+
+def build_family(size):
+    """Assert a simple chain of parent facts and return the people in it"""
+    people = [person_id(f"person{i}") for i in range(size)]
+    for parent, child in zip(people, people[1:]):
+        assert_once("parent", parent, child)
+    return people
+
+def time_string_goals(people, lookups):
+    """Look up parents by formatting a goal string for every call"""
+    engine = get_prolog()
+    start = time.perf_counter()
+    for i in range(lookups):
+        person = people[i % len(people)]
+        list(engine.query(f"parent(P, {person})"))
+    return time.perf_counter() - start
+
+def time_prepared_goals(people, lookups):
+    """Look up parents through the prepared query layer"""
+    start = time.perf_counter()
+    for i in range(lookups):
+        person = people[i % len(people)]
+        prolog_query("parent", None, person)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark string vs prepared Prolog goals")
+    parser.add_argument("--lookups", type=int, default=100000, help="number of parent(P, X) lookups")
+    parser.add_argument("--people", type=int, default=1000, help="number of people in the test family")
+    args = parser.parse_args()
+
+    people = build_family(args.people)
+
+    # Warm up both paths so predicate lookup and first-call costs are excluded
+    time_string_goals(people, 100)
+    time_prepared_goals(people, 100)
+
+    string_time = time_string_goals(people, args.lookups)
+    prepared_time = time_prepared_goals(people, args.lookups)
+
+    print(f"{args.lookups} parent(P, X) lookups over {args.people} people")
+    print(f"  string goals:   {string_time:.3f}s ({args.lookups / string_time:,.0f} lookups/s)")
+    print(f"  prepared goals: {prepared_time:.3f}s ({args.lookups / prepared_time:,.0f} lookups/s)")
+    print(f"  speedup:        {string_time / prepared_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
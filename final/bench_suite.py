@@ -0,0 +1,202 @@
+# bench_suite.py
+# End-to-end benchmark: generates a synthetic family tree, feeds it to the
+# chatbot as English statements and then runs representative question
+# workloads. Results are printed (or written) as JSON so runs from different
+# releases can be compared. Run from the directory that contains family.pl:
+#   python bench_suite.py --size 300 --output bench.json
+# To pick a materialization policy (see chatbot.MATERIALIZATION), run it once
+# per policy and compare ingest (write-heavy), derived_queries (read-heavy)
+# and mixed (a statement before every question):
+#   python bench_suite.py --materialize all=eager
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+
+import chatbot
+
+def synthetic_name(index):
+    """Return a unique, letters-only name for a person index"""
+    letters = []
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters.append(string.ascii_lowercase[remainder])
+    # The "Zq" prefix keeps generated names clear of reserved words
+    return "Zq" + "".join(reversed(letters))
+
+def generate_family(size, depth, branching, marriage_rate, deferred_ratio, seed):
+    """Build a synthetic family tree and the statements that describe it
+
+    Founding couples start generation 0. Each couple has on average
+    `branching` children; each child marries someone from outside the tree
+    with probability `marriage_rate` and starts a couple of the next
+    generation. For a `deferred_ratio` share of families the children are
+    first declared siblings and only one of them gets parents explicitly,
+    so the rest have to be inferred through the sibling groups.
+    """
+    rng = random.Random(seed)
+    people = []
+    genders = {}
+    parents = {}
+    statements = []
+
+    def new_person(gender):
+        name = synthetic_name(len(people))
+        people.append(name)
+        genders[name] = gender
+        return name
+
+    couples = []
+    while len(people) + 2 <= size and len(couples) < max(1, size // 20):
+        couples.append((new_person("male"), new_person("female")))
+
+    for generation in range(depth):
+        next_couples = []
+        for father, mother in couples:
+            statements.append(f"{father} is married to {mother}")
+            children = []
+            for _ in range(rng.randint(0, 2 * branching)):
+                if len(people) >= size:
+                    break
+                child = new_person(rng.choice(["male", "female"]))
+                parents[child] = (father, mother)
+                children.append(child)
+
+            if len(children) >= 2 and rng.random() < deferred_ratio:
+                for child in children[1:]:
+                    statements.append(f"{children[0]} and {child} are siblings")
+                statements.append(f"{father} is the father of {children[0]}")
+                statements.append(f"{mother} is the mother of {children[0]}")
+            else:
+                for child in children:
+                    statements.append(f"{father} is the father of {child}")
+                    statements.append(f"{mother} is the mother of {child}")
+
+            for child in children:
+                if len(people) < size and rng.random() < marriage_rate:
+                    spouse = new_person("female" if genders[child] == "male" else "male")
+                    couple = (child, spouse) if genders[child] == "male" else (spouse, child)
+                    next_couples.append(couple)
+        if not next_couples:
+            break
+        couples = next_couples
+
+    return {"people": people, "genders": genders, "parents": parents, "statements": statements}
+
+def percentile(sorted_values, fraction):
+    """Return the value at a fraction (0-1) of a sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_workload(operations, handler):
+    """Time each operation and summarize throughput and latency percentiles"""
+    latencies = []
+    start = time.perf_counter()
+    for operation in operations:
+        began = time.perf_counter()
+        handler(operation)
+        latencies.append(time.perf_counter() - began)
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "operations": len(operations),
+        "seconds": round(total, 6),
+        "throughput_per_s": round(len(operations) / total, 2) if total else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 4),
+            "p90": round(percentile(latencies, 0.90) * 1000, 4),
+            "p99": round(percentile(latencies, 0.99) * 1000, 4),
+            "max": round(percentile(latencies, 1.0) * 1000, 4),
+        },
+    }
+
+def build_workloads(family, queries, seed):
+    """Pick the questions and direct calls each workload will run"""
+    rng = random.Random(seed + 1)
+    people = family["people"]
+    children = list(family["parents"])
+    sample = lambda pool: [rng.choice(pool) for _ in range(queries)] if pool else []
+
+    relations = ["children", "parents", "siblings", "cousins", "grandchildren", "uncles", "aunts"]
+    derived = ["grandchildren", "uncles", "aunts"]
+    newcomers = [synthetic_name(len(people) + i) for i in range(queries)]
+    return {
+        "list_queries": [f"Who are the {rng.choice(relations)} of {person}?" for person in sample(people)],
+        "yes_no_queries": [f"Is {family['parents'][child][0]} the father of {child}?" for child in sample(children)],
+        "relative_checks": [f"Are {a} and {b} relatives?" for a, b in zip(sample(people), sample(people))],
+        "count_queries": [f"How many {rng.choice(['cousins', 'children', 'siblings'])} does {person} have?"
+                          for person in sample(people)],
+        "sibling_contradiction_checks": [(chatbot.person_id(a), chatbot.person_id(b))
+                                         for a, b in zip(sample(people), sample(people)) if a != b],
+        "derived_queries": [f"Who are the {rng.choice(derived)} of {person}?" for person in sample(people)],
+        "mixed": [(f"{newcomer} is the child of {parent}", f"Who are the {rng.choice(derived)} of {person}?")
+                  for newcomer, parent, person in zip(newcomers, sample(children), sample(people))],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the family chatbot on a synthetic family tree")
+    parser.add_argument("--size", type=int, default=200, help="number of people in the tree")
+    parser.add_argument("--depth", type=int, default=5, help="maximum number of generations")
+    parser.add_argument("--branching", type=int, default=2, help="average children per couple")
+    parser.add_argument("--marriage-rate", type=float, default=0.7, help="chance that a child marries")
+    parser.add_argument("--deferred-ratio", type=float, default=0.3,
+                        help="share of families whose siblings are stated before their parents")
+    parser.add_argument("--queries", type=int, default=200, help="operations per query workload")
+    parser.add_argument("--inference-runs", type=int, default=5, help="direct full inference passes to time")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--backend", choices=chatbot.BACKENDS, default=chatbot.backend,
+                        help="fact storage to benchmark")
+    parser.add_argument("--materialize", metavar="SPEC", default="",
+                        help='materialization policies, e.g. "all=lazy" or "grandparent=eager,uncle=virtual"')
+    args = parser.parse_args()
+    chatbot.select_backend(args.backend)
+    for relation, policy in chatbot.parse_materialization(args.materialize).items():
+        chatbot.set_materialization(relation, policy)
+
+    family = generate_family(args.size, args.depth, args.branching, args.marriage_rate,
+                             args.deferred_ratio, args.seed)
+
+    results = {}
+    results["ingest"] = run_workload(family["statements"], chatbot.parse_statement)
+
+    workloads = build_workloads(family, args.queries, args.seed)
+    for name in ["list_queries", "yes_no_queries", "relative_checks", "count_queries", "derived_queries"]:
+        results[name] = run_workload(workloads[name], chatbot.parse_question)
+    results["sibling_contradiction_checks"] = run_workload(
+        workloads["sibling_contradiction_checks"], lambda pair: chatbot.violates("sibling", *pair))
+    results["mixed"] = run_workload(
+        workloads["mixed"], lambda pair: (chatbot.parse_statement(pair[0]), chatbot.parse_question(pair[1])))
+    results["full_family_inference"] = run_workload(
+        range(args.inference_runs), lambda _: chatbot.trigger_full_family_inference())
+
+    report = {
+        "config": vars(args),
+        "materialization": dict(chatbot.MATERIALIZATION),
+        "people": len(family["people"]),
+        "statements": len(family["statements"]),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workloads": results,
+    }
+    if chatbot.store is not None and args.backend == "columnar":
+        chatbot.store.compact()
+        report["store_bytes"] = chatbot.store.nbytes()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,733 @@
-from pyswip import Prolog
 import re
-from pyswip.prolog import PrologError
+import os
+import time
+import hashlib
+import argparse
+import threading
+from contextlib import closing, contextmanager
+from itertools import islice
+from debug_log import logger
+import query_stats
+from profiling import Profiler
+from columnar import DERIVED_TABLES, MATERIALIZABLE, ColumnarStore, UnknownPredicate
+from snapshot import ReadOnlyKB, Replica, Snapshot, write_snapshot
+import constraints
+
+# === Engine Startup ===
+# Importing pyswip boots SWI-Prolog, so nothing from it is imported here.
+# The engine is started on first use by get_prolog(), which binds the pyswip
+# names below and consults family.pl. Front ends call start_engine_warmup()
+# first so the boot happens in the background while the window or prompt
+# comes up; a query that arrives earlier just waits for it to finish.
+# The rules file is loaded through load_compiled(), which keeps a compiled
+# .qlf copy next to the source and only recompiles it when the source (or the
+# SWI version) changes. It is for rules only: facts name people by interned
+# ID and are mirrored in the chatbot's own structures, such as the sibling
+# groups, which loading a fact file would bypass.
+prolog = None
+engine_lock = threading.Lock()
+
+class PrologError(Exception):
+    """Stands in for pyswip's PrologError until the engine is started"""
+
+def get_prolog():
+    """Return the Prolog engine, starting it (or waiting for warm-up) if needed"""
+    global prolog, Prolog, PrologError, getTerm, putTerm, Atom, Functor
+    global PL_predicate, PL_new_term_refs, PL_cons_functor_v, PL_open_foreign_frame
+    global PL_discard_foreign_frame, PL_open_query, PL_next_solution, PL_cut_query
+    global PL_exception, PL_Q_NODEBUG, PL_Q_CATCH_EXCEPTION, PL_new_term_ref, PL_put_nil, PL_cons_list
+    with engine_lock:
+        if prolog is None:
+            start = time.perf_counter()
+            from pyswip import Prolog
+            from pyswip.prolog import PrologError
+            from pyswip.easy import getTerm, putTerm, Atom, Functor
+            from pyswip.core import (PL_predicate, PL_new_term_refs, PL_cons_functor_v,
+                                     PL_open_foreign_frame, PL_discard_foreign_frame, PL_open_query,
+                                     PL_next_solution, PL_cut_query, PL_exception,
+                                     PL_Q_NODEBUG, PL_Q_CATCH_EXCEPTION,
+                                     PL_new_term_ref, PL_put_nil, PL_cons_list)
+            engine = Prolog()
+            load_compiled("family.pl", engine)
+            prolog = engine
+            logger.debug("Prolog engine ready in %.1f ms", (time.perf_counter() - start) * 1000)
+    return prolog
+
+def prolog_path(path):
+    """Quote a file path as a Prolog atom"""
+    return "'" + path.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def source_digest(path, version):
+    """Hash a source file together with the SWI version that compiles it"""
+    digest = hashlib.sha256(str(version).encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_compiled(path, engine=None):
+    """Load a Prolog rules file from its cached .qlf, recompiling it if the source changed
+
+    Returns "cached", "compiled" or "consulted" (when no .qlf could be written).
+    Not for fact files: see the Engine Startup notes.
+    """
+    engine = engine or get_prolog()
+    version = list(engine.query("current_prolog_flag(version, V)"))[0]["V"]
+    digest = source_digest(path, version)
+    base = os.path.splitext(path)[0]
+    qlf, stamp = base + ".qlf", base + ".qlf.sha256"
 
-prolog = Prolog()
-prolog.consult("family.pl")
+    try:
+        with open(stamp) as f:
+            cached = f.read().strip()
+    except OSError:
+        cached = None
+
+    if cached == digest and os.path.exists(qlf):
+        try:
+            list(engine.query(f"load_files({prolog_path(qlf)}, [])"))
+            return "cached"
+        except PrologError as e:
+            logger.warning("Could not load %s, recompiling: %s", qlf, e)
+
+    try:
+        # qcompile/1 loads the source and writes the .qlf in one pass
+        list(engine.query(f"qcompile({prolog_path(path)})"))
+    except PrologError as e:
+        # Consulting a file again replaces its clauses, so this is safe even
+        # if qcompile got as far as loading it
+        logger.warning("Could not compile %s, consulting the source: %s", path, e)
+        engine.consult(path)
+        return "consulted"
+
+    try:
+        with open(stamp, "w") as f:
+            f.write(digest)
+    except OSError as e:
+        logger.warning("Could not record the hash of %s: %s", path, e)
+    return "compiled"
+
+def start_engine_warmup():
+    """Start the Prolog engine on a background thread (not needed by the columnar backend)"""
+    if backend != "prolog":
+        return None
+    def warm_up():
+        try:
+            get_prolog()
+        except Exception as e:
+            # The first query retries the boot and reports the error itself
+            logger.warning("Prolog engine warm-up failed: %s", e)
+    thread = threading.Thread(target=warm_up, name="prolog-warmup", daemon=True)
+    thread.start()
+    return thread
+
+# === Person Interning ===
+# Every name is mapped to a dense integer ID the first time it is seen, so
+# facts are stored as parent(Int, Int) and Prolog never has to look up or
+# compare name atoms. IDs are turned back into names only when answering.
+# With a KB snapshot, the names it stores keep their IDs and are looked up in
+# the snapshot; names interned here are numbered after them.
+person_ids = {}
+person_names = []
+person_base = 0
+
+def person_id(name):
+    """Return the integer ID of a name, interning it on first sight"""
+    name = name.lower()
+    pid = person_ids.get(name)
+    if pid is None and person_base:
+        pid = store.find(name)
+    if pid is None:
+        pid = person_base + len(person_names)
+        person_ids[name] = pid
+        person_names.append(name)
+        journal_entry("name", pid, name)
+    return pid
+
+def interned_name(pid):
+    """Return the lowercase name of an integer ID"""
+    if pid < person_base:
+        return store.name(pid)
+    return person_names[pid - person_base]
+
+def person_name(pid):
+    """Return the capitalized display name for an integer ID"""
+    return interned_name(pid).capitalize()
+
+def person_count():
+    """Return the number of interned people"""
+    return person_base + len(person_names)
+
+def forget_people(count):
+    """Forget the names interned after the first count IDs; they must have no facts"""
+    for name in person_names[count - person_base:]:
+        del person_ids[name]
+    del person_names[count - person_base:]
+
+def format_names(ids):
+    """Format a collection of person IDs as a sorted answer list"""
+    names = sorted({interned_name(pid) for pid in ids})
+    if names:
+        return ", ".join(name.capitalize() for name in names)
+    return "No one found."
+
+# === Resource Limits ===
+# Questions can run under a deadline, an inference budget and a depth limit,
+# so one pathological question gives up instead of stalling its caller.
+# Prolog goals are wrapped in call_with_inference_limit/3, which bounds the
+# work spent finding each solution, and call_with_depth_limit/3, which bounds
+# recursion and so the stacks; running out of stack anyway counts as a limit
+# too. The deadline is checked between solutions (call_with_time_limit/2 would
+# turn every goal into once/1). Only the deadline applies to the columnar
+# backend. Setting the `cancelled` event stops the queries at the next
+# solution. Nested limits only ever tighten the ones around them.
+#
+# Each question handler runs under its own entry of HANDLER_LIMITS, and
+# every limit hit is counted in query_stats.limit_hits.
+class QueryLimitExceeded(Exception):
+    """Raised when a goal runs past its deadline or a resource limit"""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+query_limits = threading.local()
+TOO_EXPENSIVE = "Sorry, that question is too expensive to answer. Try asking about someone more specific."
+
+# seconds is for the whole question, inferences for each solution of a goal
+HANDLER_LIMITS = {
+    "default": {"seconds": 5.0, "inferences": 2_000_000, "depth": 10_000},
+    # relative/2 joins every relation in both directions
+    "handle_relative_question": {"seconds": 2.0, "inferences": 500_000, "depth": 2_000},
+    "handle_count_question": {"seconds": 3.0, "inferences": 1_000_000, "depth": 5_000},
+}
+
+def tightest(*limits):
+    present = [limit for limit in limits if limit is not None]
+    return min(present) if present else None
+
+@contextmanager
+def resource_limits(seconds=None, inferences=None, cancelled=None, depth=None, handler=None):
+    """Run this thread's queries in the block under a deadline and resource limits"""
+    previous = vars(query_limits).copy()
+    deadline = time.perf_counter() + seconds if seconds is not None else None
+    query_limits.deadline = tightest(deadline, previous.get("deadline"))
+    query_limits.inferences = tightest(inferences, previous.get("inferences"))
+    query_limits.depth = tightest(depth, previous.get("depth"))
+    query_limits.cancelled = cancelled or previous.get("cancelled")
+    query_limits.handler = handler or previous.get("handler")
+    try:
+        yield
+    finally:
+        vars(query_limits).clear()
+        vars(query_limits).update(previous)
+
+@contextmanager
+def suspended_limits():
+    """Run the block without any of this thread's limits"""
+    previous = vars(query_limits).copy()
+    vars(query_limits).clear()
+    try:
+        yield
+    finally:
+        vars(query_limits).update(previous)
+
+def handler_limits(handler):
+    """Run a handler under its HANDLER_LIMITS entry"""
+    return resource_limits(handler=handler, **HANDLER_LIMITS.get(handler, HANDLER_LIMITS["default"]))
+
+def limit_exceeded(kind, pred, args, reason):
+    """Count a limit hit and return the exception to raise"""
+    handler = getattr(query_limits, "handler", None) or "other"
+    query_stats.record_limit_hit(handler, kind)
+    return QueryLimitExceeded(kind, f"'{goal_text(pred, args)}' {reason}")
+
+def check_limits(pred, args):
+    """Raise QueryLimitExceeded once the current deadline has passed"""
+    cancelled = getattr(query_limits, "cancelled", None)
+    if cancelled is not None and cancelled.is_set():
+        raise limit_exceeded("cancelled", pred, args, "was cancelled")
+    deadline = getattr(query_limits, "deadline", None)
+    if deadline is not None and time.perf_counter() > deadline:
+        raise limit_exceeded("deadline", pred, args, "ran past the deadline")
+
+def within_limits(solutions, pred, args):
+    """Pass solutions through, checking the deadline before each one"""
+    with closing(solutions):
+        check_limits(pred, args)
+        for solution in solutions:
+            yield solution
+            check_limits(pred, args)
+
+# === Prepared Queries ===
+# Goals are built directly as terms instead of formatting a string for
+# Prolog to parse. Each argument is one of:
+#   None         - a fresh variable; its binding is returned per solution
+#   int          - an integer, usually a person ID
+#   str          - an atom
+#   tuple        - a compound term, ("name", arg1, arg2, ...)
+#   list         - a Prolog list of any of the above
+# Predicate and functor handles are looked up once and cached.
+predicate_handles = {}
+functor_handles = {}
+
+def predicate_handle(pred, arity):
+    """Return the cached SWI predicate handle for pred/arity"""
+    handle = predicate_handles.get((pred, arity))
+    if handle is None:
+        handle = predicate_handles[(pred, arity)] = PL_predicate(pred, arity, None)
+    return handle
+
+def functor_handle(name, arity):
+    """Return the cached SWI functor handle for name/arity"""
+    functor = functor_handles.get((name, arity))
+    if functor is None:
+        functor = functor_handles[(name, arity)] = Functor(name, arity)
+    return functor.handle
+
+def put_goal_arg(term, arg, outputs):
+    """Store one goal argument in a term reference, remembering open variables"""
+    if arg is None:
+        outputs.append(term)  # fresh term references are unbound variables
+    elif isinstance(arg, tuple):
+        name, sub_args = arg[0], arg[1:]
+        refs = PL_new_term_refs(len(sub_args))
+        for i, sub_arg in enumerate(sub_args):
+            put_goal_arg(refs + i, sub_arg, outputs)
+        PL_cons_functor_v(term, functor_handle(name, len(sub_args)), refs)
+    elif isinstance(arg, list):
+        PL_put_nil(term)
+        head = PL_new_term_ref()
+        for item in reversed(arg):
+            put_goal_arg(head, item, outputs)
+            PL_cons_list(term, head, term)
+    else:
+        putTerm(term, arg)
+
+def plain_value(value):
+    """Convert a returned term into a plain Python value"""
+    return value.value if isinstance(value, Atom) else value
+
+def goal_text(pred, args):
+    """Render a goal as Prolog text, for messages only"""
+    def render(arg):
+        if arg is None:
+            return "_"
+        if isinstance(arg, tuple):
+            return goal_text(arg[0], arg[1:])
+        if isinstance(arg, list):
+            return f"[{', '.join(render(item) for item in arg)}]"
+        return str(arg)
+    return f"{pred}({', '.join(render(arg) for arg in args)})"
+
+def iter_prolog_query(pred, *args, limit=None):
+    """Yield one tuple of open-variable bindings per solution of pred(args...)
+
+    Solutions are produced lazily and the query stops after `limit` of them.
+    Only one query can be open at a time, so don't run other queries while
+    iterating; close the generator (or use it with `closing`) when stopping early.
+    """
+    if query_stats.call_counters:
+        query_stats.count_call(pred)
+    solutions = run_goal(pred, args, limit)
+    if getattr(query_limits, "deadline", None) is not None or getattr(query_limits, "cancelled", None) is not None:
+        solutions = within_limits(solutions, pred, args)
+    if not query_stats.enabled:
+        yield from solutions
+        return
+    
+    # Instrumented path: the time and inferences of the whole query, from
+    # opening it to closing it, are recorded under its goal template
+    inferences = prolog_inferences()
+    start = time.perf_counter()
+    try:
+        yield from solutions
+    finally:
+        elapsed = time.perf_counter() - start
+        query_stats.record(pred, args, elapsed, prolog_inferences() - inferences)
+
+def prolog_inferences():
+    """Return the backend's running count of logical inferences"""
+    solutions = list(run_goal("statistics", ("inferences", None), 1))
+    return solutions[0][0] if solutions else 0
+
+def run_prolog_goal(pred, args, limit):
+    """Open the query for pred(args...) and yield its solutions; see iter_prolog_query"""
+    if prolog is None:
+        get_prolog()
+    Prolog._init_prolog_thread()
+    # Each limit wraps the goal and binds its verdict to one more output,
+    # after the goal's own
+    goal = (pred,) + tuple(args)
+    verdicts = []
+    budget = getattr(query_limits, "inferences", None)
+    if budget:
+        goal = ("call_with_inference_limit", goal, budget, None)
+        verdicts.append(("inferences", "inference_limit_exceeded", f"needed more than {budget} inferences"))
+    depth = getattr(query_limits, "depth", None)
+    if depth:
+        goal = ("call_with_depth_limit", goal, depth, None)
+        verdicts.append(("depth", "depth_limit_exceeded", f"went deeper than {depth} calls"))
+    goal_pred, goal_args = goal[0], goal[1:]
+    frame = PL_open_foreign_frame()
+    try:
+        refs = PL_new_term_refs(len(goal_args))
+        outputs = []
+        for i, arg in enumerate(goal_args):
+            put_goal_arg(refs + i, arg, outputs)
+        
+        query = PL_open_query(None, PL_Q_NODEBUG | PL_Q_CATCH_EXCEPTION,
+                              predicate_handle(goal_pred, len(goal_args)), refs)
+        try:
+            found = 0
+            while (limit is None or found < limit) and PL_next_solution(query):
+                found += 1
+                solution = tuple(plain_value(getTerm(ref)) for ref in outputs)
+                if verdicts:
+                    solution, results = solution[:-len(verdicts)], solution[-len(verdicts):]
+                    for (kind, exceeded, reason), result in zip(verdicts, results):
+                        if result == exceeded:
+                            raise limit_exceeded(kind, pred, args, reason)
+                yield solution
+            if PL_exception(query):
+                error = getTerm(PL_exception(query))
+                if verdicts and "resource_error" in str(error):
+                    raise limit_exceeded("stack", pred, args, f"ran out of stack: {error}")
+                raise PrologError(f"Caused by: '{goal_text(pred, args)}'. Returned: '{error}'.")
+        finally:
+            PL_cut_query(query)
+    finally:
+        PL_discard_foreign_frame(frame)
+
+def run_store_goal(pred, args, limit):
+    """Answer pred(args...) from the columnar store or snapshot; see iter_prolog_query"""
+    try:
+        yield from islice(store.solve(pred, args), limit)
+    except ReadOnlyKB:
+        raise
+    except UnknownPredicate as e:
+        raise PrologError(f"Caused by: '{goal_text(pred, args)}'. Returned: '{e}'.")
+
+# === Storage Backends ===
+# Facts live in SWI-Prolog by default, with family.pl defining the relations.
+# The columnar backend keeps them in compact arrays instead (see columnar.py)
+# and evaluates the same relations in Python; pick it at startup with
+# --backend columnar or FAMILY_CHATBOT_BACKEND=columnar.
+#
+# Worker processes that only answer questions can use the snapshot backend:
+# a read-only KB file (see snapshot.py) that every worker memory-maps, so N
+# workers share one copy of the tree. The writer, with a live engine,
+# refreshes it with save_snapshot(); statements to a worker are refused.
+# The replica backend opens a snapshot that does take new facts, kept in
+# this process only (question_pool.py feeds them from the fact journal).
+BACKENDS = ["prolog", "columnar", "snapshot", "replica"]
+backend = None
+store = None
+run_goal = run_prolog_goal
+
+def select_backend(name, snapshot_path=None):
+    """Choose where facts are stored and queries are answered"""
+    global backend, store, run_goal, person_base
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {', '.join(BACKENDS)}")
+    invalidate_materialized()
+    backend = name
+    if name in ("snapshot", "replica"):
+        path = snapshot_path or os.environ.get("FAMILY_CHATBOT_SNAPSHOT", "family.snap")
+        store = Snapshot(path) if name == "snapshot" else Replica(path)
+        # Names interned before the snapshot was opened don't belong to it
+        person_ids.clear()
+        person_names.clear()
+        person_base = store.people
+        run_goal = run_store_goal
+    elif name == "columnar":
+        if not isinstance(store, ColumnarStore):
+            store = ColumnarStore()
+        run_goal = run_store_goal
+    else:
+        run_goal = run_prolog_goal
+
+STORED_PREDICATES = ["male", "female", "married", "parent", "sibling_group"] + DERIVED_TABLES
+
+def stored_facts(pred):
+    """Yield the argument tuples of the stored facts of pred, on any backend"""
+    arity = 1 if pred in ("male", "female") else 2
+    with closing(iter_prolog_query("clause", (pred,) + (None,) * arity, "true")) as rows:
+        yield from rows
+
+def save_snapshot(path):
+    """Write the current KB to a read-only snapshot file for worker processes"""
+    names = [interned_name(pid) for pid in range(person_count())]
+    return write_snapshot(path, names, stored_facts)
+
+def load_snapshot(path, batch_size=1000):
+    """Copy the names and facts of a snapshot into the current, empty KB"""
+    if person_count():
+        raise ValueError("load_snapshot() needs an empty KB")
+    source = Snapshot(path)
+    for pid in range(source.people):
+        person_id(source.name(pid))
+    for pred in ["male", "female", "married"] + list(source.tables):
+        batch = []
+        for row in source.stored_facts(pred):
+            batch.append((pred,) + row)
+            if len(batch) >= batch_size:
+                prolog_query("assert_new_facts", batch)
+                batch = []
+        if batch:
+            prolog_query("assert_new_facts", batch)
+    rebuild_sibling_groups()
+    rebuild_fact_index()
+    invalidate_materialized()
+    return {"people": source.people}
+
+# === Fact Journal ===
+# While journal is an open file, newly interned names and every fact the
+# statements add or retract are appended to it, one line each:
+#   name <id> <name>
+#   assert <pred> <args...>
+#   retract <pred> <args...>
+# Replicas replay it on top of the snapshot it started from (see
+# question_pool.py). Only facts are journaled, not what they imply.
+journal = None
+
+def journal_entry(*fields):
+    """Append one line to the fact journal, if one is open"""
+    if journal is not None:
+        journal.write(" ".join(map(str, fields)) + "\n")
+
+# === Statement Transactions ===
+# Each statement is applied as one transaction. Handlers assert as they go
+# and validate afterwards; when a handler raises Contradiction (or fails),
+# every fact the statement added is retracted and every fact it retracted is
+# put back, so a statement that is rejected halfway leaves no trace. The undo
+# log lives here rather than in SWI's transaction/1 so it works the same for
+# every backend, and it holds the statement's journal lines until commit.
+# Interned names are kept either way; they don't change any answer.
+class Contradiction(Exception):
+    """Raised by a statement handler to reject the statement and undo its changes"""
+
+    def __init__(self, answer="That's impossible!"):
+        super().__init__(answer)
+
+undo_log = None
+
+def record_change(op, pred, *args):
+    """Note an asserted or retracted fact in the open transaction, or the journal"""
+    index_change(op, pred, args)
+    note_input_change(pred, args)
+    if undo_log is not None:
+        undo_log.append((op, pred, args))
+    else:
+        journal_entry(op, pred, *args)
+
+@contextmanager
+def transaction():
+    """Apply the KB changes of the block together, or not at all"""
+    global undo_log
+    if undo_log is not None:
+        yield  # part of the enclosing transaction
+        return
+    undo_log = changes = []
+    try:
+        yield
+    except BaseException:
+        undo_log = None
+        rollback(changes)
+        raise
+    undo_log = None
+    for op, pred, args in changes:
+        if op in ("assert", "retract"):
+            journal_entry(op, pred, *args)
+    with suspended_limits():
+        refresh_materialized(["eager"])
+
+def rollback(changes):
+    """Undo a list of changes, newest first"""
+    if not changes:
+        return
+    # The limits that stopped the statement mustn't stop its undoing
+    with suspended_limits():
+        for op, pred, args in reversed(changes):
+            if op == "support":
+                drop_justification(pred, args)
+            elif op == "unsupport":
+                add_justification(pred, args)
+            else:
+                prolog_query("retract" if op == "assert" else "assertz", (pred,) + args)
+                index_change("retract" if op == "assert" else "assert", pred, args)
+                note_input_change(pred, args)
+        rebuild_sibling_groups()
+    logger.debug("Rolled back %d changes", len(changes))
+
+# === Constraints ===
+# The KB's invariants are declared in constraints.py and checked against an
+# index of the stored facts: the store itself on the columnar backends, and
+# for Prolog a ColumnarStore mirroring every change made through
+# record_change(). Call rebuild_fact_index() after loading facts into Prolog
+# some other way.
+fact_index = ColumnarStore()
+
+def index_store():
+    return fact_index if backend == "prolog" else store
+
+def index_change(op, pred, args):
+    """Mirror an asserted or retracted fact in the Prolog backend's index"""
+    if backend != "prolog":
+        return
+    try:
+        if op == "assert":
+            fact_index.add_fact(pred, *args)
+        else:
+            fact_index.remove_fact(pred, *args)
+    except UnknownPredicate:
+        pass
+
+def rebuild_fact_index():
+    """Rebuild the Prolog backend's index from the facts stored in Prolog"""
+    global fact_index
+    if backend == "prolog":
+        fact_index = ColumnarStore()
+        for pred in STORED_PREDICATES:
+            for row in stored_facts(pred):
+                fact_index.add_fact(pred, *row)
+
+def violates(pred, *args):
+    """Return the invariant that pred(args...) would break, or None"""
+    return constraints.violation(index_store(), pred, *args)
+
+# Answers for broken invariants that say more than "That's impossible!"
+VIOLATION_ANSWERS = {
+    ("married", "one_spouse"): "That's impossible! {0} is already married.",
+    ("uncle", "grandparent_not_uncle"): "That's impossible! {0} is already the grandparent of {1}.",
+    ("aunt", "grandparent_not_uncle"): "That's impossible! {0} is already the grandparent of {1}.",
+}
+
+def check_invariants(fact):
+    """Reject the statement (raise Contradiction) if fact would break an invariant"""
+    invariant = violates(*fact)
+    if invariant:
+        people = fact[1:]
+        # Name whichever of the two is married already
+        if invariant == "one_spouse" and not constraints.has_other_spouse(index_store(), *people):
+            people = people[::-1]
+        answer = VIOLATION_ANSWERS.get((fact[0], invariant), "That's impossible!")
+        raise Contradiction(answer.format(*(person_name(person) for person in people)))
+
+# === Materialized Relations ===
+# grandparent/2, uncle/2 and aunt/2 follow from the rules of family.pl. Each
+# can be kept in one of three ways, set in MATERIALIZATION:
+#   virtual  evaluate the rules on every query (the default)
+#   eager    keep the rule results in a cache, brought up to date after
+#            every statement
+#   lazy     the same cache, brought up to date by the first question after
+#            a change
+# Facts the user states for these relations are stored either way. A cache
+# is only read while it is current. The first change to a fact the rules
+# read (INPUT_PREDICATES) switches the relation back to its rules and notes
+# the people involved; bringing the cache up to date then recomputes the
+# rule results around just those people, from the fact index. Choose with
+# set_materialization() or FAMILY_CHATBOT_MATERIALIZE, e.g.
+# "grandparent=eager,uncle=lazy" or "all=lazy"; bench_suite.py --materialize
+# compares the policies on read- and write-heavy workloads.
+POLICIES = ["virtual", "eager", "lazy"]
+MATERIALIZATION = {relation: "virtual" for relation in MATERIALIZABLE}
+INPUT_PREDICATES = {"parent", "married", "male", "female", "sibling_group"}
+# Per relation, the people whose rule results may have changed since its
+# cache was last current; None when the whole cache has to be rebuilt
+stale_people = {relation: None for relation in MATERIALIZABLE}
+materialized_now = set()
+
+RULE_LOOKUPS = {
+    "grandparent": (lambda kb, g: kb.rule_grandchildren(g), lambda kb, c: kb.rule_grandparents(c)),
+    "uncle": (lambda kb, u: kb.rule_nephews_and_nieces(u, "uncle"), lambda kb, n: kb.rule_uncles_or_aunts(n, "uncle")),
+    "aunt": (lambda kb, a: kb.rule_nephews_and_nieces(a, "aunt"), lambda kb, n: kb.rule_uncles_or_aunts(n, "aunt")),
+}
+
+def parse_materialization(spec):
+    """Read "relation=policy,..." (relation may be "all") into a dict"""
+    policies = {}
+    for setting in filter(None, (part.strip() for part in spec.split(","))):
+        relation, _, policy = setting.partition("=")
+        for name in (MATERIALIZABLE if relation == "all" else [relation]):
+            if name not in MATERIALIZABLE or policy not in POLICIES:
+                raise ValueError(f"Can't materialize {relation!r} as {policy!r}")
+            policies[name] = policy
+    return policies
+
+def set_materialization(relation, policy):
+    """Choose how a relation's rule results are kept (one of POLICIES)"""
+    MATERIALIZATION[relation] = policy
+    unmaterialize(relation)
+    stale_people[relation] = None
+
+def unmaterialize(relation):
+    if relation in materialized_now:
+        prolog_query("set_materialized", relation, "false")
+        materialized_now.discard(relation)
+
+def invalidate_materialized():
+    """Answer from the rules until every cache is rebuilt, e.g. after a bulk load"""
+    for relation in MATERIALIZABLE:
+        unmaterialize(relation)
+        stale_people[relation] = None
+
+def note_input_change(pred, args):
+    """Stop answering from the caches that a changed fact may have made stale"""
+    if pred not in INPUT_PREDICATES:
+        return
+    for relation in MATERIALIZABLE:
+        if MATERIALIZATION[relation] != "virtual":
+            unmaterialize(relation)
+            if stale_people[relation] is not None:
+                stale_people[relation].update(args)
+
+def affected_people(kb, people):
+    """Everyone whose rule results a change to people's facts can alter, as either argument"""
+    region = set(people)
+    for person in people:
+        region.update(kb.spouses(person))
+    for person in list(region):
+        region.update(kb.child_likes(person))
+    return region
+
+def refresh_cache(relation):
+    """Bring a relation's cache up to date with its rules and answer from it"""
+    kb = index_store()
+    forward, backward = RULE_LOOKUPS[relation]
+    people = stale_people[relation]
+    if people is None:
+        new = {(x, y) for x in range(kb.people_count()) for y in forward(kb, x)}
+        old = set(prolog_query("cached", relation, None, None))
+    else:
+        new, old = set(), set()
+        for person in affected_people(kb, people):
+            new.update((person, y) for y in forward(kb, person))
+            new.update((x, person) for x in backward(kb, person))
+            old.update((person, y) for (y,) in prolog_query("cached", relation, person, None))
+            old.update((x, person) for (x,) in prolog_query("cached", relation, None, person))
+    added, removed = new - old, old - new
+    if added or removed:
+        prolog_query("update_cache", relation, [("pair",) + pair for pair in added],
+                     [("pair",) + pair for pair in removed])
+    prolog_query("set_materialized", relation, "true")
+    materialized_now.add(relation)
+    stale_people[relation] = set()
+    logger.debug("Cache of %s: %d added, %d removed", relation, len(added), len(removed))
+
+def refresh_materialized(policies=("eager", "lazy")):
+    """Bring the caches of the relations kept under policies up to date"""
+    for relation, policy in MATERIALIZATION.items():
+        if policy in policies and relation not in materialized_now:
+            refresh_cache(relation)
+
+select_backend(os.environ.get("FAMILY_CHATBOT_BACKEND", "prolog"))
+for relation, policy in parse_materialization(os.environ.get("FAMILY_CHATBOT_MATERIALIZE", "")).items():
+    set_materialization(relation, policy)
+
+def prolog_query(pred, *args, limit=None):
+    """Run pred(args...) and return one tuple of open-variable bindings per solution"""
+    return list(iter_prolog_query(pred, *args, limit=limit))
 
 def is_valid_name(name):
     """Check if a name is valid (only letters, not a reserved word)"""
@@ -21,73 +745,40 @@ def is_valid_name(name):
     
     return True
 
-def assert_once(fact):
+def assert_once(pred, *args):
     """Assert a fact only if it doesn't already exist"""
     try:
-        if not list(prolog.query(fact)):
-            prolog.assertz(fact)
+        if not prolog_query(pred, *args, limit=1):
+            prolog_query("assertz", (pred,) + args)
+            record_change("assert", pred, *args)
             return "new"  # New fact added
         else:
+            state_fact(pred, *args)
             return "exists"  # Fact already exists
     except PrologError as e: 
-        print(f"DEBUG: PrologError: {e}")
+        logger.debug("PrologError: %s", e)
         return "error"  # Error occurred
 
 def check_self_relation(a, b):
     """Check if someone is trying to relate to themselves"""
     return a.lower() == b.lower()
 
-def check_contradiction(person, gender, relation=None, other_person=None):
-    """Check if adding this fact would create a contradiction"""
-    person = person.lower()
-    
-    try:
-        # Check gender contradiction
-        opposite_gender = "female" if gender == "male" else "male"
-        if list(prolog.query(f"{opposite_gender}({person})")):
-            return True
-        
-        # Also check if this would create a gender conflict
-        if list(prolog.query(f"gender_conflict({person})")):
-            return True
-        
-        # Check for impossible self-relations
-        if other_person and check_self_relation(person, other_person):
-            return True
-        
-        # Check for circular parent relationships (A parent of B, B parent of A)
-        if relation == "parent" and other_person:
-            other_person = other_person.lower()
-            if list(prolog.query(f"parent({other_person}, {person})")):
-                return True
-    except PrologError:
-        return False
-    
-    return False
-
-def check_would_create_cycle(new_parent, new_child):
-    """Check if adding parent(new_parent, new_child) would create a cycle"""
-    new_parent, new_child = new_parent.lower(), new_child.lower()
-    
-    # Self-relation check
-    if new_parent == new_child:
-        return True
-    
-    try:
-        # Check if new_child is already an ancestor of new_parent
-        result = list(prolog.query(f"ancestor({new_child}, {new_parent})"))
-        return bool(result)
-    except PrologError:
-        return False
-
-def safe_prolog_query(query):
+def safe_prolog_query(pred, *args, limit=None):
     """Safely execute a Prolog query with error handling"""
     try:
-        return list(prolog.query(query))
+        return prolog_query(pred, *args, limit=limit)
     except PrologError as e:
-        print(f"Debug: Prolog error for query '{query}': {e}")
+        logger.debug("Prolog error for query '%s': %s", goal_text(pred, args), e)
         return []
 
+def prolog_holds(pred, *args):
+    """Check whether a goal has at least one solution, stopping at the first"""
+    return bool(safe_prolog_query(pred, *args, limit=1))
+
+def prolog_values(pred, *args):
+    """Collect the distinct values bound to the single open argument of a goal"""
+    return {solution[0] for solution in safe_prolog_query(pred, *args)}
+
 def levenshtein_distance(s1, s2):
     """Calculate the Levenshtein distance between two strings"""
     if len(s1) < len(s2):
@@ -198,230 +889,253 @@ def correct_relationship_typo(word):
 
 def get_parents(person):
     """Get all parents of a person"""
-    result = safe_prolog_query(f"parent(P, {person})")
-    return {r["P"] for r in result if "P" in r}
+    return prolog_values("parent", None, person)
+
+def retract_fact(pred, *args):
+    """Retract a stored fact; return False if it wasn't stored"""
+    if prolog_holds("retract", (pred,) + args):
+        record_change("retract", pred, *args)
+        return True
+    return False
+
+# === Fact Provenance ===
+# Facts the chatbot works out for itself are stored with their reasons, as in
+# a justification-based truth-maintenance system. justifications maps such a
+# fact, e.g. ("parent", p, c), to its list of justifications: STATED when the
+# user also said it, or a tuple of the facts it was derived from. dependents
+# maps a fact to the derived facts it helps justify. Facts with no entry
+# (everything stated, loaded or imported) simply hold.
+#
+# Forgetting a fact withdraws its justification; when a fact is left with
+# none, it is retracted and the same happens to the justifications it took
+# part in. So retracting a parent/2 edge touches only the facts that rested
+# on it. Derivations only ever rest on facts that hold by themselves, so no
+# fact can end up justifying itself. Changes to the justifications are kept
+# in the undo log, so a rolled back statement takes its reasons with it.
+STATED = "stated"
+justifications = {}
+dependents = {}
+
+def add_justification(fact, justification):
+    justifications.setdefault(fact, []).append(justification)
+    if justification != STATED:
+        for premise in justification:
+            dependents.setdefault(premise, set()).add(fact)
+    if undo_log is not None:
+        undo_log.append(("support", fact, justification))
+
+def drop_justification(fact, justification):
+    # Stale dependents entries are harmless: withdraw() checks the justification
+    reasons = justifications[fact]
+    reasons.remove(justification)
+    if not reasons:
+        del justifications[fact]
+    if undo_log is not None:
+        undo_log.append(("unsupport", fact, justification))
+
+def holds_by_itself(fact):
+    """Whether a stored fact was stated (or loaded) rather than only derived"""
+    return STATED in justifications.get(fact, (STATED,))
+
+def derive(premises, pred, *args):
+    """Store a fact that follows from premises, recording why"""
+    fact = (pred,) + args
+    if fact in justifications:
+        if premises not in justifications[fact]:
+            add_justification(fact, premises)
+        return "exists"
+    # Already known some other way: as a stated fact, or through the rules
+    if prolog_holds(pred, *args):
+        return "exists"
+    check_invariants(fact)
+    prolog_query("assertz", fact)
+    record_change("assert", pred, *args)
+    add_justification(fact, premises)
+    return "new"
+
+def state_fact(pred, *args):
+    """Note that the user said a fact that had only been derived"""
+    fact = (pred,) + args
+    if fact in justifications and STATED not in justifications[fact]:
+        add_justification(fact, STATED)
+
+def withdraw(fact, justification=STATED):
+    """Drop one justification of a stored fact; return the facts retracted as a result"""
+    if fact in justifications:
+        drop_justification(fact, justification)
+        if fact in justifications:
+            return []
+    retract_fact(*fact)
+    retracted = [fact]
+    for dependent in dependents.pop(fact, ()):
+        for reason in list(justifications.get(dependent, ())):
+            if reason != STATED and fact in reason:
+                retracted += withdraw(dependent, reason)
+    return retracted
+
+def forget_fact(pred, *args):
+    """Forget a fact the user stated, with whatever followed only from it"""
+    fact = (pred,) + args
+    if not prolog_holds("clause", fact, "true"):
+        return None
+    if not holds_by_itself(fact):
+        return []
+    retracted = withdraw(fact)
+    # Parents shared through a sibling group may have gone with it; the ones
+    # another member still has are shared again
+    for child in {args[1] for pred, *args in retracted if pred == "parent"}:
+        root = find_sibling_root(child)
+        if root is not None:
+            sibling_group_parents[root] = set().union(*(get_parents(m) for m in sibling_members[root]))
+            share_group_parents(root)
+    return [fact for fact in retracted if not prolog_holds(*fact)]
+
+# === Sibling Groups ===
+# Siblings whose parents aren't known yet are kept in disjoint sets (union by
+# size with path compression). The parents known for a group are stored on its
+# root, so learning a parent of any member reaches the whole group at once.
+# Each person in a group is mirrored to Prolog as one sibling_group(Person, Root)
+# fact, which keeps large sibships linear instead of storing every pair.
+sibling_links = {}
+sibling_members = {}
+sibling_group_parents = {}
+
+def find_sibling_root(person):
+    """Return the root of the person's sibling group, or None if they have none"""
+    if person not in sibling_links:
+        return None
+    root = person
+    while sibling_links[root] != root:
+        root = sibling_links[root]
+    # Path compression: point everyone on the way straight at the root
+    while sibling_links[person] != root:
+        sibling_links[person], person = root, sibling_links[person]
+    return root
+
+def join_sibling_groups(person1, person2):
+    """Put two people in the same sibling group and return its root"""
+    roots = []
+    for person in (person1, person2):
+        root = find_sibling_root(person)
+        if root is None:
+            root = sibling_links[person] = person
+            sibling_members[person] = {person}
+            sibling_group_parents[person] = get_parents(person)
+            assert_once("sibling_group", person, root)
+        roots.append(root)
+    
+    root, other = roots
+    if root == other:
+        return root
+    if len(sibling_members[root]) < len(sibling_members[other]):
+        root, other = other, root
+    
+    # Relabel the smaller group; each person moves O(log n) times in total
+    for member in sibling_members[other]:
+        if prolog_holds("retract", ("sibling_group", member, other)):
+            record_change("retract", "sibling_group", member, other)
+        assert_once("sibling_group", member, root)
+    sibling_links[other] = root
+    sibling_members[root] |= sibling_members.pop(other)
+    sibling_group_parents[root] |= sibling_group_parents.pop(other)
+    return root
+
+def rebuild_sibling_groups():
+    """Restore the sibling groups from the KB's sibling_group facts"""
+    sibling_links.clear()
+    sibling_members.clear()
+    sibling_group_parents.clear()
+    for member, root in prolog_query("sibling_group", None, None):
+        sibling_links[member] = root
+        sibling_members.setdefault(root, set()).add(member)
+        sibling_group_parents.setdefault(root, set()).update(get_parents(member))
+
+def share_group_parents(root, parents=None):
+    """Make sure every member of a sibling group has the given parents of the
+    group (all of them by default)"""
+    members = sibling_members[root]
+    for parent in sibling_group_parents[root] if parents is None else parents:
+        # Sharing a parent with the group would make them their own parent
+        if parent in members:
+            raise Contradiction()
+        # One member the user said is this parent's child justifies the
+        # parent for all the others
+        children = prolog_values("parent", parent, None)
+        sources = [member for member in members
+                   if member in children and holds_by_itself(("parent", parent, member))]
+        if not sources:
+            continue
+        premises = (("parent", parent, min(sources)),)
+        for member in members:
+            if member not in children and derive(premises, "parent", parent, member) == "new":
+                logger.debug("Added group parent(%s, %s)", parent, member)
 
 def handle_sibling_with_smart_inference(person1, person2, rel):
     """Handle sibling relationships with deferred parent inference"""
     
-    if check_sibling_contradiction(person1, person2):
+    if violates("sibling", person1, person2):
         return "That's impossible!"
     
     # Get existing parents for both people
     parents1 = get_parents(person1)
     parents2 = get_parents(person2)
     
-    print(f"Debug: {person1} has parents: {parents1}")
-    print(f"Debug: {person2} has parents: {parents2}")
+    logger.debug("%s has parents: %s", person1, parents1)
+    logger.debug("%s has parents: %s", person2, parents2)
     
     # Case 1: They already share at least one parent - they're already siblings
     shared_parents = parents1.intersection(parents2)
     if shared_parents:
-        print(f"Debug: {person1} and {person2} already share parents: {shared_parents}")
+        logger.debug("%s and %s already share parents: %s", person1, person2, shared_parents)
         return "OK! I already knew they were siblings through their shared parent(s)."
     
-    # Case 2: One has parents, the other doesn't - make them share parents
-    if parents1 and not parents2:
-        print(f"Debug: Making {person2} share {person1}'s parents: {parents1}")
-        for parent in parents1:
-            result = assert_once(f"parent({parent}, {person2})")
-            if result == "new":
-                print(f"Debug: Added parent({parent}, {person2})")
-        return "OK! I learned something."
-    
-    elif parents2 and not parents1:
-        print(f"Debug: Making {person1} share {person2}'s parents: {parents2}")
-        for parent in parents2:
-            result = assert_once(f"parent({parent}, {person1})")
-            if result == "new":
-                print(f"Debug: Added parent({parent}, {person1})")
-        return "OK! I learned something."
-    
-    # Case 3: Both have different parents - merge their parent sets
-    elif parents1 and parents2:
-        all_parents = parents1.union(parents2)
-        print(f"Debug: Merging parent sets: {all_parents}")
-        for parent in all_parents:
-            assert_once(f"parent({parent}, {person1})")
-            assert_once(f"parent({parent}, {person2})")
-        parent_names = ', '.join(p.capitalize() for p in all_parents)
-        return f"OK! I learned that both {person1.capitalize()} and {person2.capitalize()} have {parent_names} as their parents, making them full siblings."
-    
-    # Case 4: Neither has parents - just establish them as siblings for now
-    # We'll use a "deferred sibling" approach - store the sibling relationship
-    # and infer parents later when we learn about them
-    else:
-        print(f"Debug: Neither {person1} nor {person2} has parents yet - deferring parent inference")
-        # Store the sibling relationship as a direct fact for now
-        assert_once(f"sibling_deferred({person1}, {person2})")
-        assert_once(f"sibling_deferred({person2}, {person1})")
-        return "OK! I learned something."
-    
-def trigger_deferred_sibling_inference():
-    """Check for deferred sibling relationships and apply parent sharing when parents are discovered"""
+    # Otherwise join their sibling groups; whatever parents are known for
+    # either group become parents of everyone in the merged group. If neither
+    # has parents yet, the group remembers them as siblings until one is learned.
+    root = join_sibling_groups(person1, person2)
+    logger.debug("Sibling group of %s and %s has parents: %s", person1, person2, sibling_group_parents[root])
+    share_group_parents(root)
+    
+    # Case 3: Both had different parents - their parent sets were merged
+    if parents1 and parents2:
+        parent_names = ', '.join(person_name(p) for p in sibling_group_parents[root])
+        return f"OK! I learned that both {person_name(person1)} and {person_name(person2)} have {parent_names} as their parents, making them full siblings."
+    
+    return "OK! I learned something."
+    
+def trigger_deferred_sibling_inference(child):
+    """After a parent of child is learned, share it with the child's sibling group"""
     try:
-        print("Debug: Checking deferred sibling relationships...")
-        
-        # Get all deferred sibling pairs
-        deferred_siblings = safe_prolog_query("sibling_deferred(X, Y)")
+        root = find_sibling_root(child)
+        if root is None:
+            return
         
-        resolved_pairs = set()  # Track resolved pairs to avoid duplicate processing
-        
-        for rel in deferred_siblings:
-            if "X" in rel and "Y" in rel:
-                person1, person2 = rel["X"], rel["Y"]
-                
-                # Create a normalized pair key (alphabetical order)
-                pair_key = tuple(sorted([person1, person2]))
-                if pair_key in resolved_pairs:
-                    continue  # Skip if already processed
-                
-                # Get current parents
-                parents1 = get_parents(person1)
-                parents2 = get_parents(person2)
-                
-                # If one now has parents and the other doesn't, make them share
-                if parents1 and not parents2:
-                    print(f"Debug: Applying deferred inference - giving {person2} parents from {person1}: {parents1}")
-                    for parent in parents1:
-                        result = assert_once(f"parent({parent}, {person2})")
-                        if result == "new":
-                            print(f"Debug: Added deferred parent({parent}, {person2})")
-                    resolved_pairs.add(pair_key)
-                    
-                elif parents2 and not parents1:
-                    print(f"Debug: Applying deferred inference - giving {person1} parents from {person2}: {parents2}")
-                    for parent in parents2:
-                        result = assert_once(f"parent({parent}, {person1})")
-                        if result == "new":
-                            print(f"Debug: Added deferred parent({parent}, {person1})")
-                    resolved_pairs.add(pair_key)
+        new_parents = get_parents(child) - sibling_group_parents[root]
+        if new_parents:
+            logger.debug("Applying deferred inference - sharing %s with the sibling group of %s", new_parents, child)
+            sibling_group_parents[root] |= new_parents
+            share_group_parents(root, new_parents)
                     
-                elif parents1 and parents2 and parents1 != parents2:
-                    # Both have different parents - merge them
-                    all_parents = parents1.union(parents2)
-                    print(f"Debug: Applying deferred inference - merging parent sets: {all_parents}")
-                    for parent in all_parents:
-                        assert_once(f"parent({parent}, {person1})")
-                        assert_once(f"parent({parent}, {person2})")
-                    resolved_pairs.add(pair_key)
-                        
+    except Contradiction:
+        raise
     except Exception as e:
-        print(f"Debug: Error in deferred sibling inference: {e}")
+        logger.warning("Error in deferred sibling inference: %s", e)
    
 def trigger_full_family_inference():
-    """Trigger comprehensive family relationship inference with conflict resolution"""
-    try:
-        print("Debug: Starting family inference...")
-        
-        # Get all people from various relationships to build complete person list
-        all_people = set()
-        for query_type in ["parent(X, Y)", "sibling(X, Y)", "male(X)", "female(X)", "married(X, Y)"]:
-            results = safe_prolog_query(query_type)
-            for result in results:
-                for key, value in result.items():
-                    if isinstance(value, str):
-                        all_people.add(value.lower())
-        
-        print(f"Debug: Found {len(all_people)} people: {sorted(all_people)}")
-        
-        # First, infer grandparent relationships
-        for person in all_people:
-            # Get their children
-            children_query = safe_prolog_query(f"parent({person}, X)")
-            children = {r["X"] for r in children_query if "X" in r}
-            
-            # For each child, get their children (grandchildren)
-            for child in children:
-                grandchildren_query = safe_prolog_query(f"parent({child}, Y)")
-                grandchildren = {r["Y"] for r in grandchildren_query if "Y" in r}
-                
-                # Make person grandparent of each grandchild
-                for grandchild in grandchildren:
-                    existing = safe_prolog_query(f"grandparent({person}, {grandchild})")
-                    if not existing:
-                        result = assert_once(f"grandparent({person}, {grandchild})")
-                        if result == "new":
-                            print(f"Debug: Inferred grandparent({person}, {grandchild})")
-        
-        # Then, infer uncle/aunt relationships (but avoid conflicts with grandparent relationships)
-        for person in all_people:
-            siblings_query = safe_prolog_query(f"sibling({person}, X)")
-            siblings = {r["X"] for r in siblings_query if "X" in r}
-            
-            children_query = safe_prolog_query(f"parent({person}, Y)")
-            children = {r["Y"] for r in children_query if "Y" in r}
-            
-            for sibling in siblings:
-                for child in children:
-                    # IMPORTANT: Check if sibling is already grandparent of child
-                    # If so, skip uncle/aunt relationship (grandparent takes precedence)
-                    if safe_prolog_query(f"grandparent({sibling}, {child})"):
-                        print(f"Debug: Skipping uncle/aunt({sibling}, {child}) - already grandparent")
-                        continue
-                    
-                    if safe_prolog_query(f"male({sibling})"):
-                        existing = safe_prolog_query(f"uncle({sibling}, {child})")
-                        if not existing:
-                            result = assert_once(f"uncle({sibling}, {child})")
-                            if result == "new":
-                                print(f"Debug: Inferred uncle({sibling}, {child})")
-                    elif safe_prolog_query(f"female({sibling})"):
-                        existing = safe_prolog_query(f"aunt({sibling}, {child})")
-                        if not existing:
-                            result = assert_once(f"aunt({sibling}, {child})")
-                            if result == "new":
-                                print(f"Debug: Inferred aunt({sibling}, {child})")
-                    
-    except Exception as e:
-        print(f"Debug: Error in family inference: {e}")
+    """Bring the eagerly materialized relations up to date after new facts"""
+    refresh_materialized(["eager"])
+
+def trigger_sibling_uncle_aunt_inference():
+    """Bring the eagerly materialized uncle/aunt relations up to date"""
+    refresh_materialized(["eager"])
 
-def check_sibling_contradiction(person1, person2):
-    """Check if making person1 and person2 siblings would create a contradiction"""
-    person1, person2 = person1.lower(), person2.lower()
-    
-    try:
-        # Check if one is already a parent/child of the other
-        if (safe_prolog_query(f"parent({person1}, {person2})") or 
-            safe_prolog_query(f"parent({person2}, {person1})")):
-            return True
-            
-        # Check if one is already an ancestor/descendant of the other
-        if (safe_prolog_query(f"ancestor({person1}, {person2})") or 
-            safe_prolog_query(f"ancestor({person2}, {person1})")):
-            return True
-        
-        # Get all children of person1
-        children1_result = safe_prolog_query(f"parent({person1}, X)")
-        children1 = {r["X"] for r in children1_result if "X" in r}
-        
-        # Get all children of person2  
-        children2_result = safe_prolog_query(f"parent({person2}, X)")
-        children2 = {r["X"] for r in children2_result if "X" in r}
-        
-        # If they share any children, they cannot be siblings
-        shared_children = children1.intersection(children2)
-        if shared_children:
-            return True
-        
-        # If person1 is grandparent of any child of person2, that's impossible
-        for child2 in children2:
-            if safe_prolog_query(f"grandparent({person1}, {child2})"):
-                return True
-                
-        # If person2 is grandparent of any child of person1, that's impossible  
-        for child1 in children1:
-            if safe_prolog_query(f"grandparent({person2}, {child1})"):
-                return True
-        
-        return False
-        
-    except Exception:
-        return False
 # === Statement Parsing ===
 
+READ_ONLY_ANSWER = "Sorry, I can't learn anything here: this KB is a read-only snapshot."
+
+@query_stats.scoped("parse_statement")
 def parse_statement(prompt):
-    prompt = prompt.strip().rstrip(".")
+    prompt = prompt.strip().rstrip(".!")
     
     # Handle empty input
     if not prompt:
@@ -452,621 +1166,426 @@ def parse_statement(prompt):
             if corrected_rel is None:
                 return f"I don't recognize '{rel}'. Try using common family relationships."
             
-            result = safe_prolog_query(f"{corrected_rel}({a}, {b})")
+            a, b = person_id(a), person_id(b)
+            result = prolog_holds(corrected_rel, a, b)
             return "Yes!" if result else "No."
 
-    patterns = [
-        (r"(\w+) is (?:a |an |the )?(father|mother|parent|child|son|daughter|brother|sister|sibling|uncle|aunt|grandfather|grandmother|husband|wife|spouse|nephew|niece|cousin) of (\w+)", handle_single_relation),
-        (r"(\w+) and (\w+) are siblings", handle_siblings),
-        (r"(\w+) and (\w+) are (brothers?|sisters?) of (\w+)", handle_siblings_of),
-        (r"(\w+) and (\w+) are cousins", handle_cousins),
-        (r"(\w+) and (\w+) are spouses", handle_spouses),            
-        (r"(\w+) and (\w+) are (?:the )?parents of (\w+)", handle_parents),
-        (r"(\w+) and (\w+) are children of (\w+)", handle_two_children),
-        (r"(\w+), (\w+)(?:, and (\w+))? are children of (\w+)", handle_children),
-        (r"(\w+) is (?:a |an |the )?child of (\w+)", handle_child_relation),
-        (r"(\w+) and (\w+) are married", handle_marriage),        
-        (r"(\w+) is married to (\w+)", handle_marriage_to),        
-        (r"(\w+) has (?:a |an |the )?(son|daughter|child|husband|wife|spouse|nephew|niece|cousin) (?:named )?(\w+)", handle_has_child),
-        (r"(\w+) and (\w+) have (?:a |an |the )?child (?:named )?(\w+)", handle_have_child)
-    ]
-
-    for i, (pattern, handler) in enumerate(patterns):
-        match = re.match(pattern, prompt, re.IGNORECASE)
+    # Forms with a handler of their own take the whole message; everything
+    # else may be several clauses, learned together
+    handler = None
+    for form in STATEMENTS:
+        match = form["pattern"].fullmatch(prompt) if "handler" in form else None
         if match:
-            try:
-                return handler(match)
-            except Exception as e:
-                return f"Sorry, I encountered an error processing that statement: {str(e)}"
-
-    return "Sorry, I can't understand that statement format. Try using patterns like 'X is the father of Y' or 'X and Y are siblings'."
-
-def handle_single_relation(match):
-    a, rel, b = match.groups()
-    a, b = a.lower(), b.lower()
-
-    # Validate names
-    if not is_valid_name(a) or not is_valid_name(b):
-        if a.lower() == 'who' or b.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    if check_self_relation(a, b):
-        return "That's impossible!"
-
-    # Determine gender based on relation
-    if rel in ["father", "son", "brother", "uncle", "nephew", "grandfather", "husband"]:
-        gender = "male"
-    elif rel in ["mother", "daughter", "sister", "aunt", "niece", "grandmother", "wife"]:
-        gender = "female"
-    else:
-        gender = None
-    
-    # Check for contradictions
-    if gender and check_contradiction(a, gender):
-        return "That's impossible!"
-    
-    # Handle different relationship types
-    if rel in ["father", "mother", "parent"]:
-        if check_would_create_cycle(a, b):
-            return "That's impossible!"
-        result = assert_once(f"parent({a}, {b})")
-        if result == "error":
-            return "Error adding that relationship!"
-        elif result == "exists":
-            return "OK! I already knew that."
-        
-        # After adding a parent, check for deferred siblings who need this parent
-        trigger_deferred_sibling_inference()
-        # Then run full family inference ONCE
-        trigger_full_family_inference()
-        
-    elif rel in ["son", "daughter", "child"]:
-        if check_would_create_cycle(b, a):
-            return "That's impossible!"
-        result = assert_once(f"parent({b}, {a})")
-        if result == "error":
-            return "Error adding that relationship!"
-        elif result == "exists":
-            return "OK! I already knew that."
-        
-        # After adding a parent, check for deferred siblings who need this parent
-        trigger_deferred_sibling_inference()
-        # Then run full family inference ONCE
-        trigger_full_family_inference()
-
-    elif rel in ["brother", "sister", "sibling"]:
-        # Assert gender first
-        if gender:
-            assert_once(f"{gender}({a})")
-        
-        # Handle sibling relationship with smart inference
-        result = handle_sibling_with_smart_inference(a, b, rel)
-        return result  # Don't run inference here - let the parent addition trigger it
-        
-    elif rel in ["grandfather", "grandmother"]:
-        if check_would_create_cycle(a, b):
-            return "That's impossible!"
-        result = assert_once(f"grandparent({a}, {b})")
-        if result == "error":
-            return "Error adding that relationship!"
-        elif result == "exists":
-            return "OK! I already knew that."
-        
-    elif rel in ["uncle", "aunt"]:
-        # Check if this would conflict with a grandparent relationship
-        if safe_prolog_query(f"grandparent({a}, {b})"):
-            return f"That's impossible! {a.capitalize()} is already the grandparent of {b.capitalize()}."
-        
-        result = assert_once(f"{rel}({a}, {b})")
-        if result == "error":
-            return "Error adding that relationship!"
-        elif result == "exists":
-            return "OK! I already knew that."
-        
-    elif rel in ["nephew", "niece"]:
-        result = assert_once(f"{rel}({a}, {b})")
-        if result == "error":
-            return "Error adding that relationship!"
-        elif result == "exists":
-            return "OK! I already knew that."
-        
-    elif rel == "cousin":
-        # Check for cousin contradictions
-        if check_cousin_contradiction(a, b):
-            return "That's impossible!"
-        existing = safe_prolog_query(f"cousin({a}, {b})")
-        if existing:
-            return "OK! I already knew that."
-        # Add symmetric cousin relationship
-        assert_once(f"cousin({a}, {b})")
-        assert_once(f"cousin({b}, {a})")
-        
-    elif rel in ["husband", "wife", "spouse"]:
-        existing_spouse_a = safe_prolog_query(f"married({a}, _)")
-        existing_spouse_b = safe_prolog_query(f"married({b}, _)")
-        
-        if existing_spouse_a:
-            return f"That's impossible! {a.capitalize()} is already married."
-        if existing_spouse_b:
-            return f"That's impossible! {b.capitalize()} is already married."
-        
-        existing_marriage = safe_prolog_query(f"married({a}, {b})") or safe_prolog_query(f"married({b}, {a})")
-        if existing_marriage:
-            return "OK! I already knew that."
-            
-        result1 = assert_once(f"married({a}, {b})")
-        result2 = assert_once(f"married({b}, {a})")
-        if result1 == "error" or result2 == "error":
-            return "Error adding that relationship!"
-
-    # Assert gender after all checks pass (for new facts)
-    if gender:
-        assert_once(f"{gender}({a})")
-
-    return "OK! I learned something."
-
-
-def handle_siblings(match):
-    a, b = match.groups()
-    a, b = a.lower(), b.lower()
-
-    if not is_valid_name(a) or not is_valid_name(b):
-        if a.lower() == 'who' or b.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    if check_self_relation(a, b):
-        return "That's impossible!"
-
-    # Use the same smart inference logic as handle_single_relation
-    return handle_sibling_with_smart_inference(a, b, "sibling")
-
-def handle_siblings_of(match):
-    """Handle 'X and Y are brothers/sisters of Z'"""
-    person1, person2, relation, target = match.groups()
-    person1, person2, target = person1.lower(), person2.lower(), target.lower()
-    
-    # Validate names
-    if not all(is_valid_name(name) for name in [person1, person2, target]):
-        if 'who' in [person1.lower(), person2.lower(), target.lower()]:
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-    
-    # Check for self-relations
-    if target in [person1, person2]:
-        return "That's impossible!"
-    
-    # Determine gender from relation
-    if relation.startswith('brother'):
-        gender1 = gender2 = "male"
-    else:  # sisters
-        gender1 = gender2 = "female"
-    
-    # Check for gender contradictions
-    if check_contradiction(person1, gender1) or check_contradiction(person2, gender2):
-        return "That's impossible!"
-    
-    # Use the smart sibling inference for both relationships
-    handle_sibling_with_smart_inference(person1, target, relation)
-    handle_sibling_with_smart_inference(person2, target, relation)
-    
-    # Assert genders
-    assert_once(f"{gender1}({person1})")
-    assert_once(f"{gender2}({person2})")
-    
-    # Also make person1 and person2 siblings of each other
-    handle_sibling_with_smart_inference(person1, person2, relation)
-    
-    return "OK! I learned something."
-
-def check_cousin_contradiction(person1, person2):
-    """Check if making person1 and person2 cousins would create a contradiction"""
-    person1, person2 = person1.lower(), person2.lower()
-    
-    try:
-        # Check if they are already parent-child related
-        if (safe_prolog_query(f"parent({person1}, {person2})") or 
-            safe_prolog_query(f"parent({person2}, {person1})")):
-            return True
-            
-        # Check if they are already grandparent-grandchild related
-        if (safe_prolog_query(f"grandparent({person1}, {person2})") or 
-            safe_prolog_query(f"grandparent({person2}, {person1})")):
-            return True
-            
-        # Check if they are already uncle/aunt - nephew/niece related
-        if (safe_prolog_query(f"uncle({person1}, {person2})") or 
-            safe_prolog_query(f"uncle({person2}, {person1})") or
-            safe_prolog_query(f"aunt({person1}, {person2})") or 
-            safe_prolog_query(f"aunt({person2}, {person1})")):
-            return True
-            
-        # Check if they are siblings (cousins should not be siblings)
-        if safe_prolog_query(f"sibling({person1}, {person2})"):
-            return True
-        
-        # Check if they share any children (co-parents cannot be cousins)
-        children1_result = safe_prolog_query(f"parent({person1}, X)")
-        children1 = {r["X"] for r in children1_result if "X" in r}
-        
-        children2_result = safe_prolog_query(f"parent({person2}, X)")
-        children2 = {r["X"] for r in children2_result if "X" in r}
-        
-        # If they share any children, they cannot be cousins
-        shared_children = children1.intersection(children2)
-        if shared_children:
-            return True
-        
-        # Check if they are married/spouses (spouses cannot be cousins)
-        if (safe_prolog_query(f"married({person1}, {person2})") or 
-            safe_prolog_query(f"married({person2}, {person1})") or
-            safe_prolog_query(f"spouse({person1}, {person2})")):
-            return True
-            
-        return False
-        
-    except Exception:
-        return False
-    
-def handle_cousins(match):
-    """Handle 'X and Y are cousins'"""
-    a, b = match.groups()
-    a, b = a.lower(), b.lower()
-
-    if not is_valid_name(a) or not is_valid_name(b):
-        if a.lower() == 'who' or b.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    if check_self_relation(a, b):
-        return "That's impossible!"
-    
-    # Check for cousin-specific contradictions
-    if check_cousin_contradiction(a, b):
-        return "That's impossible!"
-
-    # Check if cousin relationship already exists
-    existing = safe_prolog_query(f"cousin({a}, {b})")
-    if existing:
-        return "OK! I already knew that."
-
-    # Assert cousin relationship (symmetric)
-    assert_once(f"cousin({a}, {b})")
-    assert_once(f"cousin({b}, {a})")
-    
-    return "OK! I learned something."
-
-
-def handle_spouses(match):
-    """Handle 'X and Y are spouses'"""
-    a, b = match.groups()
-    a, b = a.lower(), b.lower()
-
-    if not is_valid_name(a) or not is_valid_name(b):
-        if a.lower() == 'who' or b.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    if check_self_relation(a, b):
-        return "That's impossible!"
-
-    # Check for existing marriages (prevent bigamy)
-    existing_spouse_a = safe_prolog_query(f"married({a}, _)")
-    existing_spouse_b = safe_prolog_query(f"married({b}, _)")
-    
-    if existing_spouse_a:
-        return f"That's impossible! {a.capitalize()} is already married."
-    if existing_spouse_b:
-        return f"That's impossible! {b.capitalize()} is already married."
-
-    # Check if this exact marriage already exists in either direction
-    existing_marriage = safe_prolog_query(f"married({a}, {b})") or safe_prolog_query(f"married({b}, {a})")
-    if existing_marriage:
-        return "OK! I already knew that."
-
-    # Assert both directions
-    result1 = assert_once(f"married({a}, {b})")
-    result2 = assert_once(f"married({b}, {a})")
-    if result1 == "error" or result2 == "error":
-        return "Error adding that relationship!"
-    
-    return "OK! I learned something."
+            handler = form["handler"]
+            break
 
-def trigger_sibling_uncle_aunt_inference():
-    """Trigger uncle/aunt inference when new parent relationships are added"""
     try:
-        # Find all people who have siblings
-        all_people = set()
-        
-        # Get all people from sibling relationships
-        sibling_results = safe_prolog_query("sibling(X, Y)")
-        for result in sibling_results:
-            if "X" in result and "Y" in result:
-                all_people.add(result["X"])
-                all_people.add(result["Y"])
-        
-        # For each person who has siblings
-        for person in all_people:
-            # Get their siblings
-            siblings_query = safe_prolog_query(f"sibling({person}, X)")
-            siblings = {r["X"] for r in siblings_query if "X" in r}
-            
-            # Get their children
-            children_query = safe_prolog_query(f"parent({person}, Y)")
-            children = {r["Y"] for r in children_query if "Y" in r}
-            
-            # Make each sibling an uncle/aunt of each child
-            for sibling in siblings:
-                for child in children:
-                    if safe_prolog_query(f"male({sibling})"):
-                        existing = safe_prolog_query(f"uncle({sibling}, {child})")
-                        if not existing:
-                            assert_once(f"uncle({sibling}, {child})")
-                    elif safe_prolog_query(f"female({sibling})"):
-                        existing = safe_prolog_query(f"aunt({sibling}, {child})")
-                        if not existing:
-                            assert_once(f"aunt({sibling}, {child})")
-                            
+        with transaction():
+            if handler:
+                return handler(match)
+            claims = message_claims(prompt)
+            if claims:
+                return learn(claims)
+    except ReadOnlyKB:
+        return READ_ONLY_ANSWER
+    except Contradiction as e:
+        return str(e)
     except Exception as e:
-        print(f"Debug: Error in sibling uncle/aunt inference: {e}")
-
-def handle_parents(match):
-    a, b, c = match.groups()
-    a, b, c = a.lower(), b.lower(), c.lower()
-
-    if not all(is_valid_name(name) for name in [a, b, c]):
-        if 'who' in [a.lower(), b.lower(), c.lower()]:
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    if c in [a, b]:
-        return "That's impossible!"
-    
-    if check_would_create_cycle(a, c) or check_would_create_cycle(b, c):
-        return "That's impossible!"
-
-    # Check if relationships already exist
-    existing1 = safe_prolog_query(f"parent({a}, {c})")
-    existing2 = safe_prolog_query(f"parent({b}, {c})")
-    
-    if existing1 and existing2:
-        return "OK! I already knew that."
-
-    result1 = assert_once(f"parent({a}, {c})")
-    result2 = assert_once(f"parent({b}, {c})")
-    
-    if result1 == "error" or result2 == "error":
-        return "Error adding that relationship!"
-    
-    # Trigger uncle/aunt inference after adding parents
-    trigger_sibling_uncle_aunt_inference()
-    
-    # If one was new and one existed, still say we learned something
-    if result1 == "new" or result2 == "new":
-        return "OK! I learned something."
-    else:
-        return "OK! I already knew that."
-
-def handle_children(match):
-    groups = match.groups()
-    parent = groups[-1].lower()
-    children = [name.lower() for name in groups[:-1] if name and name.isalpha()]
-
-    if not is_valid_name(parent):
-        if parent.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    all_exist = True
-    for child in children:
-        if not is_valid_name(child):
-            if child.lower() == 'who':
-                return "Invalid name! 'Who' is a reserved word for questions."
-            return "Names should only contain letters and cannot be reserved words!"
-        if check_self_relation(child, parent):
-            return "That's impossible!"
-        if check_would_create_cycle(parent, child):
-            return "That's impossible!"
-        result = assert_once(f"parent({parent}, {child})")
-        if result == "new":
-            all_exist = False
-    
-    return "OK! I already knew that." if all_exist else "OK! I learned something."
-
-def handle_two_children(match):
-    """Handle 'X and Y are children of Z'"""
-    child1, child2, parent = match.groups()
-    child1, child2, parent = child1.lower(), child2.lower(), parent.lower()
-    
-    if not all(is_valid_name(name) for name in [child1, child2, parent]):
-        if 'who' in [child1.lower(), child2.lower(), parent.lower()]:
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-    
-    if child1 == parent or child2 == parent:
-        return "That's impossible!"
-    
-    if check_would_create_cycle(parent, child1) or check_would_create_cycle(parent, child2):
-        return "That's impossible!"
-    
-    # Check if relationships already exist
-    existing1 = safe_prolog_query(f"parent({parent}, {child1})")
-    existing2 = safe_prolog_query(f"parent({parent}, {child2})")
-    
-    if existing1 and existing2:
-        return "OK! I already knew that."
-    
-    result1 = assert_once(f"parent({parent}, {child1})")
-    result2 = assert_once(f"parent({parent}, {child2})")
-    
-    if result1 == "new" or result2 == "new":
-        return "OK! I learned something."
-    else:
-        return "OK! I already knew that."
-    
-def handle_child_relation(match):
-    child, parent = match.groups()
-    child, parent = child.lower(), parent.lower()
-    
-    if not is_valid_name(child) or not is_valid_name(parent):
-        if child.lower() == 'who' or parent.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-    
-    if check_self_relation(child, parent):
-        return "That's impossible!"
-    
-    if check_would_create_cycle(parent, child):
-        return "That's impossible!"
-    
-    result = assert_once(f"parent({parent}, {child})")
-    if result == "error":
-        return "Error adding that relationship!"
-    elif result == "exists":
-        return "OK! I already knew that."
-    return "OK! I learned something."
-
-def handle_marriage(match):
-    """Handle 'X and Y are married'"""
-    a, b = match.groups()
-    a, b = a.lower(), b.lower()
+        return f"Sorry, I encountered an error processing that statement: {str(e)}"
 
-    if not is_valid_name(a) or not is_valid_name(b):
-        if a.lower() == 'who' or b.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
+    return "Sorry, I can't understand that statement format. Try using patterns like 'X is the father of Y' or 'X and Y are siblings'."
 
-    if check_self_relation(a, b):
+# === Statement Forms ===
+# Every statement is read as a list of claims "x is the REL of y", using the
+# relation words below. RELATIONS says what each word means: the facts it
+# stores ("x" and "y" stand for the two people), the gender it implies for
+# x, and for the sibling words that it goes through the sibling groups
+# instead. "mutual" relations pair x and y up as "they" for a later clause
+# of the same message. The invariants those facts must keep are declared in
+# constraints.py. learn() applies a list of claims: names are validated and
+# interned once, each fact is looked up once, and a claim that can't hold
+# rejects the whole statement.
+RELATIONS = {
+    "father": {"gender": "male", "facts": [("parent", "x", "y")]},
+    "mother": {"gender": "female", "facts": [("parent", "x", "y")]},
+    "parent": {"facts": [("parent", "x", "y")]},
+    "son": {"gender": "male", "facts": [("parent", "y", "x")]},
+    "daughter": {"gender": "female", "facts": [("parent", "y", "x")]},
+    "child": {"facts": [("parent", "y", "x")]},
+    "brother": {"gender": "male", "sibling": True, "mutual": True},
+    "sister": {"gender": "female", "sibling": True, "mutual": True},
+    "sibling": {"sibling": True, "mutual": True},
+    "grandfather": {"gender": "male", "facts": [("grandparent", "x", "y")]},
+    "grandmother": {"gender": "female", "facts": [("grandparent", "x", "y")]},
+    "uncle": {"gender": "male", "facts": [("uncle", "x", "y")]},
+    "aunt": {"gender": "female", "facts": [("aunt", "x", "y")]},
+    "nephew": {"gender": "male", "facts": [("nephew", "x", "y")]},
+    "niece": {"gender": "female", "facts": [("niece", "x", "y")]},
+    "cousin": {"facts": [("cousin", "x", "y"), ("cousin", "y", "x")], "mutual": True},
+    "husband": {"gender": "male", "facts": [("married", "x", "y"), ("married", "y", "x")], "mutual": True},
+    "wife": {"gender": "female", "facts": [("married", "x", "y"), ("married", "y", "x")], "mutual": True},
+    "spouse": {"facts": [("married", "x", "y"), ("married", "y", "x")], "mutual": True},
+}
+RELATION_WORDS = "|".join(RELATIONS)
+
+def relation_facts(x, rel, y):
+    """The stored facts that say x is the rel of y (None for siblings)"""
+    if RELATIONS[rel].get("sibling"):
+        return None
+    people = {"x": x, "y": y}
+    return [(pred, people[first], people[second]) for pred, first, second in RELATIONS[rel]["facts"]]
+
+def invalid_names_answer(names):
+    if "who" in names:
+        return "Invalid name! 'Who' is a reserved word for questions."
+    return "Names should only contain letters and cannot be reserved words!"
+
+def learn(claims):
+    """Apply a statement's claims, (rel, x, y) with lowercase names, as one change"""
+    names = [name for _, x, y in claims for name in (x, y)]
+    if not all(is_valid_name(name) for name in names):
+        return invalid_names_answer(names)
+    if any(x == y for _, x, y in claims):
         return "That's impossible!"
-
-    # Check for existing marriages (prevent bigamy)
-    existing_spouse_a = safe_prolog_query(f"married({a}, _)")
-    existing_spouse_b = safe_prolog_query(f"married({b}, _)")
-    
-    if existing_spouse_a:
-        return f"That's impossible! {a.capitalize()} is already married."
-    if existing_spouse_b:
-        return f"That's impossible! {b.capitalize()} is already married."
-
-    # Check if this exact marriage already exists in either direction
-    existing_marriage = safe_prolog_query(f"married({a}, {b})") or safe_prolog_query(f"married({b}, {a})")
-    if existing_marriage:
+    claims = [(rel, person_id(x), person_id(y)) for rel, x, y in claims]
+
+    genders = {(RELATIONS[rel]["gender"], x) for rel, x, y in claims if "gender" in RELATIONS[rel]}
+    if any(violates(gender, person) for gender, person in genders):
+        raise Contradiction()
+
+    facts = []
+    for rel, x, y in claims:
+        for fact in relation_facts(x, rel, y) or ():
+            if fact not in facts:
+                facts.append(fact)
+    known = {fact for fact in facts if prolog_holds(*fact)}
+    siblings = [claim for claim in claims if RELATIONS[claim[0]].get("sibling")]
+    # Saying a fact that had only been derived makes it hold by itself
+    for fact in known:
+        state_fact(*fact)
+    if facts and len(known) == len(facts) and not siblings:
         return "OK! I already knew that."
 
-    # Assert both directions
-    result1 = assert_once(f"married({a}, {b})")
-    result2 = assert_once(f"married({b}, {a})")
-    if result1 == "error" or result2 == "error":
-        return "Error adding that relationship!"
-    
-    return "OK! I learned something."
-
-def handle_marriage_to(match):
-    """Handle 'X is married to Y'"""
-    a, b = match.groups()
-    a, b = a.lower(), b.lower()
+    new_facts = [fact for fact in facts if fact not in known]
+    # Each new fact must fit the facts asserted ahead of it; a contradiction
+    # rolls the whole statement back
+    for fact in new_facts:
+        check_invariants(fact)
+        try:
+            prolog_query("assertz", fact)
+        except PrologError as e:
+            logger.debug("PrologError: %s", e)
+            raise Contradiction("Error adding that relationship!")
+        record_change("assert", *fact)
+    for gender, person in genders:
+        assert_once(gender, person)
+
+    answer = "OK! I learned something."
+    for rel, x, y in siblings:
+        answer = handle_sibling_with_smart_inference(x, y, rel)
+        if answer == "That's impossible!":
+            raise Contradiction()
+    if len(claims) > 1:
+        answer = "OK! I learned something."
+
+    # Share newly learned parents with their children's sibling groups
+    for pred, parent, child in new_facts:
+        if pred == "parent":
+            trigger_deferred_sibling_inference(child)
+    return answer
+
+DIDNT_KNOW = "I didn't know that anyway."
+
+def forget_relation(a, rel, b):
+    """Forget that a is the rel of b, along with what followed only from it"""
+    a, b = person_id(a), person_id(b)
+    facts = relation_facts(a, rel, b)
+    if facts is None:
+        return "Sorry, I can't forget that someone is a sibling. Tell me which parent to forget instead."
+    results = [forget_fact(*fact) for fact in facts]
+    if all(result is None for result in results):
+        if prolog_holds(rel, a, b):
+            return "I can't forget that on its own: it follows from other things I know."
+        return DIDNT_KNOW
+    if not any(results):
+        return "OK, but it still follows from other things I know."
+    retracted = {fact for result in results if result for fact in result}
+    followers = len(retracted - set(facts))
+    if followers:
+        return f"OK! I forgot that, and {followers} fact{'s' if followers != 1 else ''} that followed from it."
+    return "OK! I forgot that."
+
+def handle_forget(match):
+    a, rel, b = match.groups()
+    a, rel, b = a.lower(), rel.lower(), b.lower()
 
     if not is_valid_name(a) or not is_valid_name(b):
-        if a.lower() == 'who' or b.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-
-    if check_self_relation(a, b):
-        return "That's impossible!"
-
-    # Check for existing marriages (prevent bigamy)
-    existing_spouse_a = safe_prolog_query(f"married({a}, _)")
-    existing_spouse_b = safe_prolog_query(f"married({b}, _)")
-    
-    if existing_spouse_a:
-        return f"That's impossible! {a.capitalize()} is already married."
-    if existing_spouse_b:
-        return f"That's impossible! {b.capitalize()} is already married."
+        return invalid_names_answer([a, b])
+
+    return forget_relation(a, rel, b)
+
+def handle_correction(match):
+    a, rel, b, wrong = match.groups()
+    a, rel, b, wrong = a.lower(), rel.lower(), b.lower(), wrong.lower()
+
+    if not all(is_valid_name(name) for name in [a, b, wrong]):
+        return invalid_names_answer([a, b, wrong])
+
+    forgotten = forget_relation(wrong, rel, b)
+    if not forgotten.startswith("OK! I forgot") and forgotten != DIDNT_KNOW:
+        return forgotten
+    # Both halves stand or fall together
+    learned = parse_statement(f"{a} is the {rel} of {b}")
+    if not learned.startswith("OK"):
+        raise Contradiction(learned)
+    if forgotten == DIDNT_KNOW:
+        return learned
+    return (f"OK! I forgot that {person_name(person_id(wrong))} is the {rel} of {person_name(person_id(b))}, "
+            f"and learned that {person_name(person_id(a))} is.")
+
+# The statement forms parse_statement() understands, tried in order. Each
+# turns its groups (lowercased) into claims for learn(), or has a handler of
+# its own.
+def statement_form(pattern, claims=None, handler=None):
+    form = {"pattern": re.compile(pattern.replace("RELATION", RELATION_WORDS), re.IGNORECASE)}
+    if claims:
+        form["claims"] = claims
+    else:
+        form["handler"] = handler
+    return form
+
+STATEMENTS = [
+    statement_form(r"forget that (\w+) is (?:a |an |the )?(RELATION) of (\w+)", handler=handle_forget),
+    statement_form(r"(\w+) is not (?:a |an |the )?(RELATION) of (\w+)", handler=handle_forget),
+    statement_form(r"actually,? (\w+) is (?:a |an |the )?(RELATION) of (\w+),? not (\w+)", handler=handle_correction),
+    statement_form(r"(\w+) is (?:a |an |the )?(RELATION) of (\w+)",
+                   lambda a, rel, b: [(rel, a, b)]),
+    statement_form(r"(\w+) and (\w+) are siblings",
+                   lambda a, b: [("sibling", a, b)]),
+    statement_form(r"(\w+) and (\w+) are (brothers?|sisters?) of (\w+)",
+                   lambda a, b, rel, c: [(rel.rstrip("s"), a, c), (rel.rstrip("s"), b, c), (rel.rstrip("s"), a, b)]),
+    statement_form(r"(\w+) and (\w+) are cousins",
+                   lambda a, b: [("cousin", a, b)]),
+    statement_form(r"(\w+) and (\w+) are spouses",
+                   lambda a, b: [("spouse", a, b)]),
+    statement_form(r"(\w+) and (\w+) are (?:the )?parents of (\w+)",
+                   lambda a, b, c: [("parent", a, c), ("parent", b, c)]),
+    statement_form(r"(\w+) and (\w+) are children of (\w+)",
+                   lambda a, b, c: [("child", a, c), ("child", b, c)]),
+    statement_form(r"(\w+), (\w+)(?:,? and (\w+))? are children of (\w+)",
+                   lambda a, b, c, p: [("child", child, p) for child in (a, b, c) if child]),
+    statement_form(r"(\w+) is (?:a |an |the )?child of (\w+)",
+                   lambda a, b: [("child", a, b)]),
+    statement_form(r"(\w+) and (\w+) are married",
+                   lambda a, b: [("spouse", a, b)]),
+    statement_form(r"(\w+) is married to (\w+)",
+                   lambda a, b: [("spouse", a, b)]),
+    statement_form(r"(\w+) has (?:a |an |the )?(son|daughter|child|husband|wife|spouse|nephew|niece|cousin) (?:named )?(\w+)",
+                   lambda a, rel, b: [(rel, b, a)]),
+    statement_form(r"(\w+) and (\w+) have (?:a |an |the )?child (?:named )?(\w+)",
+                   lambda a, b, c: [("parent", a, c), ("parent", b, c)]),
+    statement_form(r"show (?:me )?(?:the )?(?:next|more)(?: (\d+))?$", handler=lambda match: handle_show_more(match)),
+]
+
+# === Compound Statements ===
+# A message can say several things at once:
+#   Alice is the mother of Bob and Carol, and Dave is her husband.
+# split_clauses() cuts it at the end of each sentence and at the commas,
+# semicolons and "and"s that start a new clause, pronouns are replaced by the
+# people they refer to earlier in the message, and each clause is read with
+# the statement forms, a trailing list of names ("of Bob and Carol") giving
+# one claim per name. A clause must be read to its end; if any can't be, the
+# message is rejected. The claims of all clauses are learned together, as
+# one change.
+CLAUSE_TOKEN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_ENDS = {".", "!", "?"}
+CONJUNCTIONS = {",", ";", "and"}
+VERBS = {"is", "are", "has", "have"}
+PRONOUNS = {"he": "male", "him": "male", "his": "male",
+            "she": "female", "her": "female",
+            "they": "plural", "them": "plural", "their": "plural"}
+POSSESSIVES = {"his", "her", "their"}
+SUBJECT_PRONOUNS = {"he", "she", "they"}
+NAME_LIST = re.compile(r"(?:(?:,? and |, )\w+)+")
+
+def split_clauses(prompt):
+    """Cut a message into clauses (lists of tokens)"""
+    tokens = CLAUSE_TOKEN.findall(prompt)
+    clauses = [[]]
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in SENTENCE_ENDS:
+            clauses.append([])
+            i += 1
+            continue
+        end = i
+        while end < len(tokens) and tokens[end].lower() in CONJUNCTIONS:
+            end += 1
+        if end == i:
+            clauses[-1].append(tokens[i])
+            i += 1
+        elif has_verb(clauses[-1]) and starts_clause(tokens[end:]):
+            clauses.append([])
+            i = end
+        else:
+            clauses[-1].extend(tokens[i:end])
+            i = end
+    return [clause for clause in clauses if clause]
 
-    # Check if this exact marriage already exists in either direction
-    existing_marriage = safe_prolog_query(f"married({a}, {b})") or safe_prolog_query(f"married({b}, {a})")
-    if existing_marriage:
-        return "OK! I already knew that."
+def has_verb(tokens):
+    return any(token.lower() in VERBS for token in tokens)
 
-    # Assert both directions
-    result1 = assert_once(f"married({a}, {b})")
-    result2 = assert_once(f"married({b}, {a})")
-    if result1 == "error" or result2 == "error":
-        return "Error adding that relationship!"
-    
-    return "OK! I learned something."
+def starts_clause(tokens):
+    """Whether tokens begin a clause of their own: "Dave is", "Tom and Ann are", "her husband is" """
+    words = [token.lower() for token in tokens]
+    if len(words) < 2 or words[0] in CONJUNCTIONS or words[0] in VERBS:
+        return False
+    if words[1] in ("is", "has") or (words[0] in SUBJECT_PRONOUNS and words[1] in VERBS):
+        return True
+    if words[0] in POSSESSIVES and words[1] in RELATIONS:
+        return len(words) > 2 and words[2] in ("is", "are")
+    # A list of names: "Tom and Ann are", "Tom, Ann and Eve have"
+    names = 0
+    for word in words:
+        if word in ("are", "have"):
+            return names > 1
+        if word in VERBS:
+            return False
+        if word not in CONJUNCTIONS:
+            names += 1
+    return False
 
-def handle_has_child(match):
-    parent, child_type, child = match.groups()
-    parent, child = parent.lower(), child.lower()
-    
-    if not is_valid_name(parent) or not is_valid_name(child):
-        if parent.lower() == 'who' or child.lower() == 'who':
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-    
-    if check_self_relation(parent, child):
-        return "That's impossible!"
-    
-    if check_would_create_cycle(parent, child):
-        return "That's impossible!"
-    
-    # Check if relationship already exists
-    existing = safe_prolog_query(f"parent({parent}, {child})")
-    if existing:
-        return "OK! I already knew that."
-    
-    # Determine child's gender
-    if child_type in ["son"]:
-        assert_once(f"male({child})")
-    elif child_type in ["daughter"]:
-        assert_once(f"female({child})")
-    
-    result = assert_once(f"parent({parent}, {child})")
-    if result == "error":
-        return "Error adding that relationship!"
-    
-    return "OK! I learned something."
+def referent(pronoun, mentions, subject=False):
+    """The names a pronoun stands for, from the people mentioned so far"""
+    gender = PRONOUNS[pronoun]
+    # A pronoun subject continues the previous clause's subject when it can
+    if subject and mentions["subject"]:
+        names = mentions["subject"]
+        if gender == "plural" and len(names) > 1:
+            return names
+        if len(names) == 1 and mentions["genders"].get(names[0], gender) == gender:
+            return names
+    if gender == "plural":
+        return mentions["group"]
+    people = [name for name, _ in reversed(mentions["people"])]
+    matching = [name for name in people if mentions["genders"].get(name) == gender]
+    if matching:
+        return [matching[0]]
+    unknown = list(dict.fromkeys(name for name in people if name not in mentions["genders"]))
+    # With more than one candidate, guessing could record the wrong person
+    return unknown if len(unknown) == 1 else None
+
+def resolve_pronouns(tokens, mentions):
+    """Put the names pronouns refer to in their place; None if one is unclear"""
+    words = [token.lower() for token in tokens]
+    # "her husband is Dave" means "Dave is her husband"
+    if len(words) > 3 and words[0] in POSSESSIVES and words[1] in RELATIONS and words[2] in ("is", "are"):
+        tokens = tokens[3:] + [words[2], tokens[0], tokens[1]]
+        words = [token.lower() for token in tokens]
+    resolved = []
+    for i, (token, word) in enumerate(zip(tokens, words)):
+        if word not in PRONOUNS:
+            resolved.append(token)
+            continue
+        names = referent(word, mentions, subject=i == 0 and word in SUBJECT_PRONOUNS)
+        if not names:
+            return None
+        names = " and ".join(names).split()
+        if word in POSSESSIVES and i + 1 < len(words) and words[i + 1] in RELATIONS:
+            # "her husband" becomes "the husband of Alice"
+            resolved.extend(["the", tokens[i + 1], "of"] + names)
+            tokens[i + 1] = words[i + 1] = None
+        else:
+            resolved.extend(names)
+    return [token for token in resolved if token is not None]
 
-def handle_have_child(match):
-    parent1, parent2, child = match.groups()
-    parent1, parent2, child = parent1.lower(), parent2.lower(), child.lower()
-    
-    if not all(is_valid_name(name) for name in [parent1, parent2, child]):
-        if 'who' in [parent1.lower(), parent2.lower(), child.lower()]:
-            return "Invalid name! 'Who' is a reserved word for questions."
-        return "Names should only contain letters and cannot be reserved words!"
-    
-    if child in [parent1, parent2]:
-        return "That's impossible!"
-    
-    if check_would_create_cycle(parent1, child) or check_would_create_cycle(parent2, child):
-        return "That's impossible!"
-    
-    # Check if relationships already exist
-    existing1 = safe_prolog_query(f"parent({parent1}, {child})")
-    existing2 = safe_prolog_query(f"parent({parent2}, {child})")
-    
-    if existing1 and existing2:
-        return "OK! I already knew that."
-    
-    result1 = assert_once(f"parent({parent1}, {child})")
-    result2 = assert_once(f"parent({parent2}, {child})")
-    
-    if result1 == "new" or result2 == "new":
-        return "OK! I learned something."
-    else:
-        return "OK! I already knew that."
+def clause_claims(text):
+    """Read one whole clause with the statement forms; None if none of them fits"""
+    for form in STATEMENTS:
+        if "claims" not in form:
+            continue
+        match = form["pattern"].match(text)
+        if not match:
+            continue
+        words = [group.lower() if group else group for group in match.groups()]
+        claims = form["claims"](*words)
+        if match.end() == len(text):
+            return claims
+        # A list of names after the last one: one claim for each of them
+        rest = NAME_LIST.fullmatch(text[match.end():])
+        if rest and match.lastindex and match.end(match.lastindex) == match.end():
+            for name in re.findall(r"\w+", rest.group(0)):
+                if name.lower() != "and":
+                    claims += form["claims"](*words[:-1], name.lower())
+            return claims
+    return None
+
+def note_mentions(claims, mentions):
+    """Remember who a clause mentioned, for the pronouns of the next ones"""
+    for rel, x, y in claims:
+        mentions["people"] += [(x, rel), (y, rel)]
+        if "gender" in RELATIONS[rel]:
+            mentions["genders"][x] = RELATIONS[rel]["gender"]
+    if len(claims) == 1:
+        rel, x, y = claims[0]
+        if RELATIONS[rel].get("mutual"):
+            mentions["group"] = [x, y]
+    elif claims:
+        # The people that differ between the claims: Bob and Carol in
+        # "Alice is the mother of Bob and Carol"
+        for position in (2, 1):
+            others = list(dict.fromkeys(claim[position] for claim in claims))
+            if len(others) > 1 and len({claim[3 - position] for claim in claims}) == 1:
+                mentions["group"] = others
+                break
+        else:
+            mentions["group"] = list(dict.fromkeys(name for _, x, y in claims for name in (x, y)))
+
+def message_claims(prompt):
+    """The claims of every clause of a message, or None if one can't be read"""
+    mentions = {"people": [], "genders": {}, "group": None, "subject": None}
+    claims = []
+    for tokens in split_clauses(prompt):
+        tokens = resolve_pronouns(tokens, mentions)
+        if tokens is None:
+            raise Contradiction("Sorry, I'm not sure who you mean by that pronoun. Try using their name.")
+        found = clause_claims(" ".join(tokens).replace(" ,", ",").replace(" ;", ";"))
+        if not found:
+            return None
+        for rel, x, y in found:
+            for name in (x, y):
+                if name not in mentions["genders"]:
+                    gender = known_gender(name)
+                    if gender:
+                        mentions["genders"][name] = gender
+        note_mentions(found, mentions)
+        verb = next(i for i, token in enumerate(tokens) if token.lower() in VERBS)
+        mentions["subject"] = [token.lower() for token in tokens[:verb] if token.lower() not in CONJUNCTIONS]
+        claims += found
+    return claims
+
+def known_gender(name):
+    """The gender the KB already records for a name, if any"""
+    if not is_valid_name(name) or name not in person_ids:
+        return None
+    for gender in ("male", "female"):
+        if prolog_holds(gender, person_ids[name]):
+            return gender
+    return None
 
 # === Question Parsing ===
 
+@query_stats.scoped("parse_question")
 def parse_question(prompt):
     prompt = prompt.strip().rstrip("?")
     
     if not prompt:
         return "What would you like to know?"
 
+    # Bring lazily materialized relations up to date before answering
+    with suspended_limits():
+        refresh_materialized()
+
     patterns = [
         (r"Is (\w+) (?:a |an |the )?(father|mother|parent|child|son|daughter|brother|sister|sibling|uncle|aunt|grandfather|grandmother|husband|wife|spouse|nephew|niece|cousin) of (\w+)", handle_yesno_relation),
         (r"Are (\w+) and (\w+) siblings", handle_yesno_sibling),
@@ -1089,7 +1608,11 @@ def parse_question(prompt):
         match = re.match(pattern, prompt, re.IGNORECASE)
         if match:
             try:
-                return handler(match)
+                with handler_limits(handler.__name__):
+                    return handler(match)
+            except QueryLimitExceeded as e:
+                logger.info("Gave up on %r: %s", prompt, e)
+                return TOO_EXPENSIVE
             except Exception as e:
                 return f"Sorry, I encountered an error: {str(e)}"
 
@@ -1124,7 +1647,8 @@ def handle_yesno_relation(match):
             return f"I don't recognize '{rel}'. Try: father, mother, son, daughter, brother, sister, grandfather, grandmother, uncle, aunt."
     
     rel = corrected_rel
-    result = safe_prolog_query(f"{rel}({a}, {b})")
+    a, b = person_id(a), person_id(b)
+    result = prolog_holds(rel, a, b)
     return "Yes!" if result else "No."
 
 def handle_yesno_sibling(match):
@@ -1136,7 +1660,8 @@ def handle_yesno_sibling(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
-    result = safe_prolog_query(f"sibling({a}, {b})")
+    a, b = person_id(a), person_id(b)
+    result = prolog_holds("sibling", a, b)
     return "Yes!" if result else "No."
 
 def handle_yesno_cousins(match):
@@ -1149,7 +1674,8 @@ def handle_yesno_cousins(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
-    result = safe_prolog_query(f"cousin({a}, {b})")
+    a, b = person_id(a), person_id(b)
+    result = prolog_holds("cousin", a, b)
     return "Yes!" if result else "No."
 
 def handle_yesno_spouses(match):
@@ -1165,7 +1691,8 @@ def handle_yesno_spouses(match):
     if check_self_relation(a, b):
         return "No."
     
-    result = safe_prolog_query(f"spouse({a}, {b})")
+    a, b = person_id(a), person_id(b)
+    result = prolog_holds("spouse", a, b)
     return "Yes!" if result else "No."
 
 def handle_yesno_married(match):
@@ -1181,7 +1708,8 @@ def handle_yesno_married(match):
     if check_self_relation(a, b):
         return "No."
     
-    result = safe_prolog_query(f"married({a}, {b})")
+    a, b = person_id(a), person_id(b)
+    result = prolog_holds("married", a, b)
     return "Yes!" if result else "No."
 
 def handle_yesno_married_to(match):
@@ -1197,7 +1725,8 @@ def handle_yesno_married_to(match):
     if check_self_relation(a, b):
         return "No."
     
-    result = safe_prolog_query(f"married({a}, {b})")
+    a, b = person_id(a), person_id(b)
+    result = prolog_holds("married", a, b)
     return "Yes!" if result else "No."
 
 def handle_yesno_children(match):
@@ -1210,12 +1739,13 @@ def handle_yesno_children(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
+    parent = person_id(parent)
     for child in children:
         if not is_valid_name(child):
             if child.lower() == 'who':
                 return "Invalid name! 'Who' is a reserved word for questions."
             return "Names should only contain letters and cannot be reserved words!"
-        if not safe_prolog_query(f"parent({parent}, {child})"):
+        if not prolog_holds("parent", parent, person_id(child)):
             return "No."
     return "Yes!"
 
@@ -1229,9 +1759,11 @@ def handle_yesno_parents(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
-    is_a_parent = bool(safe_prolog_query(f"father({a}, {c})")) or bool(safe_prolog_query(f"mother({a}, {c})"))
+    a, b, c = person_id(a), person_id(b), person_id(c)
+    
+    is_a_parent = prolog_holds("father", a, c) or prolog_holds("mother", a, c)
     
-    is_b_parent = bool(safe_prolog_query(f"father({b}, {c})")) or bool(safe_prolog_query(f"mother({b}, {c})"))
+    is_b_parent = prolog_holds("father", b, c) or prolog_holds("mother", b, c)
     
     return "Yes!" if (is_a_parent and is_b_parent) else "No."
 
@@ -1245,9 +1777,11 @@ def handle_yesno_two_children(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
+    child1, child2, parent = person_id(child1), person_id(child2), person_id(parent)
+    
     # Check if both are children of the parent
-    result1 = safe_prolog_query(f"parent({parent}, {child1})")
-    result2 = safe_prolog_query(f"parent({parent}, {child2})")
+    result1 = prolog_holds("parent", parent, child1)
+    result2 = prolog_holds("parent", parent, child2)
     
     return "Yes!" if (result1 and result2) else "No."
 
@@ -1260,13 +1794,8 @@ def handle_who_married_to(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
-    result = safe_prolog_query(f"married({person}, X)")
-    names = {r["X"] for r in result if "X" in r}
-    
-    if names:
-        return ", ".join(name.capitalize() for name in sorted(names))
-    else:
-        return "No one found."
+    person = person_id(person)
+    return format_names(prolog_values("married", person, None))
 
 def handle_who_spouse(match):
     """Handle 'Who is the spouse of X?'"""
@@ -1277,13 +1806,8 @@ def handle_who_spouse(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
-    result = safe_prolog_query(f"spouse({person}, X)")
-    names = {r["X"] for r in result if "X" in r}
-    
-    if names:
-        return ", ".join(name.capitalize() for name in sorted(names))
-    else:
-        return "No one found."
+    person = person_id(person)
+    return format_names(prolog_values("spouse", person, None))
     
 def handle_list_query(match):
     rel, name = match.groups()
@@ -1295,6 +1819,8 @@ def handle_list_query(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
+    name = person_id(name)
+    
     # Convert plurals to singular for Prolog queries
     plural_to_singular = {
         'siblings': 'sibling',
@@ -1317,43 +1843,15 @@ def handle_list_query(match):
 
     # Special case for "parents" - need to find all parents
     if rel == "parents":
-        fathers = safe_prolog_query(f"father(X, {name})")
-        mothers = safe_prolog_query(f"mother(X, {name})")
-        
-        father_names = {r["X"] for r in fathers if "X" in r}
-        mother_names = {r["X"] for r in mothers if "X" in r}
-        
-        all_parents = father_names.union(mother_names)
-        
-        if all_parents:
-            return ", ".join(n.capitalize() for n in sorted(all_parents))
-        else:
-            return "No one found."
+        return list_page([("father", None, name), ("mother", None, name)])
     
     # Special case for "grandparents"
     if rel == "grandparents":
-        grandfathers = safe_prolog_query(f"grandfather(X, {name})")
-        grandmothers = safe_prolog_query(f"grandmother(X, {name})")
-        
-        grandfather_names = {r["X"] for r in grandfathers if "X" in r}
-        grandmother_names = {r["X"] for r in grandmothers if "X" in r}
-        
-        all_grandparents = grandfather_names.union(grandmother_names)
-        
-        if all_grandparents:
-            return ", ".join(n.capitalize() for n in sorted(all_grandparents))
-        else:
-            return "No one found."
+        return list_page([("grandfather", None, name), ("grandmother", None, name)])
     
     # Special case for "grandchildren"
     if rel == "grandchildren":
-        result = safe_prolog_query(f"grandparent({name}, X)")
-        names = {r["X"] for r in result if "X" in r}
-        
-        if names:
-            return ", ".join(n.capitalize() for n in sorted(names))
-        else:
-            return "No one found."
+        return list_page([("grandparent", name, None)])
     
     # Convert to singular if it's a plural form
     if rel in plural_to_singular:
@@ -1369,19 +1867,81 @@ def handle_list_query(match):
     
     # Special case for children
     if rel == 'child':
-        query = f"child(X, {name})"
+        goal = ("child", None, name)
     elif rel == 'grandchild':
-        query = f"grandparent({name}, X)"
+        goal = ("grandparent", name, None)
     else:
-        query = f"{rel}(X, {name})"
-    
-    result = safe_prolog_query(query)
-    names = {r["X"] for r in result if "X" in r}
-    
-    if names:
-        return ", ".join(n.capitalize() for n in sorted(names))
+        goal = (rel, None, name)
+    
+    return list_page([goal])
+
+# === Paged List Answers ===
+# "Who are the ... of X?" answers are streamed from Prolog and cut off once a
+# page is full, so people with thousands of descendants or cousins never have
+# every solution (duplicates included) materialized at once. "Show next 50"
+# re-runs the same goals and skips what was already shown. An answer that
+# fits one page is sorted; longer ones are paged in the order the store
+# finds them, so together the pages list everyone exactly once.
+LIST_PAGE_SIZE = 50
+last_list_query = {}
+
+def stream_distinct_ids(goals):
+    """Lazily yield the distinct IDs bound by a series of one-variable goals"""
+    seen = set()
+    for goal in goals:
+        try:
+            with closing(iter_prolog_query(*goal)) as solutions:
+                for (pid,) in solutions:
+                    if pid not in seen:
+                        seen.add(pid)
+                        yield pid
+        except PrologError as e:
+            logger.debug("Prolog error for query '%s': %s", goal_text(goal[0], goal[1:]), e)
+
+def list_page(goals, offset=0, page_size=None):
+    """Answer with one page of names, stopping the queries as soon as it is full"""
+    page_size = page_size or LIST_PAGE_SIZE
+    page = []
+    more = False
+    stopped = False
+    with closing(stream_distinct_ids(goals)) as ids:
+        try:
+            for index, pid in enumerate(ids):
+                if index < offset:
+                    continue
+                if len(page) == page_size:
+                    more = True
+                    break
+                page.append(pid)
+        except QueryLimitExceeded:
+            # Answer with what was found in time
+            if not page:
+                raise
+            stopped = True
+    
+    last_list_query.update(goals=goals, offset=offset + len(page), more=more)
+    
+    if not page:
+        return "No one found." if offset == 0 else "There's no one else."
+    if offset == 0 and not more:
+        answer = format_names(page)
     else:
-        return "No one found."
+        answer = ", ".join(person_name(pid) for pid in page)
+    if stopped:
+        return answer + " (and possibly others I ran out of time to look for)"
+    if more:
+        answer += f" (showing {offset + 1}-{offset + len(page)}; say 'show next {page_size}' for more)"
+    return answer
+
+def handle_show_more(match):
+    """Handle 'Show next 50' after a long list answer"""
+    if not last_list_query.get("more"):
+        return "There's nothing more to show."
+    
+    page_size = int(match.group(1)) if match.group(1) else LIST_PAGE_SIZE
+    if page_size <= 0:
+        return "Please ask for at least one more name."
+    return list_page(last_list_query["goals"], last_list_query["offset"], page_size)
 
 def handle_has_relation_question(match):
     person, relation, named_person = match.groups()
@@ -1393,6 +1953,8 @@ def handle_has_relation_question(match):
             return "Invalid name! 'Who' is a reserved word for questions."
         return "Names should only contain letters and cannot be reserved words!"
     
+    person = person_id(person)
+    
     if named_person:
         named_person = named_person.lower()
         if not is_valid_name(named_person):
@@ -1405,7 +1967,8 @@ def handle_has_relation_question(match):
         if corrected_relation is None:
             return f"I don't recognize the relationship '{relation}'. Try using common family relationships."
         
-        result = safe_prolog_query(f"{corrected_relation}({named_person}, {person})")
+        named_person = person_id(named_person)
+        result = prolog_holds(corrected_relation, named_person, person)
         return "Yes!" if result else "No."
     else:
         # Check if person has any relation of that type
@@ -1413,7 +1976,7 @@ def handle_has_relation_question(match):
         if corrected_relation is None:
             return f"I don't recognize the relationship '{relation}'. Try using common family relationships."
         
-        result = safe_prolog_query(f"{corrected_relation}(X, {person})")
+        result = prolog_holds(corrected_relation, None, person)
         return "Yes!" if result else "No."
 
 def handle_count_question(match):
@@ -1433,8 +1996,11 @@ def handle_count_question(match):
         return f"I don't recognize the relationship '{relation}'. Try using common family relationships."
     
     relation = corrected_relation
-    result = safe_prolog_query(f"{relation}(X, {person})")
-    count = len(result)
+    person = person_id(person)
+    # Count inside Prolog so only the number crosses over, and people reached
+    # through several rule clauses are counted once
+    result = safe_prolog_query("count_related", relation, person, None)
+    count = result[0][0] if result else 0
     return f"{count}"
 
 def handle_relative_question(match):
@@ -1450,42 +2016,44 @@ def handle_relative_question(match):
     if a == b:
         return "No."
     
+    a, b = person_id(a), person_id(b)
+    
     # Check all possible relationship types
     relationship_checks = [
-        f"parent({a}, {b})",
-        f"parent({b}, {a})",
-        f"father({a}, {b})",
-        f"father({b}, {a})",
-        f"mother({a}, {b})",
-        f"mother({b}, {a})",
-        f"sibling({a}, {b})",
-        f"brother({a}, {b})",
-        f"brother({b}, {a})",
-        f"sister({a}, {b})",
-        f"sister({b}, {a})",
-        f"grandparent({a}, {b})",
-        f"grandparent({b}, {a})",
-        f"grandfather({a}, {b})",
-        f"grandfather({b}, {a})",
-        f"grandmother({a}, {b})",
-        f"grandmother({b}, {a})",
-        f"uncle({a}, {b})",
-        f"uncle({b}, {a})",
-        f"aunt({a}, {b})",
-        f"aunt({b}, {a})",
-        f"nephew({a}, {b})",
-        f"nephew({b}, {a})",
-        f"niece({a}, {b})",
-        f"niece({b}, {a})",
-        f"cousin({a}, {b})",
-        f"married({a}, {b})",
-        f"married({b}, {a})",
-        f"spouse({a}, {b})"
+        ("parent", a, b),
+        ("parent", b, a),
+        ("father", a, b),
+        ("father", b, a),
+        ("mother", a, b),
+        ("mother", b, a),
+        ("sibling", a, b),
+        ("brother", a, b),
+        ("brother", b, a),
+        ("sister", a, b),
+        ("sister", b, a),
+        ("grandparent", a, b),
+        ("grandparent", b, a),
+        ("grandfather", a, b),
+        ("grandfather", b, a),
+        ("grandmother", a, b),
+        ("grandmother", b, a),
+        ("uncle", a, b),
+        ("uncle", b, a),
+        ("aunt", a, b),
+        ("aunt", b, a),
+        ("nephew", a, b),
+        ("nephew", b, a),
+        ("niece", a, b),
+        ("niece", b, a),
+        ("cousin", a, b),
+        ("married", a, b),
+        ("married", b, a),
+        ("spouse", a, b)
     ]
     
     # Check each relationship type
     for check in relationship_checks:
-        if safe_prolog_query(check):
+        if prolog_holds(*check):
             return "Yes!"
     
     # If no direct relationship found, check if they're connected through family tree
@@ -1517,8 +2085,7 @@ def get_all_ancestors(person):
         checked.add(current)
         
         # Get parents
-        parents_query = safe_prolog_query(f"parent(P, {current})")
-        parents = {r["P"] for r in parents_query if "P" in r}
+        parents = prolog_values("parent", None, current)
         
         for parent in parents:
             if parent not in ancestors and parent != person:
@@ -1530,6 +2097,18 @@ def get_all_ancestors(person):
 # === Main Loop ===
 
 def main():
+    parser = argparse.ArgumentParser(description="Family relationship chatbot")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="DIR",
+                        help="write a collapsed-stack trace of each message to DIR (default: profiles)")
+    parser.add_argument("--backend", choices=BACKENDS, default=backend,
+                        help="where facts are stored (default: prolog, or FAMILY_CHATBOT_BACKEND)")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="answer from a read-only KB snapshot (implies --backend snapshot)")
+    args = parser.parse_args()
+    profiler = Profiler(args.profile) if args.profile else None
+    select_backend("snapshot" if args.snapshot else args.backend, args.snapshot)
+    start_engine_warmup()
+
     print("Welcome to the Family Chatbot!")
     print("Type your statement or question. Type 'exit' to quit.")
     print("Examples:")
@@ -1549,10 +2128,11 @@ def main():
                 print("Bot: Please say something!")
                 continue
                 
-            if prompt.endswith("?"):
-                print("Bot:", parse_question(prompt))
+            kind, parse = ("question", parse_question) if prompt.endswith("?") else ("statement", parse_statement)
+            if profiler:
+                print("Bot:", profiler.profile_message(kind, prompt, parse, prompt))
             else:
-                print("Bot:", parse_statement(prompt))
+                print("Bot:", parse(prompt))
                 
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -0,0 +1,49 @@
+# chatbot_async.py
+# asyncio front end for services and event-loop UIs:
+#   reply = await answer("Who are the cousins of Bob?", timeout=2.0)
+#
+# Messages are handled one at a time on a dedicated thread, since the engine
+# answers one query at a time anyway, so the event loop never waits on
+# Prolog. Questions run under a deadline and an inference budget (see
+# chatbot.resource_limits) and come back as a partial list or a "too
+# expensive" answer instead of hanging. Cancelling the awaiting task, or
+# reaching its timeout, stops the question at its next solution.
+#
+# Statements run without limits: stopping one halfway would leave part of
+# what it says in the KB.
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import chatbot
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_INFERENCES = 5_000_000
+# How long past the deadline to wait for a question to notice it, before
+# answering without it
+GRACE_SECONDS = 1.0
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chatbot")
+
+def answer_blocking(text, timeout=DEFAULT_TIMEOUT, inferences=DEFAULT_INFERENCES, cancelled=None):
+    """Answer a statement or question on the calling thread"""
+    if not text.strip().endswith("?"):
+        return chatbot.parse_statement(text)
+    with chatbot.resource_limits(timeout, inferences, cancelled):
+        return chatbot.parse_question(text)
+
+async def answer(text, timeout=DEFAULT_TIMEOUT, inferences=DEFAULT_INFERENCES):
+    """Answer a statement or question without blocking the event loop"""
+    cancelled = threading.Event()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, answer_blocking, text, timeout, inferences, cancelled)
+    wait = timeout + GRACE_SECONDS if timeout is not None and text.strip().endswith("?") else None
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), wait)
+    except asyncio.TimeoutError:
+        # Stuck inside a single solution; it stops when that one is found
+        cancelled.set()
+        return chatbot.TOO_EXPENSIVE
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
@@ -1,13 +1,15 @@
 # integrated_family_chatbot_gui.py
 import customtkinter as ctk
 import threading
+import argparse
 from datetime import datetime
 import sys
 import os
+from profiling import Profiler
 
 # Import your existing chatbot functions
 try:
-    from chatbot import parse_statement, parse_question, prolog
+    from chatbot import parse_statement, parse_question, start_engine_warmup, select_backend
     print("✅ Successfully imported chatbot functions!")
 except ImportError as e:
     print(f"❌ Error importing chatbot.py: {e}")
@@ -17,12 +19,17 @@ except ImportError as e:
         return "OK! I learned something."
     def parse_question(prompt):
         return "No one found."
+    def start_engine_warmup():
+        pass
+    def select_backend(name, snapshot_path=None):
+        pass
 
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
 class FamilyChatbotGUI:
-    def __init__(self):
+    def __init__(self, profiler=None):
+        self.profiler = profiler
         self.root = ctk.CTk()
         self.root.title("Family Relationship Chatbot")
         self.root.geometry("800x900")
@@ -169,10 +176,11 @@ class FamilyChatbotGUI:
                 return
                 
             # Process with your chatbot logic
-            if message.endswith("?"):
-                response = parse_question(message)
+            kind, parse = ("question", parse_question) if message.endswith("?") else ("statement", parse_statement)
+            if self.profiler:
+                response = self.profiler.profile_message(kind, message, parse, message)
             else:
-                response = parse_statement(message)
+                response = parse(message)
                 
             # Update status
             self.root.after(0, lambda: self.status_label.configure(text="Ready to learn about your family"))
@@ -329,8 +337,20 @@ Let's start building your family tree! 🌳"""
 
 def main():
     """Run the family chatbot GUI"""
+    parser = argparse.ArgumentParser(description="Family relationship chatbot GUI")
+    parser.add_argument("--profile", nargs="?", const="profiles", metavar="DIR",
+                        help="write a collapsed-stack trace of each message to DIR (default: profiles)")
+    parser.add_argument("--backend", choices=["prolog", "columnar", "snapshot"],
+                        help="where facts are stored (default: prolog, or FAMILY_CHATBOT_BACKEND)")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="answer from a read-only KB snapshot (implies --backend snapshot)")
+    args = parser.parse_args()
+    if args.snapshot or args.backend:
+        select_backend("snapshot" if args.snapshot else args.backend, args.snapshot)
+
     print("🚀 Starting Family Chatbot GUI...")
-    app = FamilyChatbotGUI()
+    start_engine_warmup()
+    app = FamilyChatbotGUI(Profiler(args.profile) if args.profile else None)
     app.run()
 
 if __name__ == "__main__":
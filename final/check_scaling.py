@@ -0,0 +1,139 @@
+# check_scaling.py
+# Guards the complexity of the inference triggers. A synthetic family tree
+# is ingested one statement at a time; at each checkpoint size the work done
+# by a statement, by the inference triggers and by the sibling constraint
+# check is counted: Prolog (or store) goals with query_stats.count_calls(),
+# plus reads of the in-memory fact index the constraints and the
+# materialized relations are computed from. The triggers only do work for
+# materialized relations, so the check runs with all of them eager unless
+# --materialize says otherwise, and measures each trigger bringing the
+# caches up to date after a changed parent fact.
+# Counts do not depend on machine speed, so the check is not flaky. It exits
+# non-zero when any of them grows faster than the allowed exponent of the
+# knowledge-base size, or when an operation counts no work at all (it would
+# then no longer be measuring anything), e.g. for CI:
+#   python check_scaling.py --sizes 50 100 200 400 --max-exponent 1.25
+# test_scaling.py runs the same check at smaller sizes with the tests.
+import argparse
+import contextlib
+import math
+import random
+import sys
+
+import chatbot
+import query_stats
+from bench_suite import generate_family
+from columnar import Adjacency
+
+@contextlib.contextmanager
+def counting_index_reads(counter):
+    """Count the adjacency lookups made inside the with-block as "index" """
+    get = Adjacency.get
+    def counted_get(adjacency, node):
+        counter["index"] += 1
+        return get(adjacency, node)
+    Adjacency.get = counted_get
+    try:
+        yield counter
+    finally:
+        Adjacency.get = get
+
+def count_work(func, *args):
+    """Return how many Prolog queries and fact-index reads func(*args) makes"""
+    with query_stats.count_calls() as counter, counting_index_reads(counter):
+        func(*args)
+    return sum(counter.values())
+
+def trigger_work(trigger, parent_facts):
+    """Average work of trigger bringing the caches up to date after each changed fact"""
+    counts = []
+    for fact in parent_facts:
+        chatbot.note_input_change("parent", fact)
+        counts.append(count_work(trigger))
+    return sum(counts) / len(counts)
+
+def growth_exponent(sizes, counts):
+    """Return k such that counts grow like sizes**k between the first and last checkpoint"""
+    if counts[0] <= 0 or counts[-1] <= 0 or sizes[-1] == sizes[0]:
+        return 0.0
+    return math.log(counts[-1] / counts[0]) / math.log(sizes[-1] / sizes[0])
+
+def measure(recent_statements, pairs, parent_facts):
+    """Count the work of each guarded operation at the current size"""
+    pair_ids = [(chatbot.person_id(a), chatbot.person_id(b)) for a, b in pairs]
+    contradiction_work = [count_work(chatbot.violates, "sibling", *pair) for pair in pair_ids]
+    return {
+        "statement": sum(recent_statements) / len(recent_statements),
+        "trigger_full_family_inference": trigger_work(chatbot.trigger_full_family_inference, parent_facts),
+        "trigger_sibling_uncle_aunt_inference": trigger_work(chatbot.trigger_sibling_uncle_aunt_inference, parent_facts),
+        "sibling_constraints": sum(contradiction_work) / len(contradiction_work),
+    }
+
+def run_checks(sizes, window=20, pairs=20, seed=7):
+    """Ingest a synthetic family into the current KB, measuring at each size;
+    return the sizes reached and the counts measured at each"""
+    sizes = sorted(sizes)
+    family = generate_family(sizes[-1] + sizes[-1] // 10, depth=8, branching=2, marriage_rate=0.7,
+                             deferred_ratio=0.3, seed=seed)
+    rng = random.Random(seed)
+
+    measured_sizes = []
+    results = []
+    recent_statements = []
+    checkpoints = list(sizes)
+    for statement in family["statements"]:
+        recent_statements = (recent_statements + [count_work(chatbot.parse_statement, statement)])[-window:]
+        if checkpoints and len(chatbot.person_names) >= checkpoints[0]:
+            checkpoints.pop(0)
+            known = chatbot.person_names[:]
+            checked_pairs = [tuple(rng.sample(known, 2)) for _ in range(pairs)]
+            children = [child for child in family["parents"] if child.lower() in chatbot.person_ids]
+            parent_facts = [(chatbot.person_id(family["parents"][child][0]), chatbot.person_id(child))
+                            for child in rng.sample(children, min(pairs, len(children)))]
+            measured_sizes.append(len(known))
+            results.append(measure(recent_statements, checked_pairs, parent_facts))
+    return measured_sizes, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if the work of a statement grows super-linearly with KB size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400],
+                        help="KB sizes (people) to measure at")
+    parser.add_argument("--max-exponent", type=float, default=1.25,
+                        help="largest allowed growth exponent; 1.0 is linear")
+    parser.add_argument("--window", type=int, default=20, help="statements averaged per checkpoint")
+    parser.add_argument("--pairs", type=int, default=20, help="person pairs checked per checkpoint")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--backend", choices=chatbot.BACKENDS, default=chatbot.backend,
+                        help="fact storage to check")
+    parser.add_argument("--materialize", default="all=eager",
+                        help="materialization policies to check with (default: all=eager)")
+    args = parser.parse_args()
+    chatbot.select_backend(args.backend)
+    for relation, policy in chatbot.parse_materialization(args.materialize).items():
+        chatbot.set_materialization(relation, policy)
+
+    measured_sizes, results = run_checks(args.sizes, args.window, args.pairs, args.seed)
+
+    if len(results) < 2:
+        print("Not enough checkpoints were reached to measure growth")
+        return 1
+
+    failed = False
+    print(f"{'operation':<40} " + " ".join(f"{size:>8}" for size in measured_sizes) + f" {'exponent':>9}")
+    for operation in results[0]:
+        counts = [result[operation] for result in results]
+        exponent = growth_exponent(measured_sizes, counts)
+        if min(counts) <= 0:
+            status = "FAIL (no work counted)"
+        else:
+            status = "FAIL" if exponent > args.max_exponent else "ok"
+        failed = failed or status != "ok"
+        print(f"{operation:<40} " + " ".join(f"{count:>8.0f}" for count in counts) + f" {exponent:>9.2f} {status}")
+
+    if failed:
+        print(f"Work grew faster than size**{args.max_exponent}, or was not counted at all")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
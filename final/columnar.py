@@ -0,0 +1,661 @@
+# columnar.py
+# Array-backed fact storage, an alternative to keeping facts in SWI's
+# dynamic database. parent/2 and the materialized derived facts
+# (grandparent, uncle, ...) are CSR adjacency lists in array('i'), kept in
+# both directions, with recent changes in a small delta buffer that is
+# merged in from time to time. married/2 is one spouse slot per person and
+# male/female are bitsets.
+#
+# FamilyRelations evaluates the rules of family.pl in Python on top of a few
+# storage primitives, and answers goals through the same interface as the
+# prepared Prolog queries: solve(pred, args) yields one tuple of output
+# values per solution, where None marks an output argument. family.pl stays
+# the reference for what each relation means; answers here are the same
+# sets, without the duplicates that multi-clause rules give in Prolog.
+#
+# Like the chatbot itself, this store allows one spouse per person.
+#
+# The rule results of the MATERIALIZABLE relations can also be kept in a
+# cache (see chatbot.MATERIALIZATION); while a relation is in materialized
+# its lookups read the cache instead of evaluating the rules. The cache is
+# filled and emptied through update_cache/3 and set_materialized/2, the same
+# goals family.pl defines.
+from array import array
+from collections import deque
+
+class UnknownPredicate(LookupError):
+    """Raised for a goal the columnar backend has no definition for"""
+
+class Bitset:
+    """A growable set of small non-negative integers, one bit each"""
+
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, i):
+        if i >> 3 >= len(self.bits):
+            self.bits.extend(bytes((i >> 3) + 1 - len(self.bits)))
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    def discard(self, i):
+        if i >> 3 < len(self.bits):
+            self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def __contains__(self, i):
+        return i >> 3 < len(self.bits) and self.bits[i >> 3] >> (i & 7) & 1 == 1
+
+    def __iter__(self):
+        for index, byte in enumerate(self.bits):
+            while byte:
+                low = byte & -byte
+                yield index * 8 + low.bit_length() - 1
+                byte ^= low
+
+class Adjacency:
+    """node -> targets, as CSR arrays plus a buffer of recent changes"""
+
+    def __init__(self):
+        self.offsets = array("i", [0])
+        self.targets = array("i")
+        self.added = {}
+        self.removed = set()
+        self.changes = 0
+        self.size = 0
+
+    def get(self, node):
+        """Return the targets of node"""
+        if node + 1 < len(self.offsets):
+            items = self.targets[self.offsets[node]:self.offsets[node + 1]]
+            if self.removed:
+                items = [t for t in items if (node, t) not in self.removed]
+        else:
+            items = ()
+        extra = self.added.get(node)
+        return list(items) + extra if extra else items
+
+    def add(self, node, target):
+        if (node, target) in self.removed:
+            self.removed.discard((node, target))
+        else:
+            self.added.setdefault(node, []).append(target)
+        self.size = max(self.size, node + 1)
+        self.changed()
+
+    def remove(self, node, target):
+        extra = self.added.get(node)
+        if extra and target in extra:
+            extra.remove(target)
+        else:
+            self.removed.add((node, target))
+        self.changed()
+
+    def changed(self):
+        self.changes += 1
+        if self.changes > 4096 and self.changes > len(self.targets) // 4:
+            self.compact()
+
+    def compact(self):
+        """Merge the change buffer into the CSR arrays"""
+        offsets, targets = array("i", [0]), array("i")
+        for node in range(self.size):
+            targets.extend(self.get(node))
+            offsets.append(len(targets))
+        self.offsets, self.targets = offsets, targets
+        self.added, self.removed, self.changes = {}, set(), 0
+
+    def nbytes(self):
+        return (len(self.offsets) + len(self.targets)) * self.targets.itemsize
+
+class EdgeTable:
+    """A stored binary relation, indexed in both directions"""
+
+    def __init__(self):
+        self.forward = Adjacency()
+        self.backward = Adjacency()
+
+    def targets(self, a):
+        return self.forward.get(a)
+
+    def sources(self, b):
+        return self.backward.get(b)
+
+    def contains(self, a, b):
+        return b in self.forward.get(a)
+
+    def add(self, a, b):
+        if self.contains(a, b):
+            return False
+        self.forward.add(a, b)
+        self.backward.add(b, a)
+        return True
+
+    def remove(self, a, b):
+        if not self.contains(a, b):
+            return False
+        self.forward.remove(a, b)
+        self.backward.remove(b, a)
+        return True
+
+    def nbytes(self):
+        return self.forward.nbytes() + self.backward.nbytes()
+
+class Relation:
+    """A binary relation given by its two lookup directions"""
+
+    def __init__(self, forward, backward, holds=None):
+        self.forward = forward      # x -> {y : R(x, y)}
+        self.backward = backward    # y -> {x : R(x, y)}
+        self.holds = holds or (lambda x, y: y in self.forward(x))
+
+class Property:
+    """A unary relation such as male/1"""
+
+    def __init__(self, holds, members):
+        self.holds = holds
+        self.members = members
+
+# Materialized derived facts that the inference passes assert
+DERIVED_TABLES = ["grandparent", "uncle", "aunt", "nephew", "niece", "cousin"]
+MATERIALIZABLE = ["grandparent", "uncle", "aunt"]
+
+class FamilyRelations:
+    """The rules of family.pl evaluated over storage primitives
+
+    Subclasses provide people_count(), parents(c), children(p), spouse_of(p)
+    (-1 for none), is_male(p), is_female(p), group_roots(p) and
+    group_members(root) (the sibling_group/2 facts) and stored(name), the
+    table of materialized facts for one of DERIVED_TABLES, with
+    targets/sources/contains.
+    """
+
+    def setup_relations(self):
+        self.steps = 0
+        self.cache = {name: EdgeTable() for name in MATERIALIZABLE}
+        self.materialized = set()
+        self.properties = {
+            "male": Property(self.is_male, lambda: (p for p in range(self.people_count()) if self.is_male(p))),
+            "female": Property(self.is_female, lambda: (p for p in range(self.people_count()) if self.is_female(p))),
+            "gender_conflict": Property(lambda p: self.is_male(p) and self.is_female(p),
+                                        lambda: (p for p in range(self.people_count())
+                                                 if self.is_male(p) and self.is_female(p))),
+        }
+
+        def gender_filtered(forward, backward, test):
+            # R(X, Y) :- test(X), Base(X, Y)
+            return Relation(lambda x: forward(x) if test(x) else (),
+                            lambda y: {x for x in backward(y) if test(x)})
+
+        def symmetric(lookup):
+            return Relation(lookup, lookup)
+
+        grandparent = Relation(self.grandchildren, self.grandparents)
+        uncle = Relation(lambda u: self.nephews_and_nieces(u, "uncle"), lambda n: self.uncles_or_aunts(n, "uncle"))
+        aunt = Relation(lambda a: self.nephews_and_nieces(a, "aunt"), lambda n: self.uncles_or_aunts(n, "aunt"))
+        self.relations = {
+            "parent": Relation(self.children, self.parents),
+            "father": Relation(lambda p: self.child_likes(p) if self.is_male(p) else (),
+                               lambda c: {p for p in self.parent_likes(c) if self.is_male(p)}),
+            "mother": Relation(lambda p: self.child_likes(p) if self.is_female(p) else (),
+                               lambda c: {p for p in self.parent_likes(c) if self.is_female(p)}),
+            "child": Relation(self.parent_likes, self.child_likes),
+            "son": gender_filtered(self.parent_likes, self.child_likes, self.is_male),
+            "daughter": gender_filtered(self.parent_likes, self.child_likes, self.is_female),
+            "sibling": symmetric(self.siblings),
+            "brother": gender_filtered(self.siblings, self.siblings, self.is_male),
+            "sister": gender_filtered(self.siblings, self.siblings, self.is_female),
+            "grandparent": grandparent,
+            "grandfather": gender_filtered(self.grandchildren, self.grandparents, self.is_male),
+            "grandmother": gender_filtered(self.grandchildren, self.grandparents, self.is_female),
+            "grandchild": Relation(self.grandparents, self.grandchildren),
+            "grandson": gender_filtered(self.grandparents, self.grandchildren, self.is_male),
+            "granddaughter": gender_filtered(self.grandparents, self.grandchildren, self.is_female),
+            "uncle": uncle,
+            "aunt": aunt,
+            "nephew": Relation(lambda n: self.nephew_or_niece_of(n, "nephew"),
+                               lambda ua: self.nephews_or_nieces(ua, "nephew")),
+            "niece": Relation(lambda n: self.nephew_or_niece_of(n, "niece"),
+                              lambda ua: self.nephews_or_nieces(ua, "niece")),
+            "cousin": Relation(lambda c: self.cousins(c, True), lambda c: self.cousins(c, False)),
+            "married": Relation(self.spouses, self.spouses),
+            "sibling_group": Relation(self.group_roots, self.group_members),
+            "spouse": symmetric(self.spouses),
+            "husband": gender_filtered(self.spouses, self.spouses, self.is_male),
+            "wife": gender_filtered(self.spouses, self.spouses, self.is_female),
+            "ancestor": Relation(self.descendants, self.ancestors),
+            "relative": symmetric(self.relatives),
+        }
+        self.builtins = {
+            "count_related": self.solve_count_related,
+            "statistics": self.solve_statistics,
+            "gedcom_person": self.solve_gedcom_person,
+            "gedcom_family": self.solve_gedcom_family,
+            "gedcom_couple": self.solve_gedcom_couple,
+            "cached": self.solve_cached,
+            "update_cache": self.solve_update_cache,
+            "set_materialized": self.solve_set_materialized,
+        }
+
+    # --- Solving goals ---
+
+    def solve(self, pred, args):
+        """Yield one tuple of output values per solution of pred(args...)"""
+        self.steps += 1
+        builtin = self.builtins.get(pred)
+        if builtin:
+            yield from builtin(*args)
+            return
+        if any(arg is not None and not isinstance(arg, int) for arg in args):
+            return  # only people (integers) appear in family facts
+
+        if len(args) == 1 and pred in self.properties:
+            prop = self.properties[pred]
+            if args[0] is None:
+                for person in prop.members():
+                    yield (person,)
+            elif prop.holds(args[0]):
+                yield ()
+            return
+
+        relation = self.relations.get(pred) if len(args) == 2 else None
+        if relation is None:
+            raise UnknownPredicate(f"Unknown procedure: {pred}/{len(args)}")
+        x, y = args
+        if x is not None and y is not None:
+            if relation.holds(x, y):
+                yield ()
+        elif x is not None:
+            for found in relation.forward(x):
+                yield (found,)
+        elif y is not None:
+            for found in relation.backward(y):
+                yield (found,)
+        else:
+            for first in range(self.people_count()):
+                for second in relation.forward(first):
+                    yield (first, second)
+
+    def solve_count_related(self, relation, person, count):
+        lookup = self.relations.get(relation)
+        if lookup is None:
+            raise UnknownPredicate(f"Unknown procedure: {relation}/2")
+        yield (len(set(lookup.backward(person))),)
+
+    def solve_statistics(self, key, value):
+        yield (self.steps,)
+
+    def solve_cached(self, relation, x, y):
+        cache = self.cache[relation]
+        if x is not None:
+            for found in cache.targets(x):
+                if y is None or y == found:
+                    yield (found,) if y is None else ()
+        elif y is not None:
+            for found in cache.sources(y):
+                yield (found,)
+        else:
+            for first in range(cache.forward.size):
+                for second in cache.targets(first):
+                    yield (first, second)
+
+    def solve_update_cache(self, relation, added, removed):
+        cache = self.cache[relation]
+        for _, x, y in removed:
+            cache.remove(x, y)
+        for _, x, y in added:
+            cache.add(x, y)
+        yield ()
+
+    def solve_set_materialized(self, relation, flag):
+        if flag == "true":
+            self.materialized.add(relation)
+        else:
+            self.materialized.discard(relation)
+        yield ()
+
+    # --- Rules of family.pl ---
+
+    def spouses(self, p):
+        spouse = self.spouse_of(p)
+        return (spouse,) if spouse >= 0 else ()
+
+    def gendered(self, p):
+        return self.is_male(p) or self.is_female(p)
+
+    def parent_likes(self, c):
+        """{P : parent(P, C) ; father(P, C) ; mother(P, C)}"""
+        result = set(self.parents(c))
+        for parent in self.parents(c):
+            for spouse in self.spouses(parent):
+                if self.gendered(spouse):
+                    result.add(spouse)
+        return result
+
+    def child_likes(self, p):
+        """{C : parent(P, C) ; father(P, C) ; mother(P, C)}"""
+        result = set(self.children(p))
+        if self.gendered(p):
+            for spouse in self.spouses(p):
+                result.update(self.children(spouse))
+        return result
+
+    def siblings(self, x):
+        result = set()
+        for parent in self.parents(x):
+            result.update(self.children(parent))
+        for parent in self.parent_likes(x):
+            if self.gendered(parent):
+                result.update(self.child_likes(parent))
+        for root in self.group_roots(x):
+            result.update(self.group_members(root))
+        result.discard(x)
+        return result
+
+    def is_sibling(self, x, y):
+        """y in siblings(x), decided from the parents and groups of both
+        instead of listing every sibling"""
+        if x == y:
+            return False
+        parents = set(self.parents(y))
+        if not parents.isdisjoint(self.parents(x)):
+            return True
+        for parent in self.parent_likes(x):
+            if self.gendered(parent) and (parent in parents or not parents.isdisjoint(self.spouses(parent))):
+                return True
+        return not set(self.group_roots(x)).isdisjoint(self.group_roots(y))
+
+    def derived(self, name, person, forward, rule):
+        """Rule results for person, from the cache while name is materialized"""
+        if name in self.materialized:
+            cache = self.cache[name]
+            return cache.targets(person) if forward else cache.sources(person)
+        return rule(person)
+
+    def grandparents(self, c):
+        result = set(self.stored("grandparent").sources(c))
+        result.update(self.derived("grandparent", c, False, self.rule_grandparents))
+        return result
+
+    def grandchildren(self, g):
+        result = set(self.stored("grandparent").targets(g))
+        result.update(self.derived("grandparent", g, True, self.rule_grandchildren))
+        return result
+
+    def uncles_or_aunts(self, n, kind):
+        result = set(self.stored(kind).sources(n))
+        result.update(self.derived(kind, n, False, lambda n: self.rule_uncles_or_aunts(n, kind)))
+        return result
+
+    def nephews_and_nieces(self, ua, kind):
+        result = set(self.stored(kind).targets(ua))
+        result.update(self.derived(kind, ua, True, lambda ua: self.rule_nephews_and_nieces(ua, kind)))
+        return result
+
+    def rule_grandparents(self, c):
+        result = set()
+        for parent in self.parent_likes(c):
+            result.update(self.parents(parent))
+        for parent in self.parents(c):
+            result.update(g for g in self.parent_likes(parent) if self.gendered(g))
+        return result
+
+    def rule_grandchildren(self, g):
+        result = set()
+        for child in self.children(g):
+            result.update(self.child_likes(child))
+        if self.gendered(g):
+            for child in self.child_likes(g):
+                result.update(self.children(child))
+        return result
+
+    def rule_uncles_or_aunts(self, n, kind):
+        test = self.is_male if kind == "uncle" else self.is_female
+        result = set()
+        for parent in self.parent_likes(n):
+            result.update(s for s in self.siblings(parent) if test(s))
+        return result
+
+    def rule_nephews_and_nieces(self, ua, kind):
+        test = self.is_male if kind == "uncle" else self.is_female
+        result = set()
+        if test(ua):
+            for sibling in self.siblings(ua):
+                result.update(self.child_likes(sibling))
+        return result
+
+    def nephew_or_niece_of(self, n, kind):
+        """{UA : nephew(N, UA)} (or niece)"""
+        test = self.is_male if kind == "nephew" else self.is_female
+        result = set(self.stored(kind).targets(n))
+        if test(n):
+            result.update(self.uncles_or_aunts(n, "uncle"))
+            result.update(self.uncles_or_aunts(n, "aunt"))
+        return result
+
+    def nephews_or_nieces(self, ua, kind):
+        """{N : nephew(N, UA)} (or niece)"""
+        test = self.is_male if kind == "nephew" else self.is_female
+        result = set(self.stored(kind).sources(ua))
+        for person in self.nephews_and_nieces(ua, "uncle") | self.nephews_and_nieces(ua, "aunt"):
+            if test(person):
+                result.add(person)
+        return result
+
+    def cousins(self, c, forward):
+        stored = self.stored("cousin")
+        result = set(stored.targets(c) if forward else stored.sources(c))
+        # parent/parent, father/father and mother/mother through siblings
+        for parent in self.parents(c):
+            for sibling in self.siblings(parent):
+                result.update(self.children(sibling))
+        for test in [self.is_male, self.is_female]:
+            for parent in self.parent_likes(c):
+                if test(parent):
+                    for sibling in self.siblings(parent):
+                        if test(sibling):
+                            result.update(self.child_likes(sibling))
+        result.discard(c)
+        return result
+
+    def ancestors(self, d):
+        return self.reachable(d, self.parents)
+
+    def descendants(self, a):
+        return self.reachable(a, self.children)
+
+    def reachable(self, start, step):
+        found, queue = set(), deque(step(start))
+        while queue:
+            person = queue.popleft()
+            if person not in found:
+                found.add(person)
+                queue.extend(step(person))
+        return found
+
+    def relatives(self, x):
+        result = set()
+        for name in ["parent", "father", "mother", "sibling", "grandparent", "uncle", "aunt",
+                     "nephew", "niece", "cousin", "married"]:
+            relation = self.relations[name]
+            result.update(relation.forward(x))
+            result.update(relation.backward(x))
+        return result
+
+    # --- GEDCOM export helpers (see family.pl) ---
+
+    def has_facts(self, p):
+        return bool(self.parents(p) or self.children(p) or self.gendered(p) or self.spouse_of(p) >= 0)
+
+    def solve_gedcom_person(self, person, sex):
+        for p in range(self.people_count()):
+            if self.has_facts(p):
+                yield (p, "M" if self.is_male(p) else "F" if self.is_female(p) else "U")
+
+    def split_parents(self, people):
+        people = sorted(people)
+        return [p for p in people if self.is_male(p)], [p for p in people if not self.is_male(p)]
+
+    def solve_gedcom_family(self, fathers, mothers, children):
+        families = {}
+        for child in range(self.people_count()):
+            parents = self.parents(child)
+            if parents:
+                key = tuple(map(tuple, self.split_parents(parents)))
+                families.setdefault(key, []).append(child)
+        for (family_fathers, family_mothers), members in sorted(families.items()):
+            yield (list(family_fathers), list(family_mothers), members)
+
+    def solve_gedcom_couple(self, fathers, mothers):
+        for a in range(self.people_count()):
+            b = self.spouse_of(a)
+            if a < b and not set(self.children(a)) & set(self.children(b)):
+                yield self.split_parents([a, b])
+
+class ColumnarStore(FamilyRelations):
+    """Mutable fact storage in compact arrays"""
+
+    def __init__(self):
+        self.parent = EdgeTable()
+        self.spouse = array("i")
+        self.male = Bitset()
+        self.female = Bitset()
+        self.sibling_group = EdgeTable()
+        self.tables = {name: EdgeTable() for name in DERIVED_TABLES}
+        self.size = 0
+        self.setup_relations()
+        self.builtins.update({
+            "assertz": self.solve_assertz,
+            "retract": self.solve_retract,
+            "assert_new_facts": self.solve_assert_new_facts,
+            "clause": self.solve_clause,
+        })
+
+    # --- Storage primitives ---
+
+    def people_count(self):
+        return self.size
+
+    def parents(self, c):
+        return self.parent.sources(c)
+
+    def children(self, p):
+        return self.parent.targets(p)
+
+    def spouse_of(self, p):
+        return self.spouse[p] if p < len(self.spouse) else -1
+
+    def is_male(self, p):
+        return p in self.male
+
+    def is_female(self, p):
+        return p in self.female
+
+    def group_roots(self, p):
+        return self.sibling_group.targets(p)
+
+    def group_members(self, root):
+        return self.sibling_group.sources(root)
+
+    def stored(self, name):
+        return self.tables[name]
+
+    # --- Changing facts ---
+
+    def touch(self, *people):
+        self.size = max(self.size, max(people) + 1)
+
+    def add_fact(self, pred, *args):
+        """Store one fact; return False if it was already there"""
+        self.touch(*args)
+        if pred == "parent":
+            return self.parent.add(*args)
+        if pred == "married":
+            person, spouse = args
+            if self.spouse_of(person) == spouse:
+                return False
+            for p in (person, spouse):
+                if p >= len(self.spouse):
+                    self.spouse.extend([-1] * (p + 1 - len(self.spouse)))
+            self.spouse[person], self.spouse[spouse] = spouse, person
+            return True
+        if pred in ("male", "female"):
+            bits = self.male if pred == "male" else self.female
+            if args[0] in bits:
+                return False
+            bits.add(args[0])
+            return True
+        if pred == "sibling_group":
+            return self.sibling_group.add(*args)
+        if pred in self.tables:
+            return self.tables[pred].add(*args)
+        raise UnknownPredicate(f"No permission to modify static procedure `{pred}/{len(args)}'")
+
+    def remove_fact(self, pred, *args):
+        """Remove one stored fact; return False if it wasn't there"""
+        if pred == "parent":
+            return self.parent.remove(*args)
+        if pred == "married":
+            person, spouse = args
+            if self.spouse_of(person) != spouse:
+                return False
+            self.spouse[person] = -1
+            if self.spouse_of(spouse) == person:
+                self.spouse[spouse] = -1
+            return True
+        if pred in ("male", "female"):
+            bits = self.male if pred == "male" else self.female
+            if args[0] not in bits:
+                return False
+            bits.discard(args[0])
+            return True
+        if pred == "sibling_group":
+            return self.sibling_group.remove(*args)
+        if pred in self.tables:
+            return self.tables[pred].remove(*args)
+        raise UnknownPredicate(f"No permission to modify static procedure `{pred}/{len(args)}'")
+
+    def stored_facts(self, pred):
+        """Yield the argument tuples of the stored facts of pred"""
+        if pred in ("male", "female"):
+            for person in (self.male if pred == "male" else self.female):
+                yield (person,)
+        elif pred == "married":
+            for person, spouse in enumerate(self.spouse):
+                if spouse >= 0:
+                    yield (person, spouse)
+        elif pred in ("parent", "sibling_group") or pred in self.tables:
+            table = self.parent if pred == "parent" else self.sibling_group if pred == "sibling_group" else self.tables[pred]
+            for a in range(table.forward.size):
+                for b in table.targets(a):
+                    yield (a, b)
+
+    def solve_clause(self, head, body):
+        # clause(Fact, true): stored facts only, as in Prolog
+        pred, pattern = head[0], head[1:]
+        for fact in self.stored_facts(pred):
+            if all(want is None or want == have for want, have in zip(pattern, fact)):
+                yield tuple(have for want, have in zip(pattern, fact) if want is None)
+
+    def solve_assertz(self, fact):
+        self.add_fact(*fact)
+        yield ()
+
+    def solve_retract(self, fact):
+        if self.remove_fact(*fact):
+            yield ()
+
+    def solve_assert_new_facts(self, facts):
+        for fact in facts:
+            self.add_fact(*fact)
+        yield ()
+
+    def compact(self):
+        """Merge every change buffer into its arrays"""
+        for table in [self.parent, self.sibling_group] + list(self.tables.values()):
+            table.forward.compact()
+            table.backward.compact()
+
+    def nbytes(self):
+        """Approximate bytes held by the arrays (change buffers not included)"""
+        return (self.parent.nbytes() + self.sibling_group.nbytes()
+                + sum(table.nbytes() for table in self.tables.values())
+                + len(self.spouse) * self.spouse.itemsize + len(self.male.bits) + len(self.female.bits))
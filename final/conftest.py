@@ -0,0 +1,49 @@
+# conftest.py
+# Shared fixtures for the tests next to the code. They run on the columnar
+# backend, so SWI-Prolog isn't needed:
+#   python -m pytest -q
+import os
+
+os.environ.setdefault("FAMILY_CHATBOT_BACKEND", "columnar")
+
+import pytest
+
+import chatbot
+from columnar import ColumnarStore
+
+def reset_kb():
+    # Materialized relations are switched off on the store that has them
+    for relation in chatbot.MATERIALIZABLE:
+        chatbot.set_materialization(relation, "virtual")
+    chatbot.store = None
+    chatbot.select_backend("columnar")
+    chatbot.person_ids.clear()
+    chatbot.person_names.clear()
+    chatbot.person_base = 0
+    chatbot.fact_index = ColumnarStore()
+    chatbot.justifications.clear()
+    chatbot.dependents.clear()
+    chatbot.sibling_links.clear()
+    chatbot.sibling_members.clear()
+    chatbot.sibling_group_parents.clear()
+    chatbot.last_list_query.clear()
+    return chatbot
+
+@pytest.fixture
+def fresh_kb():
+    """Empty the KB again, for tests that compare several runs"""
+    return reset_kb
+
+@pytest.fixture
+def kb():
+    """A fresh, empty columnar KB with every relation virtual"""
+    return reset_kb()
+
+@pytest.fixture
+def tell(kb):
+    """Tell the chatbot statements, failing on any that isn't accepted"""
+    def tell(*statements):
+        for statement in statements:
+            answer = kb.parse_statement(statement)
+            assert answer.startswith("OK"), f"{statement!r}: {answer}"
+    return tell
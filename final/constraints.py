@@ -0,0 +1,94 @@
+# constraints.py
+# The invariants of the family KB, declared once. They are checked against an
+# index of the stored facts - any FamilyRelations, such as the columnar store
+# or the mirror chatbot keeps next to Prolog - so "would this fact break
+# anything?" costs a few lookups around the people involved instead of a
+# series of Prolog queries. The invariants:
+#   one_gender        nobody is both male and female
+#   acyclic           nobody is their own ancestor
+#   one_spouse        a person has at most one spouse, checked for both of
+#                     the people a marriage names
+#   parent_is_sibling nobody is the parent of their own sibling
+#   siblings_share_child
+#                     siblings don't have a child together
+#   grandparent_not_uncle
+#                     someone's grandparent isn't also their uncle or aunt
+#   not_closer_relatives
+#                     cousins aren't also parent, grandparent, uncle or aunt,
+#                     sibling or spouse of each other
+# INVARIANTS lists the ones each fact can break. "sibling" and "cousin" are
+# statements rather than stored facts, but are checked the same way. Only
+# the acyclic checks walk further than the neighbours of the people involved:
+# they visit the ancestors of one of them.
+
+def makes_cycle(kb, ancestor, descendant):
+    return ancestor == descendant or descendant in kb.ancestors(ancestor)
+
+def lineal(kb, a, b):
+    return a in kb.ancestors(b) or b in kb.ancestors(a)
+
+def co_parent_is_sibling(kb, parent, child):
+    """parent(P, C) when another parent of C is a sibling of P"""
+    others = set(kb.parents(child)) - {parent}
+    return bool(others) and not others.isdisjoint(kb.siblings(parent))
+
+def parent_is_sibling(kb, parent, child):
+    """parent(P, C) when P and C share a parent or a sibling group"""
+    return kb.is_sibling(child, parent)
+
+def sibling_is_parent(kb, a, b):
+    """Siblings a and b when one's parent is the other's sibling"""
+    return (not kb.siblings(b).isdisjoint(kb.parents(a))
+            or not kb.siblings(a).isdisjoint(kb.parents(b)))
+
+def shared_child(kb, a, b):
+    return not set(kb.children(a)).isdisjoint(kb.children(b))
+
+def grandparent_of_nephew(kb, a, b):
+    """Siblings a and b would be uncle or aunt of each other's children"""
+    return (not kb.grandchildren(a).isdisjoint(kb.children(b))
+            or not kb.grandchildren(b).isdisjoint(kb.children(a)))
+
+def is_uncle_or_aunt(kb, person, of):
+    return person in kb.uncles_or_aunts(of, "uncle") or person in kb.uncles_or_aunts(of, "aunt")
+
+def is_grandparent(kb, person, of):
+    return person in kb.grandparents(of)
+
+def has_other_spouse(kb, person, spouse):
+    current = kb.spouse_of(person)
+    return current >= 0 and current != spouse
+
+def either_has_other_spouse(kb, person, spouse):
+    return has_other_spouse(kb, person, spouse) or has_other_spouse(kb, spouse, person)
+
+def closer_relatives(kb, a, b):
+    if b in kb.children(a) or a in kb.children(b):
+        return True
+    if is_grandparent(kb, a, b) or is_grandparent(kb, b, a):
+        return True
+    if is_uncle_or_aunt(kb, a, b) or is_uncle_or_aunt(kb, b, a):
+        return True
+    return b in kb.siblings(a) or kb.spouse_of(a) == b or kb.spouse_of(b) == a
+
+INVARIANTS = {
+    "male": [("one_gender", lambda kb, person: kb.is_female(person))],
+    "female": [("one_gender", lambda kb, person: kb.is_male(person))],
+    "parent": [("acyclic", makes_cycle), ("parent_is_sibling", parent_is_sibling),
+               ("siblings_share_child", co_parent_is_sibling)],
+    "grandparent": [("acyclic", makes_cycle), ("grandparent_not_uncle", is_uncle_or_aunt)],
+    "uncle": [("grandparent_not_uncle", is_grandparent)],
+    "aunt": [("grandparent_not_uncle", is_grandparent)],
+    "married": [("one_spouse", either_has_other_spouse)],
+    "sibling": [("acyclic", lineal), ("parent_is_sibling", sibling_is_parent),
+                ("siblings_share_child", shared_child),
+                ("grandparent_not_uncle", grandparent_of_nephew)],
+    "cousin": [("not_closer_relatives", closer_relatives), ("siblings_share_child", shared_child)],
+}
+
+def violation(kb, pred, *args):
+    """Return the name of the first invariant that pred(args...) would break, or None"""
+    for name, breaks in INVARIANTS.get(pred, ()):
+        if breaks(kb, *args):
+            return name
+    return None
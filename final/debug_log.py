@@ -0,0 +1,61 @@
+# debug_log.py
+# Logging for the chatbot. Debug output is off by default: messages are
+# formatted lazily by the logging module, so a disabled debug call costs a
+# level check and nothing else. Turn it on with enable_debug_logging() or the
+# FAMILY_CHATBOT_DEBUG environment variable:
+#   FAMILY_CHATBOT_DEBUG=1               keep recent messages in memory
+#   FAMILY_CHATBOT_DEBUG=/tmp/bot.log    write them to a rotating log file
+import logging
+import logging.handlers
+import os
+from collections import deque
+
+logger = logging.getLogger("family_chatbot")
+
+class RingBufferHandler(logging.Handler):
+    """Keep only the most recent log messages in memory"""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+ring_buffer = RingBufferHandler()
+ring_buffer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+# With no handlers, logging prints warnings to stderr by itself; once a debug
+# handler is attached that no longer happens, so this one takes over
+stderr_handler = logging.StreamHandler()
+stderr_handler.setLevel(logging.WARNING)
+
+def enable_debug_logging(path=None, capacity=1000, max_bytes=1_000_000, backups=3):
+    """Turn debug output on, into the ring buffer or a rotating file at path"""
+    if path:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    else:
+        ring_buffer.records = deque(ring_buffer.records, maxlen=capacity)
+        handler = ring_buffer
+    for added in (handler, stderr_handler):
+        if added not in logger.handlers:
+            logger.addHandler(added)
+    logger.setLevel(logging.DEBUG)
+    return handler
+
+def disable_debug_logging():
+    """Turn debug output off again; warnings still reach stderr"""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if handler not in (ring_buffer, stderr_handler):
+            handler.close()
+    logger.setLevel(logging.NOTSET)
+
+def recent_debug_messages():
+    """Return the messages currently held in the ring buffer"""
+    return list(ring_buffer.records)
+
+debug_setting = os.environ.get("FAMILY_CHATBOT_DEBUG", "")
+if debug_setting and debug_setting != "0":
+    enable_debug_logging(None if debug_setting == "1" else debug_setting)
@@ -9,7 +9,9 @@
 :- dynamic nephew/2.   
 :- dynamic niece/2.     
 :- dynamic cousin/2.
-:- dynamic sibling_deferred/2.
+:- dynamic sibling_group/2.
+:- dynamic materialized/1.
+:- dynamic cached/3.
 
 :- table father/2.
 :- table mother/2.
@@ -36,17 +38,18 @@ daughter(C, P) :- female(C), mother(P, C).
 sibling(X, Y) :- parent(P, X), parent(P, Y), X \= Y.
 sibling(X, Y) :- father(P, X), father(P, Y), X \= Y.
 sibling(X, Y) :- mother(P, X), mother(P, Y), X \= Y.
-sibling(X, Y) :- sibling_deferred(X, Y).
+sibling(X, Y) :- sibling_group(X, G), sibling_group(Y, G), X \= Y.
 
 brother(B, S) :- male(B), sibling(B, S).
 sister(S, B) :- female(S), sibling(S, B).
 
 % Grandparent relationships
-grandparent(G, C) :- parent(G, P), parent(P, C).
-grandparent(G, C) :- parent(G, P), father(P, C).
-grandparent(G, C) :- parent(G, P), mother(P, C).
-grandparent(G, C) :- father(G, P), parent(P, C).
-grandparent(G, C) :- mother(G, P), parent(P, C).
+grandparent(G, C) :- materialized(grandparent), cached(grandparent, G, C).
+grandparent(G, C) :- \+ materialized(grandparent), parent(G, P), parent(P, C).
+grandparent(G, C) :- \+ materialized(grandparent), parent(G, P), father(P, C).
+grandparent(G, C) :- \+ materialized(grandparent), parent(G, P), mother(P, C).
+grandparent(G, C) :- \+ materialized(grandparent), father(G, P), parent(P, C).
+grandparent(G, C) :- \+ materialized(grandparent), mother(G, P), parent(P, C).
 
 grandfather(G, C) :- male(G), grandparent(G, C).
 grandmother(G, C) :- female(G), grandparent(G, C).
@@ -56,13 +59,29 @@ grandson(GS, GP) :- male(GS), grandparent(GP, GS).
 granddaughter(GD, GP) :- female(GD), grandparent(GP, GD).
 
 % Uncle and aunt relationships
-uncle(U, N) :- male(U), sibling(U, P), parent(P, N).
-uncle(U, N) :- male(U), sibling(U, P), father(P, N).
-uncle(U, N) :- male(U), sibling(U, P), mother(P, N).
-
-aunt(A, N) :- female(A), sibling(A, P), parent(P, N).
-aunt(A, N) :- female(A), sibling(A, P), father(P, N).
-aunt(A, N) :- female(A), sibling(A, P), mother(P, N).
+uncle(U, N) :- materialized(uncle), cached(uncle, U, N).
+uncle(U, N) :- \+ materialized(uncle), male(U), sibling(U, P), parent(P, N).
+uncle(U, N) :- \+ materialized(uncle), male(U), sibling(U, P), father(P, N).
+uncle(U, N) :- \+ materialized(uncle), male(U), sibling(U, P), mother(P, N).
+
+aunt(A, N) :- materialized(aunt), cached(aunt, A, N).
+aunt(A, N) :- \+ materialized(aunt), female(A), sibling(A, P), parent(P, N).
+aunt(A, N) :- \+ materialized(aunt), female(A), sibling(A, P), father(P, N).
+aunt(A, N) :- \+ materialized(aunt), female(A), sibling(A, P), mother(P, N).
+
+% === Materialized Relations ===
+% grandparent/2, uncle/2 and aunt/2 can be answered from cached/3, their rule
+% results kept up to date by chatbot.py (see MATERIALIZATION there), instead
+% of the rules. materialized(Relation) holds while its cache is current.
+set_materialized(Relation, true) :-
+    ( materialized(Relation) -> true ; assertz(materialized(Relation)) ).
+set_materialized(Relation, false) :-
+    retractall(materialized(Relation)).
+
+% Add and remove cached rule results, given as lists of pair(X, Y)
+update_cache(Relation, Added, Removed) :-
+    forall(member(pair(X, Y), Removed), retractall(cached(Relation, X, Y))),
+    forall(member(pair(X, Y), Added), assertz(cached(Relation, X, Y))).
 
 % Nephew and niece relationships (reverse of uncle/aunt)
 nephew(N, UA) :- male(N), uncle(UA, N).
@@ -136,5 +155,34 @@ relative(X, Y) :- married(X, Y).
 relative(X, Y) :- married(Y, X).
 relative(X, Y) :- spouse(X, Y).
 
+% Number of distinct people X with Relation(X, Person), counted without
+% returning every solution (multi-clause rules would otherwise repeat people)
+count_related(Relation, Person, N) :-
+    aggregate_all(count, distinct(X, call(Relation, X, Person)), N).
+
+% Assert each fact of a list unless it is already stored; lets bulk imports
+% add a whole batch in one call
+assert_new_facts(Facts) :-
+    forall(member(Fact, Facts), (clause(Fact, true) -> true ; assertz(Fact))).
+
+% GEDCOM export: every person in the KB with a sex code, and every distinct
+% set of parents with their children (fathers and mothers apart)
+gedcom_person(P, Sex) :-
+    distinct(P, (parent(P, _) ; parent(_, P) ; male(P) ; female(P) ; married(P, _))),
+    ( male(P) -> Sex = 'M' ; female(P) -> Sex = 'F' ; Sex = 'U' ).
+
+child_parents(C, Fathers, Mothers) :-
+    setof(P, parent(P, C), Parents),
+    partition(male, Parents, Fathers, Mothers).
+
+gedcom_family(Fathers, Mothers, Children) :-
+    setof(C, child_parents(C, Fathers, Mothers), Children).
+
+% Married couples without a child together, exported as childless families
+gedcom_couple(Fathers, Mothers) :-
+    married(A, B), A < B,
+    \+ (parent(A, C), parent(B, C)),
+    partition(male, [A, B], Fathers, Mothers).
+
 % Rule to check for gender conflicts
 gender_conflict(X) :- male(X), female(X).
\ No newline at end of file
@@ -0,0 +1,250 @@
+# gedcom.py
+# Streaming GEDCOM import and export for the chatbot's knowledge base.
+#
+# The importer reads the file record by record, so only the current record
+# is held in memory; what grows with the file is the KB itself plus an index
+# of person IDs and parent links used for the contradiction checks. It makes
+# two passes: INDI records first (names and sex), then FAM records (HUSB,
+# WIFE and CHIL), so families may appear before their members in the file.
+# Facts are asserted in batches through assert_new_facts/1, and facts that
+# contradict the KB are skipped and counted:
+#   - a parent link that would make someone their own ancestor
+#   - a sex that conflicts with a gender the KB already has
+#   - a marriage for someone already married to someone else
+#
+# Imported names are the letters of the GEDCOM NAME ("John /Smith/" becomes
+# Johnsmith), since chatbot names are single words. As in conversation, a
+# name the KB already knows refers to the same person; a name already used by
+# another record of the same file gets a letter suffix instead.
+#
+# Usage:
+#   python gedcom.py family.ged --export roundtrip.ged
+#   python gedcom.py family.ged --snapshot family.snap
+import argparse
+import string
+import time
+from collections import Counter
+from contextlib import closing
+
+import chatbot
+from debug_log import logger
+
+BATCH_SIZE = 1000
+
+def read_records(path):
+    """Yield one (xref, tag, lines) tuple per level-0 record of a GEDCOM file
+
+    lines holds the (level, tag, value) of every line below the record.
+    """
+    record = None
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            parts = line.strip().split(" ", 1)
+            if len(parts) < 2 or not parts[0].isdigit():
+                continue
+            level, rest = int(parts[0]), parts[1]
+
+            xref = None
+            if rest.startswith("@"):
+                xref, _, rest = rest.partition(" ")
+            tag, _, value = rest.partition(" ")
+
+            if level == 0:
+                if record:
+                    yield record
+                record = (xref, tag, [])
+            elif record:
+                record[2].append((level, tag, value))
+    if record:
+        yield record
+
+def letter_suffix(number):
+    """Spell a number in letters (0 -> a, 25 -> z, 26 -> aa) so names stay alphabetic"""
+    letters = []
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters.append(string.ascii_lowercase[remainder])
+    return "".join(reversed(letters))
+
+class GedcomImport:
+    """State of one import: the ID index, the fact batch and the counters"""
+
+    def __init__(self):
+        self.xref_ids = {}
+        self.imported_names = set()
+        self.batch = []
+        self.added = Counter()
+        self.rejected = Counter()
+
+        # Index the facts the KB already has, so the checks don't need a
+        # Prolog query per record
+        self.children = {}
+        for parent, child in chatbot.prolog_query("parent", None, None):
+            self.children.setdefault(parent, []).append(child)
+        self.genders = {}
+        for gender in ["male", "female"]:
+            for (person,) in chatbot.prolog_query(gender, None):
+                self.genders[person] = gender
+        self.spouses = dict(chatbot.prolog_query("married", None, None))
+
+    def unique_name(self, name_value):
+        """Turn a GEDCOM NAME into a chatbot name no other record of this file uses"""
+        name = "".join(c for c in name_value if c.isalpha()).lower()
+        if not chatbot.is_valid_name(name):
+            name = "person" + letter_suffix(len(self.xref_ids))
+        base, suffix = name, 0
+        while name in self.imported_names:
+            name = base + letter_suffix(suffix)
+            suffix += 1
+        self.imported_names.add(name)
+        return name
+
+    def add_fact(self, *fact):
+        self.batch.append(fact)
+        self.added[fact[0]] += 1
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Assert the pending batch in a single Prolog call"""
+        if self.batch:
+            try:
+                chatbot.prolog_query("assert_new_facts", self.batch)
+            except chatbot.PrologError as e:
+                logger.warning("Could not assert a batch of %d imported facts: %s", len(self.batch), e)
+                self.rejected["batch_error"] += len(self.batch)
+            else:
+                for fact in self.batch:
+                    chatbot.record_change("assert", *fact)
+            self.batch = []
+
+    def would_create_cycle(self, parent, child):
+        """Check the index for a path from child down to parent"""
+        stack, seen = [child], set()
+        while stack:
+            person = stack.pop()
+            if person == parent:
+                return True
+            if person not in seen:
+                seen.add(person)
+                stack.extend(self.children.get(person, ()))
+        return False
+
+    def add_person(self, xref, lines):
+        name = next((value for level, tag, value in lines if level == 1 and tag == "NAME"), "")
+        person = chatbot.person_id(self.unique_name(name))
+        self.xref_ids[xref] = person
+
+        sex = next((value.strip() for level, tag, value in lines if level == 1 and tag == "SEX"), "")
+        gender = {"M": "male", "F": "female"}.get(sex.upper())
+        if gender:
+            if self.genders.get(person, gender) != gender:
+                logger.debug("Skipping SEX %s of %s: the KB says %s", sex, xref, self.genders[person])
+                self.rejected["gender_conflict"] += 1
+            else:
+                self.genders[person] = gender
+                self.add_fact(gender, person)
+
+    def add_family(self, xref, lines):
+        members = {"HUSB": [], "WIFE": [], "CHIL": []}
+        for level, tag, value in lines:
+            if level == 1 and tag in members:
+                person = self.xref_ids.get(value.strip())
+                if person is None:
+                    self.rejected["unknown_individual"] += 1
+                else:
+                    members[tag].append(person)
+
+        parents = members["HUSB"] + members["WIFE"]
+        if len(members["HUSB"]) == 1 and len(members["WIFE"]) == 1:
+            self.add_marriage(members["HUSB"][0], members["WIFE"][0])
+
+        for child in members["CHIL"]:
+            for parent in parents:
+                if child in self.children.get(parent, ()):
+                    continue
+                if self.would_create_cycle(parent, child):
+                    logger.debug("Skipping parent link in %s: it would create a cycle", xref)
+                    self.rejected["cycle"] += 1
+                    continue
+                self.children.setdefault(parent, []).append(child)
+                self.add_fact("parent", parent, child)
+
+    def add_marriage(self, husband, wife):
+        if self.spouses.get(husband, wife) != wife or self.spouses.get(wife, husband) != husband:
+            self.rejected["already_married"] += 1
+            return
+        self.spouses[husband], self.spouses[wife] = wife, husband
+        self.add_fact("married", husband, wife)
+        self.add_fact("married", wife, husband)
+
+def import_gedcom(path, infer=True):
+    """Stream a GEDCOM file into the KB and return a summary of what was added
+
+    With infer, the grandparent/uncle/aunt inference runs once at the end
+    instead of after every parent link.
+    """
+    start = time.perf_counter()
+    state = GedcomImport()
+    for xref, tag, lines in read_records(path):
+        if tag == "INDI" and xref:
+            state.add_person(xref, lines)
+    for xref, tag, lines in read_records(path):
+        if tag == "FAM":
+            state.add_family(xref, lines)
+    state.flush()
+
+    if infer:
+        chatbot.trigger_full_family_inference()
+
+    return {
+        "people": len(state.xref_ids),
+        "facts": dict(state.added),
+        "rejected": dict(state.rejected),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+def export_gedcom(path):
+    """Stream the KB out as a GEDCOM 5.5.1 file and return what was written"""
+    people = families = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("0 HEAD\n1 SOUR FAMILY_CHATBOT\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n")
+
+        with closing(chatbot.iter_prolog_query("gedcom_person", None, None)) as rows:
+            for person, sex in rows:
+                people += 1
+                f.write(f"0 @I{person}@ INDI\n1 NAME {chatbot.person_name(person)}\n")
+                if sex != "U":
+                    f.write(f"1 SEX {sex}\n")
+
+        for goal in [("gedcom_family", None, None, None), ("gedcom_couple", None, None)]:
+            with closing(chatbot.iter_prolog_query(*goal)) as rows:
+                for row in rows:
+                    families += 1
+                    fathers, mothers = row[0], row[1]
+                    children = row[2] if len(row) > 2 else []
+                    f.write(f"0 @F{families}@ FAM\n")
+                    f.writelines(f"1 HUSB @I{person}@\n" for person in fathers)
+                    f.writelines(f"1 WIFE @I{person}@\n" for person in mothers)
+                    f.writelines(f"1 CHIL @I{person}@\n" for person in children)
+
+        f.write("0 TRLR\n")
+    return {"people": people, "families": families}
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a GEDCOM file into the family chatbot KB")
+    parser.add_argument("gedcom", help="GEDCOM file to import")
+    parser.add_argument("--export", metavar="PATH", help="write the resulting KB back out as GEDCOM")
+    parser.add_argument("--snapshot", metavar="PATH", help="write the resulting KB as a read-only snapshot")
+    parser.add_argument("--no-inference", action="store_true", help="skip the final inference pass")
+    args = parser.parse_args()
+
+    print("Imported:", import_gedcom(args.gedcom, infer=not args.no_inference))
+    if args.export:
+        print("Exported:", export_gedcom(args.export))
+    if args.snapshot:
+        print("Snapshot:", chatbot.save_snapshot(args.snapshot))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# profiling.py
+# Per-message profiling for the CLI and the GUI (their --profile switch).
+# Each message is handled under a deterministic profiler (sys.setprofile)
+# and its self time is written as collapsed stacks, one "frame;frame;frame
+# microseconds" line per stack, which flamegraph.pl, speedscope and inferno
+# read directly. Time is also split into categories: regex matching, typo
+# correction, set operations, Prolog calls and everything else.
+#
+# Output goes to a directory:
+#   0001-statement.folded   one file per message
+#   session.folded          all messages so far, appended to after each one
+#   summary.json            per-message and session totals per category,
+#                           written when the process exits (or on close())
+#
+# Tools that read collapsed stacks add up repeated lines, so session.folded
+# is only ever appended to and each message costs the same I/O however long
+# the session has run.
+#
+# Set operators (a | b, a - b) are not calls, so their time stays with the
+# enclosing function; set methods (intersection, union, ...) are counted.
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Functions whose whole subtree is attributed to a category
+CATEGORY_FUNCTIONS = {
+    "iter_prolog_query": "prolog",
+    "run_prolog_goal": "prolog",
+    "prolog_inferences": "prolog",
+    "levenshtein_distance": "typo_correction",
+    "correct_relationship_typo": "typo_correction",
+}
+CATEGORIES = ["regex", "typo_correction", "set_operations", "prolog", "other"]
+
+def frame_category(code):
+    """Return the category a Python function starts, or None to inherit"""
+    category = CATEGORY_FUNCTIONS.get(code.co_name)
+    if category:
+        return category
+    filename = code.co_filename.replace("\\", "/")
+    if "/pyswip/" in filename:
+        return "prolog"
+    if filename.endswith(("/re.py", "/re/__init__.py", "/re/_compiler.py", "/re/_parser.py",
+                          "/sre_compile.py", "/sre_parse.py")):
+        return "regex"
+    return None
+
+def builtin_category(func):
+    """Return the category of a builtin call, or None to inherit"""
+    owner = getattr(func, "__self__", None)
+    if isinstance(owner, (set, frozenset)):
+        return "set_operations"
+    if isinstance(owner, re.Pattern) or getattr(owner, "__name__", None) in ("re", "_sre"):
+        return "regex"
+    return None
+
+def frame_label(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    if module == "__init__":
+        module = os.path.basename(os.path.dirname(code.co_filename))
+    return f"{module}.{code.co_name}"
+
+def builtin_label(func):
+    return getattr(func, "__qualname__", None) or getattr(func, "__name__", "builtin")
+
+class MessageProfile:
+    """Collapsed-stack self times and category totals for one message"""
+
+    def __init__(self, root):
+        self.stack = [root]
+        self.categories = ["other"]
+        self.stacks = Counter()
+        self.totals = Counter()
+        self.last = time.perf_counter()
+
+    def trace(self, frame, event, arg):
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.stacks[";".join(self.stack)] += elapsed
+        self.totals[self.categories[-1]] += elapsed
+
+        if event == "call":
+            self.stack.append(frame_label(frame.f_code))
+            self.categories.append(frame_category(frame.f_code) or self.categories[-1])
+        elif event == "c_call":
+            self.stack.append(builtin_label(arg))
+            self.categories.append(builtin_category(arg) or self.categories[-1])
+        elif len(self.stack) > 1:
+            # return, c_return and c_exception all close the innermost frame
+            self.stack.pop()
+            self.categories.pop()
+
+        # Start the next interval after the tracer's own work
+        self.last = time.perf_counter()
+
+    def folded_lines(self):
+        return [f"{stack} {round(seconds * 1_000_000)}"
+                for stack, seconds in sorted(self.stacks.items()) if seconds >= 0.0000005]
+
+class Profiler:
+    """Profile messages one at a time and write their traces to output_dir"""
+
+    def __init__(self, output_dir="profiles"):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.session_totals = Counter()
+        self.messages = []
+        # Start a new session file
+        open(os.path.join(output_dir, "session.folded"), "w").close()
+        atexit.register(self.close)
+
+    def profile_message(self, kind, message, func, *args):
+        """Run func(*args) for a message under the profiler and record the trace
+
+        The profiler is installed for the calling thread only, so this works
+        from the GUI's worker threads as well as from the CLI loop.
+        """
+        profile = MessageProfile(kind)
+        previous = sys.getprofile()
+        start = time.perf_counter()
+        sys.setprofile(profile.trace)
+        try:
+            return func(*args)
+        finally:
+            sys.setprofile(previous)
+            elapsed = time.perf_counter() - start
+            self.save(kind, message, profile, elapsed)
+
+    def save(self, kind, message, profile, elapsed):
+        with self.lock:
+            self.count += 1
+            path = os.path.join(self.output_dir, f"{self.count:04d}-{kind}.folded")
+            folded = "\n".join(profile.folded_lines()) + "\n"
+            with open(path, "w") as f:
+                f.write(folded)
+
+            self.session_totals.update(profile.totals)
+            self.messages.append({
+                "index": self.count,
+                "kind": kind,
+                "message": message,
+                "seconds": round(elapsed, 6),
+                "categories": {name: round(profile.totals[name], 6) for name in CATEGORIES},
+                "trace": os.path.basename(path),
+            })
+            with open(os.path.join(self.output_dir, "session.folded"), "a") as f:
+                f.write(folded)
+
+    def close(self):
+        """Write summary.json for the messages profiled so far"""
+        with self.lock:
+            with open(os.path.join(self.output_dir, "summary.json"), "w") as f:
+                json.dump({
+                    "messages": self.messages,
+                    "categories": {name: round(self.session_totals[name], 6) for name in CATEGORIES},
+                }, f, indent=2)
@@ -0,0 +1,179 @@
+# query_stats.py
+# Per-goal instrumentation for the Prolog boundary. When enabled, every query
+# made through chatbot.iter_prolog_query is recorded under its goal template
+# (e.g. "grandparent(_, _)") with call counts, wall time, SWI inference
+# counts and a latency histogram, and queries slower than a threshold are kept
+# in a slow-query log. Totals are also kept per entry point (parse_statement,
+# parse_question) so their real cost can be compared.
+#
+# Recording is off by default. Turn it on with enable() or by setting
+# FAMILY_CHATBOT_QUERY_STATS to 1 (or to a slow-query threshold in ms).
+#
+# Limit hits (see chatbot.resource_limits) are always counted, per handler and
+# kind of limit, in limit_hits.
+#
+# Separately, count_calls() counts the queries made inside a with-block by
+# predicate name. Counting needs no timing, so check_scaling.py uses it to
+# enforce complexity bounds deterministically.
+import contextlib
+import functools
+import json
+import os
+import time
+from collections import Counter, deque
+
+from debug_log import logger
+
+# Upper bounds (in seconds) of the latency histogram buckets; the last bucket
+# holds everything slower
+HISTOGRAM_BOUNDS = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0]
+HISTOGRAM_LABELS = ["<10us", "<100us", "<1ms", "<10ms", "<100ms", "<1s", ">=1s"]
+
+enabled = False
+slow_threshold = 0.05
+goal_stats = {}
+scope_stats = {}
+slow_queries = deque(maxlen=200)
+current_scope = None
+call_counters = []
+limit_hits = {}
+
+def enable(slow_threshold_ms=50):
+    """Start recording query statistics"""
+    global enabled, slow_threshold
+    enabled = True
+    slow_threshold = slow_threshold_ms / 1000
+
+def disable():
+    """Stop recording query statistics (what was recorded is kept)"""
+    global enabled
+    enabled = False
+
+def reset():
+    """Forget everything recorded so far"""
+    goal_stats.clear()
+    scope_stats.clear()
+    slow_queries.clear()
+    limit_hits.clear()
+
+def goal_template(pred, args):
+    """Render a goal with its arguments blanked out, e.g. parent(_, _)"""
+    def render(arg):
+        if isinstance(arg, tuple):
+            return goal_template(arg[0], arg[1:])
+        return "_"
+    return f"{pred}({', '.join(render(arg) for arg in args)})"
+
+def new_entry():
+    return {"calls": 0, "seconds": 0.0, "inferences": 0, "max_seconds": 0.0,
+            "histogram": [0] * len(HISTOGRAM_LABELS)}
+
+def add_sample(entry, seconds, inferences):
+    entry["calls"] += 1
+    entry["seconds"] += seconds
+    entry["inferences"] += inferences
+    entry["max_seconds"] = max(entry["max_seconds"], seconds)
+    for bucket, bound in enumerate(HISTOGRAM_BOUNDS):
+        if seconds < bound:
+            break
+    else:
+        bucket = len(HISTOGRAM_BOUNDS)
+    entry["histogram"][bucket] += 1
+
+def record(pred, args, seconds, inferences):
+    """Record one finished query"""
+    template = goal_template(pred, args)
+    entry = goal_stats.get(template)
+    if entry is None:
+        entry = goal_stats[template] = new_entry()
+    add_sample(entry, seconds, inferences)
+
+    if current_scope is not None:
+        scope = scope_stats[current_scope]
+        scope["queries"] += 1
+        scope["query_seconds"] += seconds
+        scope["inferences"] += inferences
+
+    if seconds >= slow_threshold:
+        slow_queries.append({"template": template, "seconds": seconds,
+                             "inferences": inferences, "scope": current_scope})
+        logger.warning("Slow query %s: %.1f ms, %d inferences", template, seconds * 1000, inferences)
+
+def record_limit_hit(handler, kind):
+    """Count one goal stopped by a resource limit"""
+    hits = limit_hits.setdefault(handler, Counter())
+    hits[kind] += 1
+    logger.info("Resource limit hit in %s: %s", handler, kind)
+
+def scoped(name):
+    """Decorator attributing the queries made by a function to an entry point"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global current_scope
+            if not enabled or current_scope is not None:
+                return func(*args, **kwargs)
+            scope = scope_stats.get(name)
+            if scope is None:
+                scope = scope_stats[name] = {"messages": 0, "seconds": 0.0, "queries": 0,
+                                             "query_seconds": 0.0, "inferences": 0}
+            current_scope = name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                scope["messages"] += 1
+                scope["seconds"] += time.perf_counter() - start
+                current_scope = None
+        return wrapper
+    return decorate
+
+@contextlib.contextmanager
+def count_calls():
+    """Count the queries made inside the with-block, by predicate name"""
+    counter = Counter()
+    call_counters.append(counter)
+    try:
+        yield counter
+    finally:
+        call_counters.remove(counter)
+
+def count_call(pred):
+    """Add one query of pred to every active counter"""
+    for counter in call_counters:
+        counter[pred] += 1
+
+def dump():
+    """Return everything recorded so far as plain data"""
+    return {
+        "goals": {template: dict(entry, histogram=dict(zip(HISTOGRAM_LABELS, entry["histogram"])))
+                  for template, entry in goal_stats.items()},
+        "scopes": {name: dict(scope) for name, scope in scope_stats.items()},
+        "slow_queries": list(slow_queries),
+        "slow_threshold_ms": slow_threshold * 1000,
+        "limit_hits": {handler: dict(hits) for handler, hits in limit_hits.items()},
+    }
+
+def dump_json(path):
+    """Write the recorded statistics to a JSON file"""
+    with open(path, "w") as f:
+        json.dump(dump(), f, indent=2)
+
+def report(top=20):
+    """Return a readable summary of the most expensive goal templates"""
+    lines = [f"{'goal':<40} {'calls':>8} {'total ms':>10} {'avg us':>9} {'inferences':>11}"]
+    ranked = sorted(goal_stats.items(), key=lambda item: item[1]["seconds"], reverse=True)
+    for template, entry in ranked[:top]:
+        average = entry["seconds"] / entry["calls"] * 1_000_000
+        lines.append(f"{template:<40} {entry['calls']:>8} {entry['seconds'] * 1000:>10.1f} "
+                     f"{average:>9.1f} {entry['inferences']:>11}")
+    for name, scope in scope_stats.items():
+        lines.append(f"{name}: {scope['messages']} messages, {scope['queries']} queries, "
+                     f"{scope['seconds'] * 1000:.1f} ms total, {scope['query_seconds'] * 1000:.1f} ms in Prolog")
+    for handler, hits in sorted(limit_hits.items()):
+        lines.append(f"{handler}: limits hit " + ", ".join(f"{kind} x{count}" for kind, count in sorted(hits.items())))
+    return "\n".join(lines)
+
+stats_setting = os.environ.get("FAMILY_CHATBOT_QUERY_STATS", "")
+if stats_setting and stats_setting != "0":
+    enable(50 if stats_setting == "1" else float(stats_setting))
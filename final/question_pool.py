@@ -0,0 +1,172 @@
+# question_pool.py
+# Read-scaling mode: questions are answered by a pool of worker processes,
+# statements by this process alone.
+#
+# Every worker holds a replica of the KB: the snapshot, memory-mapped and so
+# shared between all of them through the page cache, plus the facts from the
+# fact journal that this process - the single writer - appends to as
+# statements come in. Before each question a worker replays the journal
+# lines it hasn't seen, so answers reflect every statement made before the
+# question was asked. Workers never start a Prolog engine.
+#
+# Usage:
+#   python question_pool.py family.snap --workers 4
+#   python question_pool.py family.snap --messages session.txt
+# or from Python:
+#   with QuestionPool("family.snap") as pool:
+#       pool.answer("Bob is the father of Alice.")
+#       pool.answer_many(questions)
+#
+# "Show more" pages through the last list of whichever worker gets it, so
+# paging isn't reliable in the pool; raise chatbot.LIST_PAGE_SIZE instead.
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chatbot
+from debug_log import logger
+
+# === Worker Processes ===
+journal_path = None
+journal_offset = 0
+synced_people = 0
+
+def start_worker(snapshot_path, path):
+    """Open the snapshot as this worker's replica"""
+    global journal_path, synced_people
+    chatbot.select_backend("replica", snapshot_path)
+    chatbot.journal = None
+    journal_path = path
+    synced_people = chatbot.person_count()
+
+def catch_up():
+    """Replay the journal lines the writer added since this worker last looked"""
+    global journal_offset, synced_people
+    if os.path.getsize(journal_path) == journal_offset:
+        return
+    # Names that earlier questions interned here have no facts; drop them so
+    # the writer's numbering of new people applies
+    chatbot.forget_people(synced_people)
+    with open(journal_path, "rb") as f:
+        f.seek(journal_offset)
+        data = f.read()
+    # A line still being written is left for the next question
+    end = data.rfind(b"\n") + 1
+    journal_offset += end
+
+    for line in data[:end].decode("utf-8").splitlines():
+        op, *fields = line.split()
+        if op == "name":
+            pid = chatbot.person_id(fields[1])
+            if pid != int(fields[0]):
+                logger.warning("Journal names %s as %s, but this replica has ID %d", fields[1], fields[0], pid)
+        elif op == "assert":
+            chatbot.store.add_fact(fields[0], *map(int, fields[1:]))
+            chatbot.note_input_change(fields[0], tuple(map(int, fields[1:])))
+        elif op == "retract":
+            chatbot.store.remove_fact(fields[0], *map(int, fields[1:]))
+            chatbot.note_input_change(fields[0], tuple(map(int, fields[1:])))
+    synced_people = chatbot.person_count()
+
+def answer_question(question):
+    catch_up()
+    return chatbot.parse_question(question)
+
+# === Dispatcher ===
+
+def is_question(text):
+    return text.strip().endswith("?")
+
+class QuestionPool:
+    """Answer questions on worker processes and statements here, as the single writer"""
+
+    def __init__(self, snapshot_path, journal_path=None, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.journal_path = journal_path or snapshot_path + ".journal"
+        chatbot.load_snapshot(snapshot_path)
+        # Opened after loading, so the journal holds only what comes next
+        chatbot.journal = open(self.journal_path, "w", encoding="utf-8")
+        # Spawned rather than forked: workers shouldn't inherit the writer's engine
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=start_worker,
+                                            initargs=(snapshot_path, self.journal_path))
+
+    def tell(self, statement):
+        """Apply a statement to the KB and publish its facts to the workers"""
+        try:
+            return chatbot.parse_statement(statement)
+        finally:
+            chatbot.journal.flush()
+
+    def answer(self, text):
+        """Answer one message, a question on a worker or a statement here"""
+        if is_question(text):
+            return self.executor.submit(answer_question, text).result()
+        return self.tell(text)
+
+    def answer_many(self, texts):
+        """Answer messages in order; the questions between two statements run in parallel"""
+        results = []
+        questions = []
+        for text in list(texts) + [None]:
+            if text is not None and is_question(text):
+                questions.append(text)
+                continue
+            if questions:
+                chunk = max(1, len(questions) // (self.workers * 4))
+                results.extend(self.executor.map(answer_question, questions, chunksize=chunk))
+                questions = []
+            if text is not None:
+                results.append(self.tell(text))
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+        chatbot.journal.close()
+        chatbot.journal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer family chatbot questions on a pool of worker processes")
+    parser.add_argument("snapshot", help="KB snapshot the workers start from (see snapshot.py)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--journal", metavar="PATH", help="fact journal (default: SNAPSHOT.journal)")
+    parser.add_argument("--backend", choices=["prolog", "columnar"],
+                        help="where the writer keeps its facts (default: as for chatbot.py)")
+    parser.add_argument("--messages", metavar="FILE",
+                        help="answer the messages of FILE, one per line, and report the time taken")
+    args = parser.parse_args()
+    if args.backend:
+        chatbot.select_backend(args.backend)
+
+    with QuestionPool(args.snapshot, args.journal, args.workers) as pool:
+        if args.messages:
+            with open(args.messages) as f:
+                messages = [line.strip() for line in f if line.strip()]
+            start = time.perf_counter()
+            for message, result in zip(messages, pool.answer_many(messages)):
+                print(f"{message}\n  {result}")
+            elapsed = time.perf_counter() - start
+            print(f"{len(messages)} messages in {elapsed:.3f}s on {args.workers} workers")
+            return
+
+        print("Family Chatbot (question pool). Type 'exit' to quit.")
+        while True:
+            try:
+                prompt = input("> ").strip()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if prompt.lower() in ["exit", "quit", "bye", "goodbye"]:
+                break
+            if prompt:
+                print("Bot:", pool.answer(prompt))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# snapshot.py
+# Read-only KB snapshots that worker processes memory-map instead of each
+# building their own copy of the knowledge base. One file holds:
+#   - the interned names (offsets + UTF-8 data) and the IDs sorted by name
+#   - parent/2, sibling_group/2 and the materialized derived facts as CSR
+#     adjacency in both directions
+#   - the spouse array and the male/female bitsets
+# Every section is a little block of int32s or bytes at a recorded offset, so
+# Snapshot serves queries straight from the mapping: the OS page cache holds
+# the one copy, however many processes open it. Snapshot answers goals with
+# the same solve() interface and rule evaluation as the columnar store.
+#
+# Writers (the process with the live engine) produce snapshots with
+# write_snapshot(); the file is replaced atomically, and readers that already
+# have the old one mapped keep reading it until they reopen. Replica opens a
+# snapshot for changes: its CSR arrays stay in the mapping and new facts go
+# to the columnar store's delta buffers on top.
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from columnar import DERIVED_TABLES, ColumnarStore, FamilyRelations, UnknownPredicate
+
+MAGIC = b"FCKBSNAP"
+VERSION = 1
+EDGE_TABLES = ["parent", "sibling_group"] + DERIVED_TABLES
+SECTIONS = (["name_offsets", "name_data", "name_order", "spouse", "male", "female"]
+            + [f"{table}.{part}" for table in EDGE_TABLES
+               for part in ["fwd_offsets", "fwd_targets", "bwd_offsets", "bwd_targets"]])
+HEADER = struct.Struct("<8sii")
+SECTION_ENTRY = struct.Struct("<qq")
+
+class ReadOnlyKB(UnknownPredicate):
+    """Raised for a goal that would change a read-only snapshot"""
+
+def csr(pairs, people, reverse=False):
+    """Build CSR offsets and targets for a list of (a, b) pairs"""
+    counts = [0] * (people + 1)
+    for a, b in pairs:
+        counts[(b if reverse else a) + 1] += 1
+    offsets = array("i", counts)
+    for i in range(1, len(offsets)):
+        offsets[i] += offsets[i - 1]
+    targets = array("i", bytes(4 * len(pairs)))
+    fill = array("i", offsets)
+    for a, b in pairs:
+        node, target = (b, a) if reverse else (a, b)
+        targets[fill[node]] = target
+        fill[node] += 1
+    return offsets, targets
+
+def bitset_bytes(people, members):
+    bits = bytearray((people + 7) // 8)
+    for person in members:
+        bits[person >> 3] |= 1 << (person & 7)
+    return bytes(bits)
+
+def write_snapshot(path, names, facts):
+    """Write a snapshot file
+
+    names lists the interned name of every person ID; facts(pred) returns
+    the argument tuples of the stored facts of pred (see chatbot.stored_facts).
+    """
+    people = len(names)
+    encoded = [name.encode("utf-8") for name in names]
+    name_offsets = array("i", [0])
+    for data in encoded:
+        name_offsets.append(name_offsets[-1] + len(data))
+    order = sorted(range(people), key=lambda pid: encoded[pid])
+
+    spouse = array("i", [-1] * people)
+    for person, partner in facts("married"):
+        spouse[person], spouse[partner] = partner, person
+
+    sections = {
+        "name_offsets": name_offsets.tobytes(),
+        "name_data": b"".join(encoded),
+        "name_order": array("i", order).tobytes(),
+        "spouse": spouse.tobytes(),
+        "male": bitset_bytes(people, (p for (p,) in facts("male"))),
+        "female": bitset_bytes(people, (p for (p,) in facts("female"))),
+    }
+    for table in EDGE_TABLES:
+        pairs = list(facts(table))
+        for direction, reverse in [("fwd", False), ("bwd", True)]:
+            offsets, targets = csr(pairs, people, reverse)
+            sections[f"{table}.{direction}_offsets"] = offsets.tobytes()
+            sections[f"{table}.{direction}_targets"] = targets.tobytes()
+
+    # Sections start on 8-byte boundaries so every int32 view is aligned
+    position = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    entries = []
+    for name in SECTIONS:
+        position += -position % 8
+        entries.append((position, len(sections[name])))
+        position += len(sections[name])
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, people))
+        for entry in entries:
+            f.write(SECTION_ENTRY.pack(*entry))
+        for name, (offset, size) in zip(SECTIONS, entries):
+            f.write(bytes(offset - f.tell()))
+            f.write(sections[name])
+    os.replace(temporary, path)
+    return {"people": people, "bytes": position}
+
+class CSRView:
+    """A stored binary relation read from snapshot sections"""
+
+    def __init__(self, fwd_offsets, fwd_targets, bwd_offsets, bwd_targets):
+        self.fwd_offsets, self.fwd_targets = fwd_offsets, fwd_targets
+        self.bwd_offsets, self.bwd_targets = bwd_offsets, bwd_targets
+
+    @staticmethod
+    def lookup(offsets, targets, node):
+        if 0 <= node < len(offsets) - 1:
+            return targets[offsets[node]:offsets[node + 1]]
+        return ()
+
+    def targets(self, a):
+        return self.lookup(self.fwd_offsets, self.fwd_targets, a)
+
+    def sources(self, b):
+        return self.lookup(self.bwd_offsets, self.bwd_targets, b)
+
+    def contains(self, a, b):
+        return b in self.targets(a)
+
+class Snapshot(FamilyRelations):
+    """A memory-mapped, read-only knowledge base"""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("Snapshots are little-endian and can't be mapped on this machine")
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.people = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} KB snapshot")
+
+        view = memoryview(self.map)
+        self.sections = {}
+        for index, name in enumerate(SECTIONS):
+            offset, size = SECTION_ENTRY.unpack_from(self.map, HEADER.size + index * SECTION_ENTRY.size)
+            section = view[offset:offset + size]
+            self.sections[name] = section if name in ("name_data", "male", "female") else section.cast("i")
+
+        self.name_offsets = self.sections["name_offsets"]
+        self.name_data = self.sections["name_data"]
+        self.name_order = self.sections["name_order"]
+        self.spouse = self.sections["spouse"]
+        self.male, self.female = self.sections["male"], self.sections["female"]
+        self.tables = {table: CSRView(*(self.sections[f"{table}.{part}"] for part in
+                                        ["fwd_offsets", "fwd_targets", "bwd_offsets", "bwd_targets"]))
+                       for table in EDGE_TABLES}
+
+        self.setup_relations()
+        for pred in ["assertz", "retract", "assert_new_facts"]:
+            self.builtins[pred] = self.solve_read_only
+
+    def solve_read_only(self, *args):
+        raise ReadOnlyKB("No permission to modify a read-only KB snapshot")
+
+    # --- Names ---
+
+    def name(self, pid):
+        """Return the interned (lowercase) name of a person ID"""
+        return bytes(self.name_data[self.name_offsets[pid]:self.name_offsets[pid + 1]]).decode("utf-8")
+
+    def find(self, name):
+        """Return the ID of an interned name, or None, by binary search"""
+        key = name.encode("utf-8")
+
+        class ByName:
+            # Lets bisect compare the sorted ID list by name without copying it
+            def __len__(_):
+                return self.people
+            def __getitem__(_, i):
+                pid = self.name_order[i]
+                return bytes(self.name_data[self.name_offsets[pid]:self.name_offsets[pid + 1]])
+
+        index = bisect_left(ByName(), key)
+        if index < self.people:
+            pid = self.name_order[index]
+            if self.name(pid) == name:
+                return pid
+        return None
+
+    # --- Storage primitives ---
+
+    def people_count(self):
+        return self.people
+
+    def parents(self, c):
+        return self.tables["parent"].sources(c)
+
+    def children(self, p):
+        return self.tables["parent"].targets(p)
+
+    def spouse_of(self, p):
+        return self.spouse[p] if 0 <= p < self.people else -1
+
+    def is_male(self, p):
+        return 0 <= p >> 3 < len(self.male) and self.male[p >> 3] >> (p & 7) & 1 == 1
+
+    def is_female(self, p):
+        return 0 <= p >> 3 < len(self.female) and self.female[p >> 3] >> (p & 7) & 1 == 1
+
+    def group_roots(self, p):
+        return self.tables["sibling_group"].targets(p)
+
+    def group_members(self, root):
+        return self.tables["sibling_group"].sources(root)
+
+    def stored(self, name):
+        return self.tables[name]
+
+    def stored_facts(self, pred):
+        """Yield the argument tuples of the stored facts of pred"""
+        if pred in ("male", "female"):
+            test = self.is_male if pred == "male" else self.is_female
+            for person in range(self.people):
+                if test(person):
+                    yield (person,)
+        elif pred == "married":
+            for person in range(self.people):
+                if self.spouse[person] >= 0:
+                    yield (person, self.spouse[person])
+        else:
+            table = self.tables[pred]
+            for a in range(self.people):
+                for b in table.targets(a):
+                    yield (a, b)
+
+    def nbytes(self):
+        return len(self.map)
+
+class Replica(ColumnarStore):
+    """A snapshot that takes new facts, kept in this process only
+
+    The edge tables read the snapshot's arrays in place until a table has
+    changed enough to be compacted into private memory; the spouse array and
+    the gender bitsets (a few bytes per person) are copied.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.base = Snapshot(path)
+        tables = dict(self.tables, parent=self.parent, sibling_group=self.sibling_group)
+        for name, table in tables.items():
+            view = self.base.tables[name]
+            for adjacency, offsets, targets in [(table.forward, view.fwd_offsets, view.fwd_targets),
+                                                (table.backward, view.bwd_offsets, view.bwd_targets)]:
+                adjacency.offsets, adjacency.targets = offsets, targets
+                adjacency.size = len(offsets) - 1
+        self.spouse = array("i", self.base.spouse)
+        self.male.bits = bytearray(self.base.male)
+        self.female.bits = bytearray(self.base.female)
+        self.size = self.people = self.base.people
+
+    def name(self, pid):
+        return self.base.name(pid)
+
+    def find(self, name):
+        return self.base.find(name)
@@ -0,0 +1,37 @@
+import constraints
+
+def test_parent_of_own_sibling_is_rejected(kb, tell):
+    tell("Eve and Frank are siblings", "Eve is the daughter of Gina")
+    assert kb.parse_statement("Frank is the father of Eve") == "That's impossible!"
+    assert kb.parse_question("Is Frank the parent of Frank?") == "No."
+    assert kb.prolog_values("parent", None, kb.person_id("frank")) == {kb.person_id("gina")}
+
+def test_sibling_of_a_parent_is_rejected(kb, tell):
+    tell("Amy and Bo are siblings", "Pam is the mother of Amy", "Pam and Cy are siblings")
+    assert kb.parse_statement("Bo and Cy are siblings") == "That's impossible!"
+    assert kb.parse_question("Is Pam the parent of Pam?") == "No."
+
+def test_violation_names_the_invariant(kb, tell):
+    tell("Ann is the mother of Ben", "Ben is the father of Cal")
+    ann, cal = kb.person_id("ann"), kb.person_id("cal")
+    assert constraints.violation(kb.index_store(), "parent", cal, ann) == "acyclic"
+    assert constraints.violation(kb.index_store(), "female", cal) is None
+    assert kb.violates("male", ann) == "one_gender"
+
+def test_one_spouse(kb, tell):
+    tell("Kim is married to Lou")
+    assert kb.parse_statement("Tom is the husband of Kim") == "That's impossible! Kim is already married."
+    assert kb.parse_question("Who is Kim married to?") == "Lou"
+
+def test_grandparent_is_not_uncle(kb, tell):
+    tell("Ann is the mother of Ben", "Ben is the father of Cal")
+    assert kb.parse_statement("Ann is the aunt of Cal").startswith("That's impossible!")
+
+def test_cousins_are_not_closer_relatives(kb, tell):
+    tell("Ann is the mother of Ben")
+    assert kb.parse_statement("Ann and Ben are cousins") == "That's impossible!"
+
+def test_facts_of_one_statement_are_checked_against_each_other(kb, tell):
+    tell("Ann and Bob are siblings")
+    assert kb.parse_statement("Ann and Bob are the parents of Cal") == "That's impossible!"
+    assert kb.prolog_query("parent", None, None) == []
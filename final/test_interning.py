@@ -0,0 +1,26 @@
+def test_names_get_dense_ids(kb):
+    assert [kb.person_id(name) for name in ("ann", "ben", "cat")] == [0, 1, 2]
+    assert kb.person_id("Ben") == 1
+    assert kb.person_count() == 3
+
+def test_ids_turn_back_into_names(kb):
+    pid = kb.person_id("Ann")
+    assert kb.interned_name(pid) == "ann"
+    assert kb.person_name(pid) == "Ann"
+    assert kb.format_names([kb.person_id("cat"), pid]) == "Ann, Cat"
+    assert kb.format_names([]) == "No one found."
+
+def test_facts_are_stored_by_id(kb, tell):
+    tell("Ann is the mother of Ben")
+    ann, ben = kb.person_id("ann"), kb.person_id("ben")
+    assert kb.prolog_holds("parent", ann, ben)
+    assert kb.prolog_values("parent", None, ben) == {ann}
+    assert kb.prolog_holds("female", ann)
+
+def test_forget_people_drops_the_newest_names(kb):
+    for name in ("ann", "ben", "cat"):
+        kb.person_id(name)
+    kb.forget_people(1)
+    assert kb.person_count() == 1
+    assert "ben" not in kb.person_ids
+    assert kb.person_id("dan") == 1
@@ -0,0 +1,53 @@
+import pytest
+
+import chatbot
+
+STATEMENTS = [
+    "Gus is the father of Hal", "Hal is the father of Ida", "Hal is married to Jen",
+    "Kim is the sister of Hal", "Ida and Joe are siblings", "Lou is the brother of Hal",
+]
+QUESTIONS = [
+    "Who are the grandchildren of Gus?", "Who are the grandparents of Joe?",
+    "Who are the uncles of Ida?", "Who are the aunts of Joe?",
+    "Who are the nephews of Kim?", "Is Gus the grandfather of Joe?",
+]
+
+def answers(kb):
+    return [kb.parse_question(question) for question in QUESTIONS]
+
+@pytest.mark.parametrize("policy", ["eager", "lazy"])
+def test_policies_answer_like_the_rules(kb, tell, fresh_kb, policy):
+    tell(*STATEMENTS)
+    expected = answers(kb)
+    kb.parse_statement("Forget that Hal is the father of Ida")
+    expected_after = answers(kb)
+
+    fresh_kb()
+    for relation in kb.MATERIALIZABLE:
+        kb.set_materialization(relation, policy)
+    tell(*STATEMENTS)
+    assert answers(kb) == expected
+    kb.parse_statement("Forget that Hal is the father of Ida")
+    assert answers(kb) == expected_after
+
+def test_eager_is_current_after_each_statement(kb, tell):
+    kb.set_materialization("grandparent", "eager")
+    tell("Gus is the father of Hal", "Hal is the father of Ida")
+    assert "grandparent" in kb.materialized_now
+    assert kb.prolog_query("cached", "grandparent", None, None) == [(0, 2)]
+
+def test_lazy_waits_for_a_question(kb, tell):
+    kb.set_materialization("uncle", "lazy")
+    tell("Gus is the father of Hal", "Lou is the son of Gus", "Hal is the father of Ida")
+    assert "uncle" not in kb.materialized_now
+    assert kb.parse_question("Who are the uncles of Ida?") == "Lou"
+    assert "uncle" in kb.materialized_now
+    tell("Max is the son of Gus")
+    assert "uncle" not in kb.materialized_now
+    assert kb.parse_question("Who are the uncles of Ida?") == "Lou, Max"
+
+def test_parse_materialization():
+    assert chatbot.parse_materialization("all=lazy,uncle=eager") == {
+        "grandparent": "lazy", "uncle": "eager", "aunt": "lazy"}
+    with pytest.raises(ValueError):
+        chatbot.parse_materialization("uncle=sometimes")
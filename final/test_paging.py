@@ -0,0 +1,46 @@
+def kid_names(count):
+    return ["Kid" + "".join(chr(ord("a") + int(digit)) for digit in f"{i:03d}") for i in range(count)]
+
+def test_long_lists_are_paged(kb):
+    names = kid_names(120)
+    for name in names:
+        assert kb.parse_statement(f"{name} is a child of Pat").startswith("OK")
+    first = kb.parse_question("Who are the children of Pat?")
+    assert first.endswith("(showing 1-50; say 'show next 50' for more)")
+    assert first.startswith(", ".join(names[:3]))
+    second = kb.parse_statement("show next 50")
+    assert second.startswith(names[50]) and "(showing 51-100;" in second
+    assert kb.parse_statement("show more") == ", ".join(names[100:])
+    assert kb.parse_statement("show more") == "There's nothing more to show."
+
+def test_pages_follow_the_page_size_and_cover_everyone(kb, monkeypatch):
+    names = kid_names(120)
+    for name in reversed(names):
+        assert kb.parse_statement(f"{name} is a child of Pat").startswith("OK")
+    monkeypatch.setattr(kb, "LIST_PAGE_SIZE", 100)
+    first = kb.parse_question("Who are the children of Pat?")
+    assert first.endswith("(showing 1-100; say 'show next 100' for more)")
+    rest = kb.parse_statement("show more")
+    shown = first.split(" (")[0].split(", ") + rest.split(", ")
+    assert sorted(shown) == names
+
+def test_show_more_after_a_short_list(kb, tell):
+    tell(*(f"{name} is a child of Pat" for name in ["Ann", "Ben"]))
+    kb.parse_question("Who are the children of Pat?")
+    assert kb.parse_statement("show next 0") == "There's nothing more to show."
+
+def test_queries_stream_and_stop_early(kb, tell):
+    tell("Ann is the mother of Ben", "Ann is the mother of Cal", "Ann is the mother of Dan")
+    ann = kb.person_id("ann")
+    assert len(kb.prolog_query("parent", ann, None)) == 3
+    assert len(kb.prolog_query("parent", ann, None, limit=1)) == 1
+    ids = kb.stream_distinct_ids([("parent", ann, None), ("parent", ann, None)])
+    assert next(ids) in kb.prolog_values("parent", ann, None)
+    assert len(list(ids)) == 2
+
+def test_yes_no_goals(kb, tell):
+    tell("Ann is the mother of Ben")
+    ann, ben = kb.person_id("ann"), kb.person_id("ben")
+    assert kb.prolog_holds("parent", ann, ben) is True
+    assert kb.prolog_holds("parent", ben, ann) is False
+    assert kb.prolog_values("parent", ben, None) == set()
@@ -0,0 +1,74 @@
+import pytest
+
+def children(kb, parent):
+    return kb.parse_question(f"Who are the children of {parent}?")
+
+def test_forgetting_a_premise_forgets_what_followed(kb, tell):
+    tell("Ann and Ben are siblings", "Cat is the mother of Ann")
+    assert children(kb, "Cat") == "Ann, Ben"
+    assert kb.parse_statement("Forget that Cat is the mother of Ann") == (
+        "OK! I forgot that, and 1 fact that followed from it.")
+    assert children(kb, "Cat") == "No one found."
+    assert kb.justifications == {}
+
+def test_a_derived_fact_stated_again_is_kept(kb, tell):
+    tell("Ann and Ben are siblings", "Cat is the mother of Ann")
+    assert kb.parse_statement("Cat is the mother of Ben") == "OK! I already knew that."
+    # Ann is Ben's sibling, so Cat is still her mother through Ben
+    assert kb.parse_statement("Forget that Cat is the mother of Ann") == (
+        "OK, but it still follows from other things I know.")
+    assert children(kb, "Cat") == "Ann, Ben"
+
+def test_a_forgotten_group_parent_does_not_come_back_later(kb, tell):
+    tell("Amy and Ben are siblings", "Carl is the father of Amy", "Carl is the father of Ben")
+    # Carl is still Amy's father through Ben, and says so instead of
+    # quietly sharing him again with the next parent learned
+    assert kb.parse_statement("Forget that Carl is the father of Amy") == (
+        "OK, but it still follows from other things I know.")
+    assert children(kb, "Carl") == "Amy, Ben"
+    tell("Dan is the father of Amy")
+    assert children(kb, "Carl") == "Amy, Ben"
+    assert kb.parse_statement("Forget that Carl is the father of Ben") == (
+        "OK! I forgot that, and 1 fact that followed from it.")
+    tell("Eve is the mother of Amy")
+    assert children(kb, "Carl") == "No one found."
+    assert children(kb, "Eve") == "Amy, Ben"
+
+def test_a_group_parent_is_derived_once_per_member(kb, tell):
+    tell("Ann and Ben are siblings", "Ben and Cal are siblings", "Cal and Dee are siblings",
+         "Cat is the mother of Ann", "Cat is the mother of Ben")
+    derived = {fact: reasons for fact, reasons in kb.justifications.items() if kb.STATED not in reasons}
+    assert len(derived) == 2
+    assert all(len(reasons) == 1 for reasons in derived.values())
+
+def test_derived_fact_cannot_be_forgotten_alone(kb, tell):
+    tell("Ann and Ben are siblings", "Cat is the mother of Ann")
+    assert kb.parse_statement("Forget that Cat is the mother of Ben") == (
+        "OK, but it still follows from other things I know.")
+    assert children(kb, "Cat") == "Ann, Ben"
+
+def test_forget_unknown_and_siblings(kb, tell):
+    tell("Ann and Ben are siblings")
+    assert kb.parse_statement("Forget that Zed is the father of Eve") == kb.DIDNT_KNOW
+    assert kb.parse_statement("Ann is not the sister of Ben").startswith("Sorry, I can't forget")
+
+def test_correction_replaces_the_wrong_fact(kb, tell):
+    tell("Fred is the father of Eve")
+    assert kb.parse_statement("Actually, Dan is the father of Eve, not Fred") == (
+        "OK! I forgot that Fred is the father of Eve, and learned that Dan is.")
+    assert kb.parse_question("Who is the father of Eve?") == "Dan"
+
+def test_rejected_correction_keeps_the_old_fact(kb, tell):
+    tell("Fred is the father of Eve", "Eve is the mother of Dan")
+    assert kb.parse_statement("Actually, Dan is the father of Eve, not Fred") == "That's impossible!"
+    assert kb.parse_question("Who is the father of Eve?") == "Fred"
+
+def test_rolled_back_statement_takes_its_reasons(kb, tell):
+    tell("Ann and Ben are siblings")
+    with pytest.raises(kb.Contradiction):
+        with kb.transaction():
+            tell("Cat is the mother of Ann")
+            assert kb.justifications
+            raise kb.Contradiction()
+    assert kb.justifications == {}
+    assert children(kb, "Cat") == "No one found."
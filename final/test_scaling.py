@@ -0,0 +1,11 @@
+import check_scaling
+
+def test_work_grows_at_most_linearly(kb):
+    for relation in kb.MATERIALIZABLE:
+        kb.set_materialization(relation, "eager")
+    sizes, results = check_scaling.run_checks([40, 80, 160], window=10, pairs=10)
+    assert len(sizes) == 3
+    for operation in results[0]:
+        counts = [result[operation] for result in results]
+        assert min(counts) > 0, operation
+        assert check_scaling.growth_exponent(sizes, counts) <= 1.25, (operation, counts)
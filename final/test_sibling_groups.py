@@ -0,0 +1,31 @@
+import pytest
+
+def test_parent_reaches_the_whole_group(kb, tell):
+    tell("Ann and Ben are siblings", "Ben and Cat are siblings", "Dan is the father of Cat")
+    assert kb.parse_question("Who are the children of Dan?") == "Ann, Ben, Cat"
+    assert kb.parse_question("Who are the siblings of Ann?") == "Ben, Cat"
+
+def test_groups_merge_under_one_root(kb, tell):
+    tell("Ann and Ben are siblings", "Cat and Dan are siblings", "Ben and Dan are siblings")
+    roots = {kb.find_sibling_root(kb.person_id(name)) for name in ("ann", "ben", "cat", "dan")}
+    assert len(roots) == 1
+    assert len(kb.sibling_members[roots.pop()]) == 4
+
+def test_parents_of_merged_groups_are_shared(kb, tell):
+    tell("Ann and Ben are siblings", "Eve is the mother of Ann",
+         "Cat and Dan are siblings", "Fred is the father of Dan",
+         "Ben and Cat are siblings")
+    assert kb.parse_question("Who are the children of Eve?") == "Ann, Ben, Cat, Dan"
+    assert kb.parse_question("Who are the children of Fred?") == "Ann, Ben, Cat, Dan"
+
+def test_group_member_is_never_its_own_parent(kb, tell):
+    tell("Amy and Bo are siblings", "Pam is the mother of Amy")
+    amy, bo, pam = (kb.person_id(name) for name in ("amy", "bo", "pam"))
+    # Joined directly, past the sibling invariant: sharing must still refuse
+    with pytest.raises(kb.Contradiction):
+        with kb.transaction():
+            root = kb.join_sibling_groups(bo, pam)
+            kb.share_group_parents(root)
+    assert not kb.prolog_holds("parent", pam, pam)
+    assert kb.find_sibling_root(pam) is None
+    assert kb.parse_question("Who are the children of Pam?") == "Amy, Bo"
@@ -0,0 +1,12 @@
+def test_snapshot_answers_questions_and_refuses_statements(kb, tell, tmp_path):
+    tell("Ann is the mother of Ben", "Ben is the father of Cal")
+    path = str(tmp_path / "family.snap")
+    kb.save_snapshot(path)
+    kb.select_backend("snapshot", path)
+    try:
+        assert kb.parse_question("Who are the grandchildren of Ann?") == "Cal"
+        assert kb.parse_statement("Dan is the father of Eve") == kb.READ_ONLY_ANSWER
+        assert kb.parse_statement("Cal and Dan are siblings") == kb.READ_ONLY_ANSWER
+        assert kb.parse_question("Who are the children of Dan?") == "No one found."
+    finally:
+        kb.select_backend("columnar")
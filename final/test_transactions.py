@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+def test_rejected_statement_leaves_no_trace(kb, tell):
+    tell("Ann is the mother of Ben")
+    # The second parent would make Ben his own grandparent
+    assert kb.parse_statement("Cal and Ben are the parents of Ann") == "That's impossible!"
+    cal = kb.person_id("cal")
+    assert kb.prolog_values("parent", cal, None) == set()
+    assert kb.parse_question("Who are the parents of Ann?") == "No one found."
+
+def test_grouped_statements_are_undone_together(kb, tell):
+    with pytest.raises(RuntimeError):
+        with kb.transaction():
+            tell("Ann is the mother of Ben", "Ben is the father of Cal")
+            raise RuntimeError("stop")
+    assert kb.parse_question("Who are the grandchildren of Ann?") == "No one found."
+    assert not kb.prolog_holds("female", kb.person_id("ann"))
+
+def test_retracted_facts_come_back(kb, tell):
+    tell("Fred is the father of Eve")
+    fred, eve = kb.person_id("fred"), kb.person_id("eve")
+    with pytest.raises(kb.Contradiction):
+        with kb.transaction():
+            kb.retract_fact("parent", fred, eve)
+            assert not kb.prolog_holds("parent", fred, eve)
+            raise kb.Contradiction()
+    assert kb.prolog_holds("parent", fred, eve)
+    assert kb.violates("parent", eve, fred) == "acyclic"
+
+def test_journal_is_written_on_commit_only(kb, tell, monkeypatch):
+    journal = io.StringIO()
+    monkeypatch.setattr(kb, "journal", journal)
+    tell("Ann is the mother of Ben")
+    committed = journal.getvalue()
+    assert "assert parent 0 1" in committed
+    assert kb.parse_statement("Ben is the father of Ann") == "That's impossible!"
+    assert "parent 1 0" not in journal.getvalue()